@@ -18,7 +18,7 @@ def command(filepath: Path, edl_ext: str, config: Settings):
         if filepath.is_file() and filepath.suffix == edl_ext:
             from ..services.movie_file_processor.runner.folder.folder_runner import process_with_progress_tui
             with Progress() as progress:
-                deque(process_with_progress_tui(progress, MovieFileProcessor(filepath, config).movie_file_processor_root_step))
+                deque(process_with_progress_tui(progress, MovieFileProcessor(filepath, config), config.progress_max_rate))
                 logger.info('"%s" processed successfully', filepath)
         elif filepath.is_dir():
             from ..services.movie_file_processor.runner.folder.folder_runner import MovieFileProcessorFolderRunner
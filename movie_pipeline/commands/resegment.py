@@ -0,0 +1,45 @@
+import json
+import logging
+from pathlib import Path
+
+from ..lib.opencv.score_timeline import SCORE_TIMELINE_SUFFIX, load_score_timeline, segments_from_score_timeline
+from ..lib.util import debug
+from ..models.detected_segments import humanize_segments, merge_adjacent_segments
+from ..settings import Settings
+
+logger = logging.getLogger(__name__)
+
+
+def resegment_movie(movie_path: Path, detector_key: str, config: Settings):
+    if (timeline := load_score_timeline(movie_path)) is None:
+        logger.warning('No score timeline, skipping "%s"', movie_path)
+        return
+
+    segments = segments_from_score_timeline(
+        timeline,
+        threshold=config.SegmentDetection.match_template_threshold,
+        min_gap=config.SegmentDetection.segments_min_gap,
+        min_duration=config.SegmentDetection.segments_min_duration
+    )
+
+    segments_filepath = movie_path.with_suffix(f'{movie_path.suffix}.segments.json')
+    detectors_result = json.loads(segments_filepath.read_text(encoding='utf-8')) if segments_filepath.exists() else {}
+    detectors_result[detector_key] = humanize_segments(merge_adjacent_segments(segments))
+
+    segments_filepath.write_text(json.dumps(detectors_result, indent=2), encoding='utf-8')
+    logger.info('"%s": %s', movie_path, detectors_result[detector_key])
+
+
+@debug(logger)
+def command(filepath: Path, detector_key: str, config: Settings):
+    try:
+        if filepath.is_file():
+            resegment_movie(filepath, detector_key, config)
+        elif filepath.is_dir():
+            for timeline_path in filepath.glob(f'*{SCORE_TIMELINE_SUFFIX}'):
+                movie_path = timeline_path.with_name(timeline_path.name.removesuffix(SCORE_TIMELINE_SUFFIX))
+                resegment_movie(movie_path, detector_key, config)
+        else:
+            raise ValueError('File is not a movie')
+    except Exception as e:
+        logger.exception(e)
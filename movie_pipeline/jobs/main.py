@@ -57,3 +57,33 @@ def process_directory(config_path=default_config_path, raw_inputs: Optional[str]
         lambda params: process_directory(params, get_job_config(config_path)),
         inputs=BaseXyOpsPluginInput[DirectoryInput](**json.loads(raw_inputs))
     ).run()
+
+
+def split_movie(config_path=default_config_path, raw_inputs: Optional[str] = None):
+    from ..services.movie_file_processor.runner.xyops.xyops_runner import ChunkedFileInput, split_file
+    raw_inputs = raw_inputs or next(sys.stdin)
+
+    BaseXyOpsPlugin(
+        lambda params: split_file(params, get_job_config(config_path)),
+        inputs=BaseXyOpsPluginInput[ChunkedFileInput](**json.loads(raw_inputs))
+    ).run()
+
+
+def encode_chunk(config_path=default_config_path, raw_inputs: Optional[str] = None):
+    from ..services.movie_file_processor.runner.xyops.xyops_runner import UnitInput, encode_unit
+    raw_inputs = raw_inputs or next(sys.stdin)
+
+    BaseXyOpsPlugin(
+        lambda params: encode_unit(params, get_job_config(config_path)),
+        inputs=BaseXyOpsPluginInput[UnitInput](**json.loads(raw_inputs))
+    ).run()
+
+
+def merge_chunks(config_path=default_config_path, raw_inputs: Optional[str] = None):
+    from ..services.movie_file_processor.runner.xyops.xyops_runner import FileInput, merge_chunks
+    raw_inputs = raw_inputs or next(sys.stdin)
+
+    BaseXyOpsPlugin(
+        lambda params: merge_chunks(params, get_job_config(config_path)),
+        inputs=BaseXyOpsPluginInput[FileInput](**json.loads(raw_inputs))
+    ).run()
@@ -0,0 +1,144 @@
+import bisect
+import logging
+import queue
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from pathlib import Path
+from typing import Any, Iterator, Optional
+
+import ffmpeg
+
+from ...lib.util import position_in_seconds
+from ...models.movie_segments import MovieSegments
+from ...settings import Settings
+from .ffmpeg_cli_presets import get_ffencode_audio_params, get_ffencode_video_params
+from .ffmpeg_with_progress import ffmpeg_command_with_progress
+
+logger = logging.getLogger(__name__)
+
+Chunk = tuple[float, float]
+
+
+def plan_chunks(segments: list[tuple[float, float]], keyframes: list[float], chunk_duration: float) -> list[Chunk]:
+    """Split the segments into chunks of at least `chunk_duration` seconds, starting on a keyframe
+
+    A chunk never spans two segments, and the remaining part of a segment shorter than half a chunk
+    is merged with the previous chunk.
+
+    Args:
+        segments (list[tuple[float, float]]): kept segments, in seconds
+        keyframes (list[float]): sorted keyframes positions, in seconds
+        chunk_duration (float): minimum duration of a chunk, in seconds
+
+    Returns:
+        list[Chunk]: (start, end) of each chunk, in order
+    """
+    chunks: list[Chunk] = []
+
+    for start, end in segments:
+        chunk_start = start
+
+        while True:
+            index = bisect.bisect_left(keyframes, chunk_start + chunk_duration)
+
+            if index >= len(keyframes) or keyframes[index] > end - chunk_duration / 2:
+                chunks.append((chunk_start, end))
+                break
+
+            chunks.append((chunk_start, keyframes[index]))
+            chunk_start = keyframes[index]
+
+    return chunks
+
+
+def chunk_command(in_path: Path, chunk: Chunk, chunk_path: Path, config: Settings, threads: Optional[int] = None):
+    """Encode the video of a chunk, the audio is encoded at once to avoid gaps at the chunks edges"""
+    start, end = chunk
+    in_file = ffmpeg.input(str(in_path), ss=start, t=end - start)
+
+    return in_file.video.output(
+        str(chunk_path),
+        f='matroska',
+        avoid_negative_ts='make_zero',
+        **get_ffencode_video_params(config.ffmpeg_hwaccel, config.ffmpeg_vcodec, threads),
+        an=None, dn=None, sn=None
+    )
+
+
+def audio_command(in_path: Path, movie_segments: MovieSegments, audio_streams, audio_path: Path):
+    """Encode the audio streams of all the segments at once, to be joined with the video chunks"""
+    in_file = ffmpeg.input(str(in_path))
+
+    return (
+        ffmpeg
+        .concat(*movie_segments.to_ffmpeg_concat_segments(in_file, audio_streams, video=False), v=0, a=len(audio_streams))
+        .output(
+            str(audio_path),
+            f='matroska',
+            **get_ffencode_audio_params(),
+            **{f'map_metadata:s:a:{index}': f'0:s:a:{index}' for index in range(len(audio_streams))},
+        )
+    )
+
+
+def join_chunks_command(chunks_list_path: Path, audio_path: Path | None, dest_path: Path):
+    """Join the encoded video chunks (listed for the concat demuxer) and the encoded audio without re-encoding"""
+    video = ffmpeg.input(str(chunks_list_path), f='concat', safe=0).video
+    streams = [video, ffmpeg.input(str(audio_path)).audio] if audio_path is not None else [video]
+
+    return ffmpeg.output(*streams, str(dest_path), c='copy')
+
+
+def run_commands_with_progress(commands: list[tuple[Any, float]], workers: int, cmd: list[str]) -> Iterator[float]:
+    """Run ffmpeg commands concurrently, in a pool of `workers` threads
+
+    The remaining commands are stopped as soon as one of them fails, or when the iteration is stopped.
+
+    Args:
+        commands (list[tuple[Any, float]]): ffmpeg-python commands and their output duration, which weights their progress
+        workers (int): maximum number of ffmpeg processes running at once
+        cmd (list[str]): ffmpeg executable and global options
+
+    Yields:
+        float: processed duration of all the commands, from 0 to 1
+    """
+    total_duration = sum(duration for _, duration in commands) or 1.
+    processed_durations = [0.] * len(commands)
+    progress_queue: queue.Queue[tuple[int, float]] = queue.Queue()
+    stop_signal = threading.Event()
+
+    def run_command(index: int, command, duration: float):
+        for item in ffmpeg_command_with_progress(command, cmd=cmd, stop_signal=stop_signal):
+            if (progress_time := item.get('time')):
+                progress_queue.put((index, min(max(position_in_seconds(progress_time), 0), duration)))
+
+        if stop_signal.is_set():
+            raise InterruptedError('ffmpeg command stopped')
+
+        progress_queue.put((index, duration))
+
+    with ThreadPoolExecutor(max_workers=workers, thread_name_prefix='ffmpeg-chunk') as executor:
+        futures = [executor.submit(run_command, index, command, duration) for index, (command, duration) in enumerate(commands)]
+
+        try:
+            while not all(future.done() for future in futures) or not progress_queue.empty():
+                if any(future.done() and future.exception() is not None for future in futures):
+                    break
+
+                try:
+                    index, processed_duration = progress_queue.get(timeout=.5)
+                except queue.Empty:
+                    continue
+
+                processed_durations[index] = processed_duration
+                yield sum(processed_durations) / total_duration
+
+            for future in futures:
+                if not future.cancelled() and future.done() and (exception := future.exception()) is not None:
+                    raise exception
+
+        finally:
+            stop_signal.set()
+
+            for future in futures:
+                future.cancel()
@@ -1,3 +1,5 @@
+from typing import Optional
+
 from ...settings import HwAccel, VideoCodec
 
 
@@ -5,7 +7,24 @@ def get_ffprefixes(hw_accel: HwAccel):
     return ["-hwaccel", hw_accel] if hw_accel != 'none' else []
 
 
-def get_ffencode_video_params(hw_accel: HwAccel, vcodec: VideoCodec):
+def get_ffinput_params(hw_accel: HwAccel):
+    # same as `get_ffprefixes`, for each input of a command with several inputs
+    return {'hwaccel': hw_accel} if hw_accel != 'none' else {}
+
+
+def get_ffthreads_prefixes(threads: Optional[int]):
+    # decoding of the first input and filtergraph threads, the encoder threads are an output option
+    return ['-threads', str(threads), '-filter_threads', str(threads)] if threads is not None else []
+
+
+def get_ffencode_video_params(hw_accel: HwAccel, vcodec: VideoCodec, threads: Optional[int] = None):
+    return {
+        **_get_ffencode_video_codec_params(hw_accel, vcodec),
+        **({'threads': threads} if threads is not None else {})
+    }
+
+
+def _get_ffencode_video_codec_params(hw_accel: HwAccel, vcodec: VideoCodec):
     match (vcodec, hw_accel):
         case ('h264', 'cuda'):
             return {'vcodec': 'h264_nvenc', 'preset:v': 'p7', 'tune:v': 'hq', 'rc:v': 'vbr', 'cq:v': 28, 'profile:v': 'high'}
@@ -1,20 +1,28 @@
 import logging
 import math
 import multiprocessing
-import re
+import tempfile
+from abc import abstractmethod
 from itertools import pairwise
 from pathlib import Path
-from typing import Any, Generator, Literal, Optional, cast
+from typing import Generator, Literal, Optional, cast
 
 import ffmpeg
-from deffcode import Sourcer
 
-from ...lib.ffmpeg.ffmpeg_cli_presets import get_ffprefixes
+from ...lib.ffmpeg.ffmpeg_cli_presets import get_ffprefixes, get_ffthreads_prefixes
+from ...lib.media_probe import probe_media
+from ...lib.resource_tokens import job_threads
 from ...lib.util import position_in_seconds
 from ...models.detected_segments import DetectedSegment
-from ...services.segments_detector.core import BaseDetect
+from ...services.segments_detector.core import BaseDetect, SharedDecodeDetect, probe_sample_windows, sample_window_duration
 from ...settings import Settings
-from .ffmpeg_with_progress import FFmpegLineContainer, FFmpegLineFilter, ffmpeg_command_with_progress
+from .ffmpeg_with_progress import (
+    FFmpegMetadataBlock,
+    FFmpegMetadataContainer,
+    FFmpegMetadataReader,
+    ffmpeg_command_with_progress,
+    log_sampling_density
+)
 
 logger = logging.getLogger(__name__)
 
@@ -22,30 +30,41 @@ logger = logging.getLogger(__name__)
 class BaseFFmpegFilterDetect(BaseDetect):
     detect_filter: str
     media: Literal['audio', 'video']
-    filter_pattern = re.compile('')
     args = {}
 
     def __init__(self, movie_path: Path, config: Settings) -> None:
-        self.line_container = FFmpegLineContainer()
         self._movie_path = movie_path
 
         self._segments_min_gap = config.SegmentDetection.segments_min_gap
         self._segments_min_duration = config.SegmentDetection.segments_min_duration
         self._config = config
+        self.metadata_container = self._new_metadata_container()
 
-        sourcer = Sourcer(str(movie_path), custom_ffmpeg=str(config.ffmpeg_path)).probe_stream()
-        video_metadata = cast(dict[str, Any], sourcer.retrieve_metadata())
-        self._duration: float = video_metadata['source_duration_sec']
-        self._nframes: int = video_metadata['approx_video_nframes']
-        self._framerate: float = video_metadata['source_video_framerate']
+        media_probe = probe_media(movie_path, config)
+        self._duration = media_probe.duration
+        self._nframes = media_probe.nframes
+        self._framerate = media_probe.framerate
 
-    def _map_out(self, output: list[str], no_post_processing=False) -> list[DetectedSegment]:
-        raw_segments = [
-            DetectedSegment(**{key.split('_')[1]: float(value) for key, value in self.filter_pattern.findall(line)})
-            for line in output or []
-        ]
+    @property
+    def seekable(self):
+        # the seek options only apply to the first input, audio detectors may open several ones
+        return self.media == 'video'
+
+    @property
+    def metadata_filter(self):
+        return 'metadata' if self.media == 'video' else 'ametadata'
+
+    @abstractmethod
+    def _raw_segments(self, blocks: list[FFmpegMetadataBlock]) -> list[DetectedSegment]:
+        """Segments of the metadata blocks, before the cleaning of `post_process_segments`"""
+
+    def _map_out(self, blocks: list[FFmpegMetadataBlock], no_post_processing=False) -> list[DetectedSegment]:
+        raw_segments = self._raw_segments(blocks)
+
+        return raw_segments if no_post_processing else self.post_process_segments(raw_segments)
 
-        if no_post_processing or len(raw_segments) < 2:
+    def post_process_segments(self, raw_segments: list[DetectedSegment]) -> list[DetectedSegment]:
+        if len(raw_segments) < 2:
             return raw_segments
 
         pairs = list(pairwise(segment for segment in raw_segments if segment['duration'] > self._segments_min_duration))
@@ -61,15 +80,20 @@ class BaseFFmpegFilterDetect(BaseDetect):
 
         return segments
 
-    def _build_command(self, in_file_path: Path, target_fps: float):
-        in_file = ffmpeg.input(str(in_file_path))
+    def _build_command(self, in_file_path: Path, target_fps: float, metadata_path: Path):
+        keyframes_only = self.media == 'video' and self._config.SegmentDetection.keyframes_only
+        in_file = ffmpeg.input(str(in_file_path), **({'skip_frame': 'nokey'} if keyframes_only else {}))
 
         command = getattr(in_file, self.media)
 
-        if self.media == 'video':
+        if self.media == 'video' and not keyframes_only:
             command = command.filter_('fps', target_fps)
 
-        command = command.filter_(self.detect_filter, **self.args)
+        command = (
+            command
+            .filter_(self.detect_filter, **self.args)
+            .filter_(self.metadata_filter, mode='print', file=metadata_path.as_posix())
+        )
 
         return command.output('-', format='null')
 
@@ -81,20 +105,24 @@ class BaseFFmpegFilterDetect(BaseDetect):
 
         target_nframes = 10
         proceed_thresold = 0.55
-        all_segments: list[DetectedSegment] = []
+        all_segments = probe_sample_windows(
+            self,
+            self._nframes,
+            self._framerate,
+            target_nframes,
+            max_workers=self._config.SegmentDetection.sample_probe_workers,
+            window_duration=sample_window_duration(self._movie_path, self._duration, self._config)
+        )
 
-        for frame_position in range(0, self._nframes, self._nframes // target_nframes):
-            position = frame_position / self._framerate
-            detector = self.__class__(self._movie_path, self._config)
-            detect_progress = detector.detect_with_progress(seek_ss=position, seek_t=1, no_post_processing=True)
+        return len(all_segments) > proceed_thresold * target_nframes
 
-            try:
-                while True:
-                    next(detect_progress)
-            except StopIteration as e:
-                [all_segments.append(segment) for index, segment in enumerate(e.value) if index < 1]
+    def copy_for_probe(self) -> 'BaseFFmpegFilterDetect':
+        detector = cast(BaseFFmpegFilterDetect, super().copy_for_probe())
+        detector.metadata_container = detector._new_metadata_container()
+        return detector
 
-        return len(all_segments) > proceed_thresold * target_nframes
+    def _new_metadata_container(self) -> FFmpegMetadataContainer:
+        return FFmpegMetadataContainer()
 
     def detect_with_progress(
         self,
@@ -103,55 +131,61 @@ class BaseFFmpegFilterDetect(BaseDetect):
         seek_t: Optional[str | float] = None,
         no_post_processing=False
     ) -> Generator[float, None, list[DetectedSegment]]:
-        command = self._build_command(self._movie_path, target_fps)
+        with tempfile.TemporaryDirectory(prefix='movie_pipeline_') as metadata_dir:
+            metadata_path = Path(metadata_dir) / 'metadata.txt'
+            command = self._build_command(self._movie_path, target_fps, metadata_path)
 
-        cmd = [
-            'ffmpeg',
-            *get_ffprefixes(self._config.ffmpeg_hwaccel),
-            *(['-ss', str(seek_ss)] if seek_ss is not None else []),
-            *(['-t', str(seek_t)] if seek_t is not None else [])
-        ]
+            cmd = [
+                'ffmpeg',
+                *get_ffthreads_prefixes(job_threads(self._config)),
+                *get_ffprefixes(self._config.ffmpeg_hwaccel),
+                *(['-ss', str(seek_ss)] if seek_ss is not None else []),
+                *(['-t', str(seek_t)] if seek_t is not None else [])
+            ]
 
-        if not no_post_processing:
-            logger.info('Running: %s with %s', command.compile(), cmd)
+            if not no_post_processing:
+                logger.info('Running: %s with %s', command.compile(), cmd)
 
-        detection_result = []
+            detection_result = []
 
-        stop_signal = multiprocessing.Event()
+            stop_signal = multiprocessing.Event()
 
-        process = ffmpeg_command_with_progress(
-            command,
-            cmd=cmd,
-            keep_log=True,
-            line_filter=FFmpegLineFilter(self.filter_pattern),
-            line_container=self.line_container,
-            stop_signal=stop_signal
-        )
+            process = ffmpeg_command_with_progress(
+                command,
+                cmd=cmd,
+                stop_signal=stop_signal,
+                metadata_reader=FFmpegMetadataReader(metadata_path, self.metadata_container)
+            )
 
-        try:
-            while True:
-                try:
-                    if (item := next(process)).get('time'):
-                        processed_time = position_in_seconds(item['time'])
-                        yield processed_time / self._duration
-                except KeyboardInterrupt:
-                    stop_signal.set()
+            processed_frames, processed_time = 0, 0.
 
-        except StopIteration as e:
-            detection_result = self._map_out(e.value, no_post_processing)
-            logger.info(detection_result)
-            return detection_result
+            try:
+                while True:
+                    try:
+                        if (progress_time := (item := next(process)).get('time')):
+                            processed_frames = int(item.get('frame', processed_frames))
+                            processed_time = max(position_in_seconds(progress_time), 0)
+                            yield processed_time / self._duration
+                    except KeyboardInterrupt:
+                        stop_signal.set()
+
+            except StopIteration:
+                if self.media == 'video' and self._config.SegmentDetection.keyframes_only:
+                    log_sampling_density(processed_frames, processed_time)
+
+                detection_result = self._map_out(self.metadata_container.blocks, no_post_processing)
+                logger.info(detection_result)
+                return detection_result
 
 
 class AudioCrossCorrelationDetect(BaseFFmpegFilterDetect):
     detect_filter = 'axcorrelate'
     media = 'audio'
-    filter_pattern = re.compile(r'(silence_start|silence_end|silence_duration)\s*\:\s*(\S+)')
 
-    def _build_command(self, in_file_path: Path, _):
+    def _build_command(self, in_file_path: Path, _, metadata_path: Path):
         audio_tracks = [
             index
-            for index, stream in enumerate(ffmpeg.probe(in_file_path, select_streams='a')['streams'])
+            for index, stream in enumerate(probe_media(in_file_path, self._config).audio_streams)
             if sum(stream['disposition'][field] for field in ('visual_impaired', 'descriptions')) < 1
         ]
 
@@ -164,22 +198,35 @@ class AudioCrossCorrelationDetect(BaseFFmpegFilterDetect):
             ffmpeg
             .filter_(in_files, 'axcorrelate')
             .filter_('silencedetect', noise='0dB', duration=2)
+            .filter_(self.metadata_filter, mode='print', file=metadata_path.as_posix())
             .output('-', f='null')
         )
 
-    def _map_out(self, output: list[str], no_post_processing=False):
-        grouped_output = zip(*[iter(output)]*2)
-        flattened_ouput = [f'{start} {end}' for start, end in grouped_output]
-        return super()._map_out(flattened_ouput, no_post_processing)
+    def _raw_segments(self, blocks: list[FFmpegMetadataBlock]) -> list[DetectedSegment]:
+        # silencedetect sets the start on the first silent frame, the end and duration on the first frame after
+        raw_segments: list[DetectedSegment] = []
+        start = None
+
+        for block in blocks:
+            if 'lavfi.silence_start' in block:
+                start = float(block['lavfi.silence_start'])
+            elif 'lavfi.silence_end' in block and start is not None:
+                raw_segments.append(DetectedSegment(
+                    start=start,
+                    end=float(block['lavfi.silence_end']),
+                    duration=float(block['lavfi.silence_duration'])
+                ))
+                start = None
 
+        return raw_segments
 
-class FFmpegCropSegmentMergerContainer(FFmpegLineContainer):
+
+class FFmpegCropSegmentMergerContainer(FFmpegMetadataContainer):
     # see https://fr.wikipedia.org/wiki/Format_d'image
     whitelisted_ratios = [1.33, 1.37, 1.56, 1.66, 1.85, 2., 2.20, 2.35, 2.39, 2.55, 2.76]
 
-    def __init__(self, filter_pattern, config: Settings) -> None:
+    def __init__(self, config: Settings) -> None:
         super().__init__()
-        self._filter_pattern = filter_pattern
         self._found_ratios: set[float] = set()
 
         self._segments_min_gap = config.SegmentDetection.segments_min_gap
@@ -191,10 +238,15 @@ class FFmpegCropSegmentMergerContainer(FFmpegLineContainer):
     def segments(self):
         return [segment for segment in self._segments if segment['duration'] > self._segments_min_duration]
 
-    def append(self, line: str):
-        mapped_line = dict(self._filter_pattern.findall(line))
-        position = float(mapped_line['t'])
-        ratio = float(mapped_line['w']) / (float(mapped_line['h']) or 1)
+    def append(self, block: FFmpegMetadataBlock):
+        self.append_crop(
+            position=float(block['pts_time']),
+            width=float(block['lavfi.cropdetect.w']),
+            height=float(block['lavfi.cropdetect.h'])
+        )
+
+    def append_crop(self, position: float, width: float, height: float):
+        ratio = width / (height or 1)
 
         self._found_ratios.add(ratio)
 
@@ -210,16 +262,42 @@ class FFmpegCropSegmentMergerContainer(FFmpegLineContainer):
             last_segment['duration'] = round(position - last_segment['start'], 2)
 
 
-class CropDetect(BaseFFmpegFilterDetect):
+class CropDetect(BaseFFmpegFilterDetect, SharedDecodeDetect):
     detect_filter = 'cropdetect'
     media = 'video'
-    filter_pattern = re.compile(r' (x1|x2|y1|y2|w|h|x|y|pts|t)\s*\:\s*(\S+)')
     args = {'reset_count': 3} # cf https://ffmpeg.org/ffmpeg-filters.html#toc-cropdetect
 
-    def __init__(self, movie_path: Path, config: Settings) -> None:
-        super().__init__(movie_path, config)
-        self.line_container = FFmpegCropSegmentMergerContainer(self.filter_pattern, config)
-
-    def _map_out(self, output: list[str], no_post_processing=False) -> list[DetectedSegment]:
-        logger.info(f'found_ratios: {sorted(self.line_container._found_ratios)}')
-        return self.line_container.segments if not no_post_processing else self.line_container._segments
+    @property
+    def shared_video_filter(self):
+        # filter options escaping: the metadata file path may contain ':' (windows drive)
+        metadata_file = self._shared_metadata_path.as_posix().replace(':', '\\:')
+
+        return ','.join([
+            f"{self.detect_filter}={':'.join(f'{key}={value}' for key, value in self.args.items())}",
+            f'{self.metadata_filter}=mode=print:file={metadata_file}'
+        ])
+
+    def _new_metadata_container(self) -> FFmpegCropSegmentMergerContainer:
+        return FFmpegCropSegmentMergerContainer(self._config)
+
+    def _raw_segments(self, blocks: list[FFmpegMetadataBlock]) -> list[DetectedSegment]:
+        # the segments are merged by the container while the metadata is read
+        container = cast(FFmpegCropSegmentMergerContainer, self.metadata_container)
+        logger.info(f'found_ratios: {sorted(container._found_ratios)}')
+        return container._segments
+
+    def post_process_segments(self, raw_segments: list[DetectedSegment]) -> list[DetectedSegment]:
+        return [segment for segment in raw_segments if segment['duration'] > self._segments_min_duration]
+
+    def begin_shared_decode(self) -> None:
+        self.metadata_container = self._new_metadata_container()
+        self._shared_metadata_dir = tempfile.TemporaryDirectory(prefix='movie_pipeline_')
+        self._shared_metadata_path = Path(self._shared_metadata_dir.name) / 'metadata.txt'
+
+    def end_shared_decode(self) -> list[DetectedSegment]:
+        FFmpegMetadataReader(self._shared_metadata_path, self.metadata_container).close()
+        self._shared_metadata_dir.cleanup()
+
+        detection_result = self._map_out(self.metadata_container.blocks)
+        logger.info(detection_result)
+        return detection_result
@@ -0,0 +1,33 @@
+from dataclasses import dataclass, field
+from pathlib import Path
+from typing import Any
+
+from ffmpeg._utils import convert_kwargs_to_cmd_line_args
+
+
+@dataclass(frozen=True)
+class FFmpegFilterScriptCommand:
+    """ffmpeg command reading its filtergraph from `-filter_complex_script`, compiled like an ffmpeg-python output
+
+    The filtergraph is written to `script_path`, so that its size does not matter for the command line.
+    """
+    in_path: Path
+    filtergraph: str
+    output_labels: list[str]
+    script_path: Path
+    dest_path: Path
+    output_kwargs: dict[str, Any] = field(default_factory=dict)
+
+    def get_args(self) -> list[str]:
+        self.script_path.write_text(self.filtergraph, encoding='utf-8')
+
+        return [
+            '-i', str(self.in_path),
+            '-filter_complex_script', str(self.script_path),
+            *(arg for label in self.output_labels for arg in ('-map', f'[{label}]')),
+            *convert_kwargs_to_cmd_line_args(self.output_kwargs),
+            str(self.dest_path)
+        ]
+
+    def compile(self, cmd: str | list[str] = 'ffmpeg') -> list[str]:
+        return [*([cmd] if isinstance(cmd, str) else cmd), *self.get_args()]
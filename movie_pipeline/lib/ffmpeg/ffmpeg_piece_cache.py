@@ -0,0 +1,118 @@
+import hashlib
+import json
+import logging
+import os
+import socket
+import threading
+import time
+from pathlib import Path
+from typing import Any, Optional
+
+import ffmpeg
+
+logger = logging.getLogger(__name__)
+
+PIECE_SUFFIX = '.mkv'
+
+
+class PieceCache:
+    """Encoded pieces of movies, addressed by their input and encoder parameters
+
+    The least recently used pieces are deleted once the cache exceeds its disk budget.
+    Pieces used in the last `grace_period` seconds are kept, since another worker may be joining them.
+    """
+
+    def __init__(self, path: Path, max_size: int, grace_period: float = 3600.) -> None:
+        self._path = path
+        self._max_size = max_size
+        self._grace_period = grace_period
+        self._lock = threading.Lock()
+
+    @staticmethod
+    def key(in_path: Path, start: float, end: float, encoder_params: dict[str, Any]) -> str:
+        """Identify a piece by its input file (name, size and modification time), position and encoder parameters"""
+        stat = in_path.stat()
+        identity = {
+            'input': [in_path.name, stat.st_size, stat.st_mtime_ns],
+            'segment': [round(start, 3), round(end, 3)],
+            'encoder': encoder_params
+        }
+
+        return hashlib.sha256(json.dumps(identity, sort_keys=True, default=str).encode('utf-8')).hexdigest()
+
+    def piece_path(self, key: str) -> Path:
+        return self._path / f'{key}{PIECE_SUFFIX}'
+
+    def partial_path(self, key: str) -> Path:
+        """Path where the current writer encodes the piece before its `commit`
+
+        Unique by host, process and thread, the workers encoding the same piece do not write the same file.
+        """
+        # not matched by the eviction, nor by another worker looking for the piece
+        writer = f'{socket.gethostname()}-{os.getpid()}-{threading.get_ident()}'
+        return self._path / f'{key}.{writer}.partial{PIECE_SUFFIX}.tmp'
+
+    def get(self, key: str) -> Optional[Path]:
+        """Return the piece if it is cached, marking it as recently used"""
+        piece_path = self.piece_path(key)
+
+        try:
+            os.utime(piece_path)
+        except FileNotFoundError:
+            return None
+
+        return piece_path
+
+    def commit(self, key: str) -> Path:
+        """Publish the piece written to `partial_path`, replacing the same piece committed by another writer"""
+        piece_path = self.piece_path(key)
+        self.partial_path(key).replace(piece_path)
+
+        return piece_path
+
+    def evict(self):
+        """Delete the least recently used pieces until the cache fits in its budget"""
+        with self._lock:
+            pieces = []
+
+            for piece_path in self._path.glob(f'*{PIECE_SUFFIX}'):
+                try:
+                    stat = piece_path.stat()
+                except FileNotFoundError:
+                    continue
+
+                pieces.append((stat.st_mtime, stat.st_size, piece_path))
+
+            cache_size = sum(size for _, size, _ in pieces)
+            recently_used_time = time.time() - self._grace_period
+
+            for last_used_time, size, piece_path in sorted(pieces):
+                if cache_size <= self._max_size or last_used_time >= recently_used_time:
+                    break
+
+                logger.info('Evicting "%s" from the pieces cache', piece_path)
+                piece_path.unlink(missing_ok=True)
+                cache_size -= size
+
+
+def segment_piece_command(
+    in_path: Path,
+    segment: tuple[float, float],
+    piece_path: Path,
+    output_kwargs: dict[str, Any],
+    **input_kwargs
+):
+    """Encode the video of one segment, opened with input seeking, into a piece to be joined with the concat demuxer
+
+    The audio is not cached, it is encoded over all the segments at once: the AAC priming of each piece
+    would leave gaps at the joins.
+    """
+    start, end = segment
+    in_file = ffmpeg.input(str(in_path), ss=start, t=end - start, **input_kwargs)
+
+    return in_file.video.filter_('trim', duration=end - start).filter_('setpts', 'PTS-STARTPTS').output(
+        str(piece_path),
+        f='matroska',
+        **output_kwargs,
+        an=None, dn=None, sn=None
+    )
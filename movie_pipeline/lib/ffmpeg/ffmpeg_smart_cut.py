@@ -0,0 +1,187 @@
+import bisect
+import logging
+from dataclasses import dataclass
+from pathlib import Path
+from typing import Any
+
+import ffmpeg
+
+from ...lib.media_probe import MediaProbe
+from ...lib.resource_tokens import job_threads
+from ...settings import Settings
+from .ffmpeg_cli_presets import get_ffencode_video_params
+
+logger = logging.getLogger(__name__)
+
+# keyframes are searched up to this duration inside each segment, from its start and from its end
+KEYFRAME_SEARCH_WINDOW = 30.
+# field orders of interlaced streams, the re-encoded pieces would be progressive
+INTERLACED_FIELD_ORDERS = {'tt', 'bb', 'tb', 'bt'}
+# encoder profile producing each source profile (as reported by ffprobe)
+ENCODER_PROFILES: dict[str, dict[str, str]] = {
+    'h264': {'Constrained Baseline': 'baseline', 'Main': 'main', 'High': 'high'},
+    'hevc': {'Main': 'main', 'Main 10': 'main10'},
+}
+# the decoder keeps these parameters from one piece to the next, the re-encoded edges must have the ones of the copied GOPs
+SOURCE_STREAM_PARAMETERS = ('profile', 'level', 'pix_fmt', 'width', 'height', 'sample_aspect_ratio')
+
+
+@dataclass(frozen=True)
+class CutPiece:
+    start: float
+    end: float
+    # stream copy from a keyframe, otherwise re-encoded
+    copy: bool
+
+    @property
+    def duration(self) -> float:
+        return self.end - self.start
+
+
+def can_smart_cut(media_probe: MediaProbe, config: Settings) -> bool:
+    """Tell if the copied GOPs of the source can be joined with pieces encoded with `config` encoder"""
+    video_stream = media_probe.video_stream
+
+    if video_stream.get('codec_name') != config.ffmpeg_vcodec:
+        logger.info('Cannot smart cut %s video with a %s encoder', video_stream.get('codec_name'), config.ffmpeg_vcodec)
+        return False
+
+    if video_stream.get('field_order') in INTERLACED_FIELD_ORDERS:
+        logger.info('Cannot smart cut interlaced video')
+        return False
+
+    # the software encoders can repeat the stream headers before each keyframe
+    if config.ffmpeg_hwaccel != 'none':
+        logger.info('Cannot smart cut with the %s encoder', config.ffmpeg_hwaccel)
+        return False
+
+    if video_stream.get('profile') not in ENCODER_PROFILES[config.ffmpeg_vcodec]:
+        logger.info('Cannot smart cut %s video of %s profile', video_stream.get('codec_name'), video_stream.get('profile'))
+        return False
+
+    if video_stream.get('level', 0) <= 0 or 'pix_fmt' not in video_stream:
+        logger.info('Cannot smart cut video of unknown level or pixel format')
+        return False
+
+    return True
+
+
+def edge_video_params(media_probe: MediaProbe, config: Settings) -> dict[str, Any]:
+    """Encoder options of the re-encoded edges: the stream parameters of the source, and its headers before each keyframe"""
+    video_stream = media_probe.video_stream
+    level = video_stream['level']
+    video_params = {
+        **get_ffencode_video_params(config.ffmpeg_hwaccel, config.ffmpeg_vcodec, job_threads(config)),
+        'profile:v': ENCODER_PROFILES[config.ffmpeg_vcodec][video_stream['profile']],
+        'pix_fmt': video_stream['pix_fmt']
+    }
+
+    match config.ffmpeg_vcodec:
+        case 'h264':
+            return {**video_params, 'level:v': f'{level / 10:g}', 'x264-params': 'repeat-headers=1'}
+        case 'hevc':
+            # the HEVC level_idc is 30 times the level number
+            return {**video_params, 'x265-params': f'repeat-headers=1:level-idc={level / 30:g}'}
+
+
+def edge_piece_mismatches(piece_probe: MediaProbe, media_probe: MediaProbe) -> dict[str, tuple[Any, Any]]:
+    """Stream parameters of a re-encoded piece which differ from the source, by name: (source value, piece value)"""
+    return {
+        name: (media_probe.video_stream.get(name), piece_probe.video_stream.get(name))
+        for name in SOURCE_STREAM_PARAMETERS
+        if media_probe.video_stream.get(name) != piece_probe.video_stream.get(name)
+    }
+
+
+def keyframes_search_intervals(segments: list[tuple[float, float]], min_duration: float) -> list[tuple[float, float]]:
+    """Intervals near each segment edge where its first and last keyframes are searched
+
+    They cover the range searched by `plan_smart_cut` with the same `min_duration`, which starts a bit
+    before the segment and ends a bit after it.
+    """
+    return [
+        interval
+        for start, end in segments
+        for interval in (
+            (max(start - min_duration, 0), start + KEYFRAME_SEARCH_WINDOW),
+            (max(end - KEYFRAME_SEARCH_WINDOW, 0), end + min_duration)
+        )
+    ]
+
+
+def plan_smart_cut(segments: list[tuple[float, float]], keyframes: list[float], min_duration: float) -> list[CutPiece]:
+    """Split each segment into a copied part between its first and last keyframes, and re-encoded edges
+
+    Args:
+        segments (list[tuple[float, float]]): kept segments, in seconds
+        keyframes (list[float]): sorted keyframes positions, in seconds
+        min_duration (float): shorter edges are not re-encoded, the copy starts or ends at the keyframe instead,
+            usually one frame to absorb the rounding of the segments positions
+
+    Returns:
+        list[CutPiece]: pieces to join, in order
+    """
+    pieces: list[CutPiece] = []
+
+    for start, end in segments:
+        first_index = bisect.bisect_left(keyframes, start - min_duration)
+        last_index = bisect.bisect_right(keyframes, end + min_duration) - 1
+
+        # no complete GOP in the segment
+        if last_index - first_index < 1:
+            pieces.append(CutPiece(start, end, copy=False))
+            continue
+
+        first_keyframe, last_keyframe = keyframes[first_index], keyframes[last_index]
+
+        if first_keyframe - start >= min_duration:
+            pieces.append(CutPiece(start, first_keyframe, copy=False))
+
+        pieces.append(CutPiece(first_keyframe, last_keyframe, copy=True))
+
+        if end - last_keyframe >= min_duration:
+            pieces.append(CutPiece(last_keyframe, end, copy=False))
+
+    return pieces
+
+
+def cut_piece_command(
+    in_path: Path,
+    piece: CutPiece,
+    piece_path: Path,
+    media_probe: MediaProbe,
+    config: Settings
+):
+    """Cut the video of a piece to MPEG-TS, the audio of all the segments is encoded at once
+
+    The pieces are Annex B streams with their parameter sets in-band, the concat demuxer only keeps
+    the extradata of the first piece.
+    """
+    if piece.copy:
+        # the input seeking of a stream copy starts at the keyframe before the position, and the copy keeps
+        # the packets up to the end position: half a frame after the first keyframe and half a frame before
+        # the last one are not affected by the rounding of their positions, the last keyframe starts the next piece
+        half_frame = .5 / media_probe.framerate
+        in_file = ffmpeg.input(str(in_path), ss=piece.start + half_frame, to=piece.end - half_frame)
+        video_params: dict[str, Any] = {'vcodec': 'copy', 'bsf:v': f'{config.ffmpeg_vcodec}_mp4toannexb,dump_extra'}
+    else:
+        in_file = ffmpeg.input(str(in_path), ss=piece.start, t=piece.duration)
+        video_params = edge_video_params(media_probe, config)
+
+    return in_file.video.output(
+        str(piece_path),
+        f='mpegts',
+        avoid_negative_ts='make_zero',
+        **video_params,
+        an=None, dn=None, sn=None
+    )
+
+
+def _quote_concat_path(path: Path) -> str:
+    # cf https://ffmpeg.org/ffmpeg-utils.html#Quoting-and-escaping
+    return "'" + path.as_posix().replace("'", "'\\''") + "'"
+
+
+def write_concat_list(paths: list[Path], list_path: Path):
+    """Write the input file of the concat demuxer"""
+    list_path.write_text(''.join(f'file {_quote_concat_path(path)}\n' for path in paths), encoding='utf-8')
@@ -1,25 +1,34 @@
+import asyncio
+import io
 import json
 import logging
+import queue
 import re
 import subprocess
+import threading
 from collections import deque
 from multiprocessing import Event
 from pathlib import Path
-from typing import IO, TypedDict, cast
+from typing import IO, AsyncGenerator, Callable, Optional, Protocol, TypedDict, cast
 
 import ffmpeg
+import numpy as np
 
-from ...lib.ffmpeg.ffmpeg_cli_presets import get_ffprefixes
+from ...lib.ffmpeg.ffmpeg_cli_presets import get_ffprefixes, get_ffthreads_prefixes
+from ...lib.resource_tokens import job_threads
 from ...settings import Settings
 
 logger = logging.getLogger(__name__)
 
-# reference: https://github.com/jonghwanhyeon/python-ffmpeg/blob/main/ffmpeg/utils.py#L12-L14
-progress_pattern = re.compile(r'(frame|fps|size|time|bitrate|speed)\s*\=\s*(\S+)')
 match_all_pattern = re.compile('')
+showinfo_pattern = re.compile(r'Parsed_showinfo_\d+')
+showinfo_pts_time_pattern = re.compile(r'pts_time:\s*(\S+)')
 
+# keys of the `-progress` blocks, cf https://ffmpeg.org/ffmpeg.html#Advanced-options
+progress_keys = {'frame': 'frame', 'fps': 'fps', 'total_size': 'size', 'out_time': 'time', 'speed': 'speed'}
 
-class ProgressItem(TypedDict):
+
+class ProgressItem(TypedDict, total=False):
     frame: str
     fps: str
     size: str
@@ -27,6 +36,13 @@ class ProgressItem(TypedDict):
     speed: str
 
 
+class StopSignal(Protocol):
+    """threading or multiprocessing Event, only set from outside and polled by the progress loop"""
+    def set(self) -> None: ...
+
+    def is_set(self) -> bool: ...
+
+
 class FFmpegLineFilter:
     def __init__(self, filter_pattern = match_all_pattern) -> None:
         self._filter_pattern = filter_pattern
@@ -48,48 +64,194 @@ class FFmpegLineContainer:
         self._lines.append(line)
 
 
-def ffmpeg_command_with_progress(
+FFmpegMetadataBlock = dict[str, str]
+
+
+class FFmpegMetadataContainer:
+    def __init__(self) -> None:
+        self._blocks: list[FFmpegMetadataBlock] = []
+
+    @property
+    def blocks(self) -> list[FFmpegMetadataBlock]:
+        return self._blocks
+
+    def append(self, block: FFmpegMetadataBlock):
+        self._blocks.append(block)
+
+
+class FFmpegMetadataReader:
+    """Follow the file written by a `metadata=mode=print:file=...` (or `ametadata`) filter while ffmpeg is running
+
+    Each frame starts a block with a `frame:0 pts:0 pts_time:0` header, followed by one `key=value` line
+    per metadata. A block is given to the container once the next one starts (or on `close`), when it is complete.
+    """
+
+    def __init__(self, metadata_path: Path, container: FFmpegMetadataContainer) -> None:
+        self._metadata_path = metadata_path
+        self._container = container
+        self._file: Optional[IO[str]] = None
+        self._partial_line = ''
+        self._block: Optional[FFmpegMetadataBlock] = None
+
+    def read_available(self):
+        if self._file is None:
+            if not self._metadata_path.exists():
+                return
+
+            self._file = self._metadata_path.open(encoding='utf-8', errors='replace')
+
+        # the last line is kept until ffmpeg finishes writing it
+        *lines, self._partial_line = (self._partial_line + self._file.read()).split('\n')
+
+        for line in lines:
+            if line.startswith('frame:'):
+                if self._block is not None:
+                    self._container.append(self._block)
+
+                self._block = dict(field.split(':', maxsplit=1) for field in line.split())
+            elif self._block is not None and '=' in line:
+                key, value = line.split('=', maxsplit=1)
+                self._block[key] = value
+
+    def close(self):
+        self.read_available()
+
+        if self._block is not None:
+            self._container.append(self._block)
+            self._block = None
+
+        if self._file is not None:
+            self._file.close()
+
+
+async def async_ffmpeg_command_with_progress(
     command, cmd=['ffmpeg'],
     keep_log=False,
     line_filter=FFmpegLineFilter(),
     line_container=FFmpegLineContainer(),
-    stop_signal=Event(),
+    metadata_reader: Optional[FFmpegMetadataReader] = None,
+    timeout: Optional[float] = None,
     **kwargs
-):
-    with subprocess.Popen(command.compile(cmd=cmd), **kwargs, text=True, stderr=subprocess.PIPE) as process:
-        last_lines: deque[str] = deque([], 50)
+) -> AsyncGenerator[ProgressItem, None]:
+    """Run an ffmpeg command and yield its progress, read from the `-progress` key=value blocks on stdout
 
-        for line in cast(IO[str], process.stderr):
-            last_lines.append(line)
+    stdout and stderr are read by the event loop, so that one loop can follow many ffmpeg processes.
+    Cancelling the task iterating the progress, or closing the iterator, terminates ffmpeg.
+    stderr is only kept for the error message, and in `line_container` if `keep_log` is set.
+    If a `metadata_reader` is given, the metadata file is read after each progress block.
 
-            try:
-                if (retcode := process.poll()) is not None:
-                    if retcode != 0:
-                        last_lines.extend(cast(IO[str], process.stderr))
-                        raise ffmpeg.Error('ffmpeg', None, '\n'.join(last_lines))
-                    break
+    Args:
+        command: ffmpeg-python command to run
+        cmd (list[str], optional): ffmpeg executable and global options. Defaults to ['ffmpeg'].
+        keep_log (bool, optional): keep the stderr lines matching `line_filter` in `line_container`. Defaults to False.
+        metadata_reader (Optional[FFmpegMetadataReader], optional): metadata file written by the command. Defaults to None.
+        timeout (Optional[float], optional): maximum duration of the command in seconds. Defaults to None.
 
-                if stop_signal.is_set():
-                    logger.info('Killing')
-                    raise InterruptedError
+    Raises:
+        ffmpeg.Error: ffmpeg failed
+        TimeoutError: ffmpeg was still running after `timeout` seconds, it is terminated
 
-                line_container.append(line) if keep_log and line_filter.filter(line) else logger.debug(line)
+    Yields:
+        ProgressItem: progress of each `-progress` block
+    """
+    def on_log_line(line: str):
+        line_container.append(line) if keep_log and line_filter.filter(line) else logger.debug(line)
 
-                if items := {key: value
-                             for key, value in progress_pattern.findall(line) if value != 'N/A'}:
-                    yield ProgressItem(**items)
+    args = command.compile(cmd=[*cmd, '-nostats', '-progress', 'pipe:1'])
+    deadline = None if timeout is None else asyncio.get_running_loop().time() + timeout
 
-            except InterruptedError as e:
-                logger.exception(e)
-                process.terminate()
+    process = await asyncio.create_subprocess_exec(*args, **kwargs, stdout=asyncio.subprocess.PIPE, stderr=asyncio.subprocess.PIPE)
+    last_lines: deque[str] = deque([], 50)
+    stderr_reader = asyncio.create_task(_async_forward_lines(cast(asyncio.StreamReader, process.stderr), last_lines, on_log_line))
 
-            except Exception as e:
-                logger.error(last_lines)
-                logger.exception(e)
-                process.terminate()
-                raise e
+    def remaining_time():
+        return None if deadline is None else max(deadline - asyncio.get_running_loop().time(), 0)
+
+    progress_block: dict[str, str] = {}
+
+    try:
+        while line := await asyncio.wait_for(cast(asyncio.StreamReader, process.stdout).readline(), remaining_time()):
+            key, _, value = line.decode('utf-8', errors='replace').strip().partition('=')
+
+            if key != 'progress':
+                progress_block[key] = value
+                continue
 
-        return line_container.lines
+            if metadata_reader is not None:
+                metadata_reader.read_available()
+
+            if items := {item_key: progress_block[key] for key, item_key in progress_keys.items() if progress_block.get(key, 'N/A') != 'N/A'}:
+                yield ProgressItem(**items)
+
+            progress_block = {}
+
+        await asyncio.wait_for(process.wait(), remaining_time())
+
+    except Exception as e:
+        logger.error(last_lines)
+        logger.exception(e)
+        raise e
+
+    finally:
+        if process.returncode is None:
+            logger.info('Killing')
+            process.terminate()
+            await process.wait()
+
+        await stderr_reader
+
+        if metadata_reader is not None:
+            metadata_reader.close()
+
+    if process.returncode != 0:
+        raise ffmpeg.Error('ffmpeg', None, ''.join(last_lines))
+
+
+def ffmpeg_command_with_progress(
+    command, cmd=['ffmpeg'],
+    keep_log=False,
+    line_filter=FFmpegLineFilter(),
+    line_container=FFmpegLineContainer(),
+    stop_signal: StopSignal = Event(),
+    metadata_reader: Optional[FFmpegMetadataReader] = None,
+    **kwargs
+):
+    """Blocking version of `async_ffmpeg_command_with_progress`, run on its own event loop
+
+    ffmpeg is terminated without error once `stop_signal` is set, or when the generator is closed.
+
+    Returns:
+        list[str]: the lines of `line_container`
+    """
+    loop = asyncio.new_event_loop()
+    progress = async_ffmpeg_command_with_progress(
+        command, cmd=cmd,
+        keep_log=keep_log,
+        line_filter=line_filter,
+        line_container=line_container,
+        metadata_reader=metadata_reader,
+        **kwargs
+    )
+
+    try:
+        while True:
+            try:
+                item = loop.run_until_complete(anext(progress))
+            except StopAsyncIteration:
+                break
+
+            if stop_signal.is_set():
+                break
+
+            yield item
+
+    finally:
+        try:
+            loop.run_until_complete(progress.aclose())
+        finally:
+            loop.close()
+
+    return line_container.lines
 
 
 def ffmpeg_frame_producer(
@@ -103,7 +265,7 @@ def ffmpeg_frame_producer(
 
     ffparams = {
         "-vcodec": None,  # skip any decoder and let FFmpeg chose
-        "-ffprefixes": get_ffprefixes(config.ffmpeg_hwaccel),
+        "-ffprefixes": [*get_ffthreads_prefixes(job_threads(config)), *get_ffprefixes(config.ffmpeg_hwaccel)],
         "-custom_resolution": "null",  # discard `-custom_resolution`
         "-framerate": "null",  # discard `-framerate`
         # define your filters
@@ -130,3 +292,163 @@ def ffmpeg_frame_producer(
 
             except KeyboardInterrupt:
                 break
+
+
+def _forward_text_lines(stream: IO[str], last_lines: deque[str], on_line: Optional[Callable[[str], None]]):
+    for line in stream:
+        last_lines.append(line)
+
+        if on_line is not None:
+            on_line(line)
+
+
+async def _async_forward_lines(stream: asyncio.StreamReader, last_lines: deque[str], on_line: Optional[Callable[[str], None]]):
+    while line := await stream.readline():
+        text_line = line.decode('utf-8', errors='replace')
+        last_lines.append(text_line)
+
+        if on_line is not None:
+            on_line(text_line)
+
+
+def _forward_lines(stream: IO[bytes], last_lines: deque[str], on_line: Optional[Callable[[str], None]]):
+    _forward_text_lines(io.TextIOWrapper(stream, encoding='utf-8', errors='replace'), last_lines, on_line)
+
+
+def _read_exactly_into(stream: io.RawIOBase, buffer: memoryview) -> bool:
+    """Fill `buffer` from `stream`, return False if the stream ends before"""
+    nbytes_read = 0
+
+    while nbytes_read < len(buffer):
+        if not (nbytes := stream.readinto(buffer[nbytes_read:])):
+            return False
+
+        nbytes_read += nbytes
+
+    return True
+
+
+class _ShowinfoTimestamps:
+    """Collect the frames timestamps printed by a trailing `showinfo` filter, forward the other lines"""
+
+    def __init__(self, on_log_line: Optional[Callable[[str], None]]) -> None:
+        self._on_log_line = on_log_line
+        self._positions: queue.Queue[float] = queue.Queue()
+
+    def on_log_line(self, line: str):
+        if showinfo_pattern.search(line) is None:
+            if self._on_log_line is not None:
+                self._on_log_line(line)
+        elif (match := showinfo_pts_time_pattern.search(line)) is not None:
+            self._positions.put(float(match.group(1)))
+
+    def next_position(self, stderr_reader: threading.Thread) -> float:
+        # the frame timestamp is logged before the frame is written to stdout, it is at most in transit
+        while True:
+            try:
+                return self._positions.get(timeout=1.)
+            except queue.Empty:
+                if not stderr_reader.is_alive():
+                    raise ValueError('Missing showinfo timestamp for a decoded frame')
+
+
+def ffmpeg_rawvideo_frame_producer(
+    input: Path,
+    target_fps: float,
+    frame_size: tuple[int, int],
+    config: Settings,
+    video_filter='',
+    ffprefixes: list[str] = [],
+    on_log_line: Optional[Callable[[str], None]] = None,
+    buffer_count=1,
+    keyframes_only=False
+):
+    """Decode `input` and yield gray frames read straight from the ffmpeg rawvideo pipe.
+
+    Unlike `ffmpeg_frame_producer`, stderr is kept and forwarded line by line to `on_log_line`,
+    so that pass-through filters inserted in `video_filter` (cropdetect...) can report their
+    results from the same ffmpeg process.
+
+    The frames are read into `buffer_count` preallocated buffers used in turn: a yielded frame
+    is overwritten `buffer_count` frames later, the consumer must copy the frames it keeps.
+
+    With `keyframes_only`, the decoder skips every non key frame and `target_fps` is ignored:
+    the frames are yielded as decoded, with their position taken from their timestamp.
+
+    Args:
+        input (Path): movie to decode
+        target_fps (float): sampling rate of the yielded frames
+        frame_size (tuple[int, int]): (width, height) of the frames at the end of the filter chain
+        config (Settings): settings (ffmpeg path and hwaccel)
+        video_filter (str, optional): filters appended after the fps filter. Defaults to ''.
+        ffprefixes (list[str], optional): input options (-ss, -t...). Defaults to [].
+        on_log_line (Callable[[str], None], optional): called from a reader thread for each stderr line
+        buffer_count (int, optional): number of frames alive at the same time. Defaults to 1.
+        keyframes_only (bool, optional): decode only the key frames. Defaults to False.
+
+    Yields:
+        tuple[np.ndarray, int, float]: frame, frame position and position in seconds
+    """
+    width, height = frame_size
+    frame_buffers = np.empty((buffer_count, height, width), dtype=np.uint8)
+    frame_views = [frame_buffer.data.cast('B') for frame_buffer in frame_buffers]
+    timestamps = _ShowinfoTimestamps(on_log_line) if keyframes_only else None
+
+    cmd = [
+        str(config.ffmpeg_path), '-hide_banner', '-nostats', '-nostdin',
+        *get_ffthreads_prefixes(job_threads(config)),
+        *get_ffprefixes(config.ffmpeg_hwaccel),
+        *ffprefixes,
+        *(['-skip_frame', 'nokey'] if keyframes_only else []),
+        '-i', str(input),
+        '-vf', ','.join(filter(bool, [
+            f'fps={target_fps}' if not keyframes_only else '',
+            video_filter,
+            'showinfo' if keyframes_only else ''
+        ])),
+        *(['-fps_mode', 'passthrough'] if keyframes_only else []),
+        '-an', '-sn', '-dn',
+        '-f', 'rawvideo', '-pix_fmt', 'gray', 'pipe:1'
+    ]
+    logger.debug('Running: %s', cmd)
+
+    # unbuffered pipes: the frames are copied once, from the pipe to their buffer
+    with subprocess.Popen(cmd, stdout=subprocess.PIPE, stderr=subprocess.PIPE, bufsize=0) as process:
+        last_lines: deque[str] = deque([], 50)
+        stderr_reader = threading.Thread(
+            target=_forward_lines,
+            args=(
+                io.BufferedReader(cast(io.RawIOBase, process.stderr)),
+                last_lines,
+                timestamps.on_log_line if timestamps is not None else on_log_line
+            ),
+            daemon=True
+        )
+        stderr_reader.start()
+
+        stdout = cast(io.RawIOBase, process.stdout)
+        frame_pos = 0
+        position_in_s = 0.
+
+        try:
+            while _read_exactly_into(stdout, frame_views[frame_pos % buffer_count]):
+                frame_pos += 1
+                position_in_s = timestamps.next_position(stderr_reader) if timestamps is not None else frame_pos / target_fps
+                yield frame_buffers[(frame_pos - 1) % buffer_count], frame_pos, position_in_s
+
+        finally:
+            if process.poll() is None:
+                process.terminate()
+
+            process.wait()
+            stderr_reader.join()
+
+            if keyframes_only:
+                log_sampling_density(frame_pos, position_in_s)
+
+        if process.returncode != 0:
+            raise ffmpeg.Error('ffmpeg', None, ''.join(last_lines))
+
+
+def log_sampling_density(nframes: int, duration: float):
+    logger.info('Sampled %d frames over %.0fs (%.2f fps)', nframes, duration, duration and nframes / duration)
@@ -0,0 +1,139 @@
+import logging
+import queue
+import threading
+import time
+from dataclasses import dataclass
+from typing import Generator, TypeVar
+
+logger = logging.getLogger(__name__)
+
+T = TypeVar('T')
+
+
+@dataclass
+class FramePipelineStats:
+    frames: int = 0
+    decode_time: float = 0.
+    # reader waiting for a free slot in the queue: the consumer is the bottleneck
+    decode_blocked_time: float = 0.
+    consume_time: float = 0.
+    # consumer waiting for a frame: the decoding is the bottleneck
+    consume_starved_time: float = 0.
+
+    @property
+    def fps(self) -> float:
+        # the consumer is either working or waiting for a frame
+        return self.frames / ((self.consume_time + self.consume_starved_time) or 1.)
+
+    def log(self, name: str):
+        logger.info(
+            '%s: %d frames at %.0f fps, decode %.1fs (blocked %.1fs), consume %.1fs (starved %.1fs)',
+            name, self.frames, self.fps, self.decode_time, self.decode_blocked_time, self.consume_time, self.consume_starved_time
+        )
+
+
+@dataclass
+class _ReaderError:
+    error: BaseException
+
+
+class _EndOfFrames:
+    pass
+
+
+_end_of_frames = _EndOfFrames()
+
+
+def measure_frames(frames: Generator[T, None, None], stats: FramePipelineStats) -> Generator[T, None, None]:
+    """Iterate `frames` in the consumer thread, the consumer waits for each frame to be decoded"""
+    try:
+        while True:
+            start_time = time.perf_counter()
+
+            if isinstance(item := next(frames, _end_of_frames), _EndOfFrames):
+                return
+
+            decode_time = time.perf_counter() - start_time
+            stats.decode_time += decode_time
+            stats.consume_starved_time += decode_time
+            stats.frames += 1
+
+            yield item
+    finally:
+        frames.close()
+
+
+def prefetch_frames(
+    frames: Generator[T, None, None],
+    queue_size: int,
+    stats: FramePipelineStats
+) -> Generator[T, None, None]:
+    """Iterate `frames` in a reader thread that stays at most `queue_size` frames ahead of the consumer
+
+    Closing the returned generator (break, exception in the consumer...) stops the reader thread
+    and closes `frames`, so that the underlying decoder is shut down.
+
+    Args:
+        frames (Generator[T, None, None]): frame producer, only iterated from the reader thread
+        queue_size (int): maximum number of decoded frames waiting to be consumed
+        stats (FramePipelineStats): updated with the time spent in each stage
+
+    Yields:
+        T: the items of `frames`, in order
+    """
+    frame_queue: queue.Queue = queue.Queue(maxsize=queue_size)
+    stop_event = threading.Event()
+
+    def put(item) -> bool:
+        while not stop_event.is_set():
+            try:
+                frame_queue.put(item, timeout=0.1)
+                return True
+            except queue.Full:
+                continue
+
+        return False
+
+    def read_frames():
+        try:
+            while True:
+                start_time = time.perf_counter()
+
+                if isinstance(item := next(frames, _end_of_frames), _EndOfFrames):
+                    break
+
+                put_time = time.perf_counter()
+                stats.decode_time += put_time - start_time
+
+                if not put(item):
+                    return
+
+                stats.decode_blocked_time += time.perf_counter() - put_time
+        except BaseException as e:
+            put(_ReaderError(e))
+            return
+        finally:
+            frames.close()
+
+        put(_end_of_frames)
+
+    reader = threading.Thread(target=read_frames, name='frame-reader', daemon=True)
+    reader.start()
+
+    try:
+        while True:
+            start_time = time.perf_counter()
+            item = frame_queue.get()
+            stats.consume_starved_time += time.perf_counter() - start_time
+
+            if isinstance(item, _EndOfFrames):
+                return
+
+            if isinstance(item, _ReaderError):
+                raise item.error
+
+            stats.frames += 1
+            yield item
+    finally:
+        stop_event.set()
+        reader.join()
@@ -0,0 +1,166 @@
+import hashlib
+import json
+import logging
+import threading
+from dataclasses import dataclass
+from fractions import Fraction
+from functools import cached_property
+from pathlib import Path
+from typing import Any, Optional
+
+import ffmpeg
+
+from ..settings import Settings
+
+logger = logging.getLogger(__name__)
+
+
+@dataclass(frozen=True)
+class MediaProbe:
+    """ffprobe result of a media file (streams and format)"""
+    raw: dict[str, Any]
+
+    @property
+    def streams(self) -> list[dict[str, Any]]:
+        return self.raw.get('streams', [])
+
+    @property
+    def audio_streams(self) -> list[dict[str, Any]]:
+        return [stream for stream in self.streams if stream['codec_type'] == 'audio']
+
+    @cached_property
+    def video_stream(self) -> dict[str, Any]:
+        # same selection as `-select_streams V`: video streams without attached pictures
+        video_stream = next((
+            stream
+            for stream in self.streams
+            if stream['codec_type'] == 'video' and not stream.get('disposition', {}).get('attached_pic', 0)
+        ), None)
+
+        if video_stream is None:
+            raise ValueError('No video stream')
+
+        return video_stream
+
+    @property
+    def duration(self) -> float:
+        return float(self.video_stream.get('duration') or self.raw['format']['duration'])
+
+    @property
+    def start_time(self) -> float:
+        # ffmpeg positions (-ss, trim...) are relative to it, the packets timestamps are not
+        return float(self.raw.get('format', {}).get('start_time', 0))
+
+    @property
+    def framerate(self) -> float:
+        for key in ('avg_frame_rate', 'r_frame_rate'):
+            if (rate := Fraction(self.video_stream.get(key, '0/1'))) > 0:
+                return float(rate)
+
+        raise ValueError('Unknown video frame rate')
+
+    @property
+    def nframes(self) -> int:
+        if nb_frames := self.video_stream.get('nb_frames'):
+            return int(nb_frames)
+
+        return int(self.duration * self.framerate)
+
+    @property
+    def resolution(self) -> tuple[int, int]:
+        return int(self.video_stream['width']), int(self.video_stream['height'])
+
+
+_memory_cache: dict[tuple[str, int, int], MediaProbe] = {}
+_memory_cache_lock = threading.Lock()
+
+
+def probe_cache_path(media_path: Path, probes_path: Path) -> Path:
+    # named after the resolved path of the media, nothing is written next to the media
+    return probes_path / f'{hashlib.sha256(str(media_path.resolve()).encode("utf-8")).hexdigest()}.probe.json'
+
+
+def _read_persisted_probe(probe_path: Path, key: tuple[str, int, int]):
+    try:
+        content = json.loads(probe_path.read_text(encoding='utf-8'))
+    except (OSError, ValueError):
+        return None
+
+    if (content.get('path'), content.get('size'), content.get('mtime_ns')) != key:
+        return None
+
+    return MediaProbe(content['probe'])
+
+
+def _write_persisted_probe(probe_path: Path, key: tuple[str, int, int], media_probe: MediaProbe):
+    path, size, mtime_ns = key
+
+    try:
+        probe_path.write_text(
+            json.dumps({'path': path, 'size': size, 'mtime_ns': mtime_ns, 'probe': media_probe.raw}),
+            encoding='utf-8'
+        )
+    except OSError as e:
+        logger.debug('Cannot persist probe of "%s": %s', path, e)
+
+
+def probe_media(media_path: Path | str, config: Optional[Settings] = None) -> MediaProbe:
+    """Probe a media file once per pipeline run
+
+    Results are kept in memory and, if the `Cache.probes_path` of `config` is set, in the probes cache directory.
+    Both are keyed by path, size and modification time, so that a rewritten file is probed again.
+
+    Args:
+        media_path (Path | str): media to probe
+        config (Optional[Settings], optional): settings of the probes cache, the result is only kept in memory
+            if not given. Defaults to None.
+
+    Returns:
+        MediaProbe: duration, frame rate, frames count and streams of the media
+    """
+    media_path = Path(media_path)
+    stat = media_path.stat()
+    key = (str(media_path.resolve()), stat.st_size, stat.st_mtime_ns)
+
+    with _memory_cache_lock:
+        if (media_probe := _memory_cache.get(key)) is not None:
+            return media_probe
+
+    probes_path = config.Cache.probes_path if config is not None and config.Cache is not None else None
+    probe_path = probe_cache_path(media_path, probes_path) if probes_path is not None else None
+
+    if (media_probe := _read_persisted_probe(probe_path, key) if probe_path is not None else None) is None:
+        logger.debug('Probing "%s"...', media_path)
+        media_probe = MediaProbe(ffmpeg.probe(str(media_path)))
+
+        if probe_path is not None:
+            _write_persisted_probe(probe_path, key, media_probe)
+
+    with _memory_cache_lock:
+        _memory_cache[key] = media_probe
+
+    return media_probe
+
+
+def probe_keyframes(media_path: Path | str, intervals: list[tuple[float, float]]) -> list[float]:
+    """Return the sorted positions of the video keyframes in the given intervals
+
+    Only the packets of the intervals are read, with `-read_intervals`, nothing is decoded.
+
+    Args:
+        media_path (Path | str): media to probe
+        intervals (list[tuple[float, float]]): (start, end) positions in seconds from the start of the media
+
+    Returns:
+        list[float]: keyframes positions in seconds from the start of the media, like the segments positions
+    """
+    start_time = probe_media(media_path).start_time
+    read_intervals = ','.join(f'{start_time + start}%{start_time + end}' for start, end in intervals)
+
+    probe = ffmpeg.probe(str(media_path), select_streams='V:0', show_entries='packet=pts_time,flags', read_intervals=read_intervals)
+
+    return sorted({
+        float(packet['pts_time']) - start_time
+        for packet in probe.get('packets', [])
+        if 'K' in packet.get('flags', '') and packet.get('pts_time', 'N/A') != 'N/A'
+    })
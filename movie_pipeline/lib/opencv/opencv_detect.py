@@ -1,19 +1,24 @@
 import json
 import logging
-from configparser import ConfigParser
 from dataclasses import dataclass
+from itertools import pairwise
 from pathlib import Path
-from typing import Any, Generator, Optional, cast
+from typing import Generator, Optional, cast
 
 import cv2
-from deffcode import Sourcer
+import numpy as np
 
-from ...services.segments_detector.core import BaseDetect
-from ...lib.ffmpeg.ffmpeg_with_progress import ffmpeg_frame_producer
+from ...services.segments_detector.core import BaseDetect, SharedDecodeDetect, probe_sample_windows, sample_window_duration
+from ...lib.ffmpeg.ffmpeg_with_progress import ffmpeg_frame_producer, ffmpeg_rawvideo_frame_producer
+from ...lib.frame_pipeline import FramePipelineStats, measure_frames, prefetch_frames
+from ...lib.media_probe import probe_media
 from ...lib.util import timed_run
 from ...models.detected_segments import DetectedSegment
 from ...settings import Settings
 from .opencv_annotator import draw_detection_box
+from .score_timeline import save_score_timeline
+from .shared_memory_matcher import match_frames_in_processes
+from .template_registry import CropBox, load_channel_template
 
 logger = logging.getLogger(__name__)
 
@@ -55,34 +60,48 @@ def OpenCVDetectWithInjectedTemplate(detector: type['OpenCVBaseDetect'], movie_p
     return detector(movie_path, template_path, config)
 
 
-def get_template_metadata(template_path: Path):
-    template_metadata_path = template_path.with_suffix('.ini')
-
-    if not template_metadata_path.exists():
-        logger.warning('Cannot found template metadata, cropping disabled')
-        return None
+def format_crop_filter(crop_box: Optional[CropBox]):
+    if crop_box is None:
+        return ''
 
-    config = ConfigParser()
-    config.read(template_metadata_path)
+    x, y, w, h = crop_box
 
-    return config['General']
+    return f'crop={w=}:{h=}:{x=}:{y=}'
 
 
 def build_crop_filter(template_path: Path):
-    template_metadata = get_template_metadata(template_path)
+    return format_crop_filter(load_channel_template(template_path).crop_box)
 
-    if template_metadata is None:
-        return ''
 
-    w = template_metadata.getint('x2') - template_metadata.getint('x1')
-    h = template_metadata.getint('y2') - template_metadata.getint('y1')
-    x, y = template_metadata.getint('x1'), template_metadata.getint('y1')
+@dataclass(frozen=True)
+class DetectionProfile:
+    """Preprocessing of the frames done by ffmpeg before the template matching: ROI crop, then downscale"""
+    crop_box: Optional[CropBox]
+    scale: float = 1.
 
-    return f'crop={w=}:{h=}:{x=}:{y=}'
+    def frame_size(self, resolution: tuple[int, int]) -> tuple[int, int]:
+        width, height = self.crop_box[2:] if self.crop_box is not None else resolution
+
+        return round(width * self.scale), round(height * self.scale)
+
+    def video_filter(self, resolution: tuple[int, int]) -> str:
+        scale_filter = ''
 
+        if self.scale != 1.:
+            width, height = self.frame_size(resolution)
+            scale_filter = f'scale=w={width}:h={height}:flags=area'
 
-class OpenCVBaseDetect(BaseDetect):
-    other_video_filter = ''
+        return ','.join(filter(bool, [format_crop_filter(self.crop_box), scale_filter]))
+
+    def to_source_location(self, location: cv2.typing.Point) -> cv2.typing.Point:
+        x, y = location
+        offset_x, offset_y = self.crop_box[:2] if self.crop_box is not None else (0, 0)
+
+        return round(x / self.scale) + offset_x, round(y / self.scale) + offset_y
+
+
+class OpenCVBaseDetect(BaseDetect, SharedDecodeDetect):
+    seekable = True
 
     def __init__(self, movie_path: Path, template_path: Path, config: Settings) -> None:
         self._movie_path = movie_path
@@ -93,24 +112,63 @@ class OpenCVBaseDetect(BaseDetect):
         self._threshold = config.SegmentDetection.match_template_threshold
         self._config = config
 
-        sourcer = Sourcer(str(movie_path), custom_ffmpeg=str(config.ffmpeg_path)).probe_stream()
-        video_metadata = cast(dict[str, Any], sourcer.retrieve_metadata())
-        self._duration: float = video_metadata['source_duration_sec']
-        self._nframes: int = video_metadata['approx_video_nframes']
-        self._framerate: float = video_metadata['source_video_framerate']
+        media_probe = probe_media(movie_path, config)
+        self._duration = media_probe.duration
+        self._nframes = media_probe.nframes
+        self._framerate = media_probe.framerate
+        self._resolution = media_probe.resolution
+
+        self.profile = DetectionProfile(None, config.SegmentDetection.detection_scale)
 
         self._segments: list[DetectedSegment] = []
+        self._drop_short_segments = True
+        self._positions: list[float] = []
+        self._scores: list[float] = []
+
+    @property
+    def crop_box(self) -> Optional[CropBox]:
+        return self.profile.crop_box
+
+    @property
+    def other_video_filter(self) -> str:
+        return self.profile.video_filter(self._resolution)
+
+    def _load_template(self) -> cv2.typing.MatLike:
+        return load_channel_template(self._template_path, self.profile.scale).image
 
     def _update_segments(self, position: float):
         position = round(position, 2)
 
         if len(self._segments) == 0 or (position - self._segments[-1]['end']) > self._segments_min_gap:
-            self._segments = [segment for segment in self._segments if segment['duration'] > self._segments_min_duration]
+            if self._drop_short_segments:
+                self._segments = [segment for segment in self._segments if segment['duration'] > self._segments_min_duration]
             self._segments.append({'start': position, 'end': position, 'duration': 0})
         else:
             self._segments[-1]['end'] = position
             self._segments[-1]['duration'] = round(position - self._segments[-1]['start'], 2)
 
+    def post_process_segments(self, raw_segments: list[DetectedSegment]) -> list[DetectedSegment]:
+        # `_update_segments` drops the short segments once the next one starts, the last one is always kept
+        return [segment for segment in raw_segments[:-1] if segment['duration'] > self._segments_min_duration] + raw_segments[-1:]
+
+    def _record_score(self, position: float, score: float):
+        self._positions.append(position)
+        self._scores.append(score)
+
+        if score >= self._threshold:
+            self._update_segments(position)
+
+    def _reset_detection(self):
+        self._segments = []
+        self._positions, self._scores = [], []
+
+    def _save_score_timeline(self):
+        if self._config.SegmentDetection.score_timeline:
+            save_score_timeline(self._movie_path, self._positions, self._scores)
+
+    def _match(self, image: cv2.typing.MatLike, template: cv2.typing.MatLike) -> RealTimeDetectResult:
+        ...
+
     def _do_detect(
         self,
         image: cv2.typing.MatLike,
@@ -145,19 +203,54 @@ class OpenCVBaseDetect(BaseDetect):
         
         target_nframes = 10
         proceed_thresold = 0.55
-        all_segments: list[DetectedSegment] = []
+        all_segments = probe_sample_windows(
+            self,
+            self._nframes,
+            self._framerate,
+            target_nframes,
+            max_workers=self._config.SegmentDetection.sample_probe_workers,
+            window_duration=sample_window_duration(self._movie_path, self._duration, self._config)
+        )
 
-        for frame_position in range(0, self._nframes, self._nframes // target_nframes):
-            position = frame_position / self._framerate
-            detect_progress = self.detect_with_progress(seek_ss=position, seek_t=1, no_post_processing=True)
+        return len(all_segments) > proceed_thresold * target_nframes
 
-            try:
-                while True:
-                    next(detect_progress)
-            except StopIteration as e:
-                [all_segments.append(segment) for index, segment in enumerate(e.value) if index < 1]
+    def copy_for_probe(self) -> 'OpenCVBaseDetect':
+        detector = cast(OpenCVBaseDetect, super().copy_for_probe())
+        detector._reset_detection()
+        return detector
 
-        return len(all_segments) > proceed_thresold * target_nframes
+    def _produce_frames(self, target_fps: float, ffprefixes: list[str], stats: FramePipelineStats, keyframes_only: Optional[bool] = None):
+        queue_size = self._config.SegmentDetection.frame_queue_size
+
+        if keyframes_only is None:
+            keyframes_only = self._config.SegmentDetection.keyframes_only
+
+        # deffcode does not give access to the frames timestamps, needed when only key frames are decoded
+        if self._config.SegmentDetection.frame_producer == 'rawvideo' or keyframes_only:
+            frames = ffmpeg_rawvideo_frame_producer(
+                self._movie_path,
+                target_fps=target_fps,
+                frame_size=self.profile.frame_size(self._resolution),
+                config=self._config,
+                video_filter=self.other_video_filter,
+                ffprefixes=ffprefixes,
+                # queued frames, plus the one being matched and the one being read
+                buffer_count=queue_size + 2 if queue_size > 0 else 1,
+                keyframes_only=keyframes_only
+            )
+        else:
+            frames = ffmpeg_frame_producer(
+                self._movie_path,
+                target_fps=target_fps,
+                other_video_filter=self.other_video_filter,
+                custom_ffparams={'-ffprefixes': ffprefixes},
+                config=self._config
+            )
+
+        if queue_size > 0:
+            return prefetch_frames(frames, queue_size, stats)
+
+        return measure_frames(frames, stats)
 
     def detect_with_progress(
         self,
@@ -166,8 +259,33 @@ class OpenCVBaseDetect(BaseDetect):
         seek_t: Optional[str | float] = None,
         no_post_processing=False
     ) -> Generator[float, None, list[DetectedSegment]]:
-        self._segments = []
-        template = cv2.imread(str(self._template_path), cv2.IMREAD_GRAYSCALE)
+        self._drop_short_segments = not no_post_processing
+
+        if (
+            self._config.SegmentDetection.frame_sampling == 'adaptive'
+            and not self._config.SegmentDetection.keyframes_only
+            and seek_ss is None and seek_t is None
+        ):
+            return (yield from self._detect_adaptive_with_progress(target_fps))
+
+        self._reset_detection()
+        template = self._load_template()
+
+        stats = FramePipelineStats()
+        ffprefixes = [
+            *(['-ss', str(seek_ss)] if seek_ss is not None else []),
+            *(['-t', str(seek_t)] if seek_t is not None else [])
+        ]
+        frames = self._produce_frames(target_fps, ffprefixes, stats)
+
+        # the debug annotator needs the frames in this process
+        if (matcher_processes := self._config.SegmentDetection.matcher_processes) > 0 and not logger.isEnabledFor(logging.DEBUG):
+            segments = yield from self._detect_with_matcher_processes(frames, template, matcher_processes, stats, no_post_processing)
+
+            if not no_post_processing and seek_ss is None and seek_t is None:
+                self._save_score_timeline()
+
+            return segments
 
         result_window_name = f'Match Template Result - {self._movie_path}'
 
@@ -175,43 +293,192 @@ class OpenCVBaseDetect(BaseDetect):
             cv2.namedWindow(result_window_name, cv2.WINDOW_NORMAL)
 
         try:
-            ffprefixes = [
-                *(['-ss', str(seek_ss)] if seek_ss is not None else []),
-                *(['-t', str(seek_t)] if seek_t is not None else [])
-            ]
-
-            for frame, _, position_in_s in ffmpeg_frame_producer(
-                self._movie_path,
-                target_fps=target_fps,
-                other_video_filter=self.other_video_filter,
-                custom_ffparams={'-ffprefixes': ffprefixes},
-                config=self._config
-            ):
-                image = frame.copy()
-                progress_percent, should_exit = self._do_detect(
-                    image,
+            for frame, _, position_in_s in frames:
+                (progress_percent, should_exit), detect_time = timed_run(
+                    self._do_detect,
+                    frame,
                     template,
                     PositionMetadata(position_in_s, self._duration, target_fps),
                     result_window_name
                 )
+                stats.consume_time += detect_time
                 yield progress_percent
 
                 if should_exit:
                     break
         finally:
+            # stop the decoding before anything else, on should_exit as on KeyboardInterrupt
+            frames.close()
+
             if logger.isEnabledFor(logging.DEBUG):
                 cv2.destroyAllWindows()
 
+        if not no_post_processing:
+            stats.log(f'{self.__class__.__name__} "{self._movie_path}"')
+
         if no_post_processing:
             logger.debug('Segments before final cleaning: %s', '\n'.join(map(str, self._segments)))
+        elif seek_ss is None and seek_t is None:
+            self._save_score_timeline()
+
+        return self._segments
+
+    def _detect_with_matcher_processes(
+        self,
+        frames: Generator[tuple[np.ndarray, int, float], None, None],
+        template: cv2.typing.MatLike,
+        matcher_processes: int,
+        stats: FramePipelineStats,
+        no_post_processing: bool
+    ) -> Generator[float, None, list[DetectedSegment]]:
+        matches = match_frames_in_processes(self._match, template, frames, matcher_processes)
+
+        try:
+            for _, position_in_s, result in matches:
+                self._record_score(position_in_s, result.value)
+                yield position_in_s / self._duration
+        finally:
+            matches.close()
+            frames.close()
+
+        if not no_post_processing:
+            stats.log(f'{self.__class__.__name__} "{self._movie_path}" ({matcher_processes} matcher processes)')
 
         return self._segments
 
+    def _sample_presence(
+        self,
+        template: cv2.typing.MatLike,
+        target_fps: float,
+        seek_ss=0.,
+        seek_t: Optional[float] = None,
+        keyframes_only=False
+    ) -> Generator[float, None, list[tuple[float, float]]]:
+        """Match the template on the frames sampled at `target_fps`, yield the absolute position of each frame
+
+        With `keyframes_only`, only the key frames are decoded, and the first one after each `1 / target_fps` interval is matched.
+
+        Returns:
+            list[tuple[float, float]]: position and matching score of each sampled frame
+        """
+        samples: list[tuple[float, float]] = []
+        ffprefixes = [
+            *(['-ss', str(seek_ss)] if seek_ss else []),
+            *(['-t', str(seek_t)] if seek_t is not None else [])
+        ]
+        next_position = 0.
+
+        for frame, _, position_in_s in self._produce_frames(target_fps, ffprefixes, FramePipelineStats(), keyframes_only):
+            position_in_s += seek_ss
+
+            if keyframes_only:
+                if position_in_s < next_position:
+                    continue
+
+                next_position = position_in_s + 1. / target_fps
+
+            samples.append((round(position_in_s, 2), self._match(frame, template).value))
+            yield position_in_s
+
+        return samples
+
+    def _detect_adaptive_with_progress(self, target_fps: float) -> Generator[float, None, list[DetectedSegment]]:
+        """Coarse-to-fine detection
+
+        Scan the whole movie at `coarse_fps` decoding only its key frames, then re-sample at `target_fps`
+        only between two coarse samples whose template presence differs.
+
+        The coarse interval never exceeds `segments_min_gap` nor `segments_min_duration`, so that the stable
+        parts of the movie give the same segments as a full scan. As the samples are taken on the key frames,
+        two samples can be up to one GOP further apart: a template presence shorter than that interval,
+        between two samples without the template, is not detected.
+        """
+        template = self._load_template()
+        coarse_fps = max(self._config.SegmentDetection.coarse_fps, 1. / min(self._segments_min_gap, self._segments_min_duration))
+        coarse_progress_weight = 0.8
+
+        coarse_scan = self._sample_presence(template, coarse_fps, keyframes_only=True)
+
+        try:
+            while True:
+                yield coarse_progress_weight * next(coarse_scan) / self._duration
+        except StopIteration as e:
+            coarse_samples: list[tuple[float, float]] = e.value
+
+        coarse_presences = [(position, score >= self._threshold) for position, score in coarse_samples]
+
+        # absence before the first and after the last sample, so that presence at the edges is refined too
+        transition_windows = [
+            (prev_position, position)
+            for (prev_position, prev_presence), (position, presence) in pairwise([(0., False), *coarse_presences, (self._duration, False)])
+            if prev_presence != presence
+        ]
+
+        samples = dict(coarse_samples)
+
+        for index, (start, end) in enumerate(transition_windows):
+            fine_scan = self._sample_presence(template, target_fps, seek_ss=start, seek_t=end - start)
+
+            try:
+                while True:
+                    next(fine_scan)
+            except StopIteration as e:
+                samples.update(e.value)
+
+            yield coarse_progress_weight + (1 - coarse_progress_weight) * (index + 1) / len(transition_windows)
+
+        logger.info(
+            'Adaptive sampling matched %d frames instead of %d, %d transitions refined',
+            len(samples), int(self._duration * target_fps), len(transition_windows)
+        )
+
+        self._reset_detection()
+
+        for position, score in sorted(samples.items()):
+            self._record_score(position, score)
+
+        # only the sampled frames are in the timeline, they give the same segments
+        self._save_score_timeline()
+
+        return self._segments
+
+    def begin_shared_decode(self) -> None:
+        self._reset_detection()
+        self._shared_template = self._load_template()
+
+    def on_frame(self, frame: np.ndarray, position_in_s: float, target_fps: float) -> bool:
+        # the shared decode is neither cropped nor scaled, apply the detection profile here instead
+        if self.crop_box is not None:
+            x, y, w, h = self.crop_box
+            frame = frame[y:y + h, x:x + w]
+
+        if self.profile.scale != 1.:
+            frame = cv2.resize(frame, self.profile.frame_size(self._resolution), interpolation=cv2.INTER_AREA)
+
+        _, should_exit = self._do_detect(
+            frame,
+            self._shared_template,
+            PositionMetadata(position_in_s, self._duration, target_fps),
+            f'Match Template Result - {self._movie_path}'
+        )
+
+        return should_exit
+
+    def end_shared_decode(self) -> list[DetectedSegment]:
+        self._save_score_timeline()
+        return self._segments
+
 
 class OpenCVTemplateDetect(OpenCVBaseDetect):
     def __init__(self, movie_path: Path, template_path: Path, config: Settings) -> None:
         super().__init__(movie_path, template_path, config)
-        self.other_video_filter = build_crop_filter(template_path)
+        self.profile = DetectionProfile(load_channel_template(template_path).crop_box, config.SegmentDetection.detection_scale)
+
+    def _match(self, image: cv2.typing.MatLike, template: cv2.typing.MatLike) -> RealTimeDetectResult:
+        result = cv2.matchTemplate(image, template, cv2.TM_CCOEFF_NORMED)
+        _, max_val, _, max_loc = cv2.minMaxLoc(result)
+
+        return RealTimeDetectResult(max_val, max_loc)
 
     def _do_detect(
         self,
@@ -220,18 +487,16 @@ class OpenCVTemplateDetect(OpenCVBaseDetect):
         position_metadata: PositionMetadata,
         result_window_name: str
     ) -> tuple[float, bool]:
-        def match_template(image):
-            return cv2.matchTemplate(image, template, cv2.TM_CCOEFF_NORMED)
-
-        result, process_time = timed_run(match_template, image)
-        _, max_val, _, max_loc = cv2.minMaxLoc(result)
+        result, process_time = timed_run(self._match, image, template)
+        max_val, max_loc = result.value, result.location
 
         progress_percent = position_metadata.position_in_s / self._duration
 
-        if max_val >= self._threshold:
-            self._update_segments(position_metadata.position_in_s)
+        self._record_score(position_metadata.position_in_s, max_val)
 
         if logger.isEnabledFor(logging.DEBUG):
+            logger.debug('Best match %.2f at %s in source frame', max_val, self.profile.to_source_location(max_loc))
+
             return progress_percent, self._show_detect_result(
                 image,
                 template,
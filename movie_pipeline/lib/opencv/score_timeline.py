@@ -0,0 +1,78 @@
+import logging
+from pathlib import Path
+from typing import Optional
+
+import numpy as np
+
+from ...models.detected_segments import DetectedSegment
+
+logger = logging.getLogger(__name__)
+
+SCORE_TIMELINE_SUFFIX = '.scores.npy'
+
+
+def score_timeline_path(movie_path: Path) -> Path:
+    return movie_path.with_suffix(f'{movie_path.suffix}{SCORE_TIMELINE_SUFFIX}')
+
+
+def save_score_timeline(movie_path: Path, positions: list[float], scores: list[float]):
+    """Save the template matching score of each frame next to the movie, as a (2, nframes) float32 array"""
+    timeline_path = score_timeline_path(movie_path)
+    temp_timeline_path = timeline_path.with_suffix('.tmp.npy')
+
+    np.save(temp_timeline_path, np.array([positions, scores], dtype=np.float32))
+    temp_timeline_path.replace(timeline_path)
+
+    logger.debug('Score timeline of %d frames saved to "%s"', len(positions), timeline_path)
+
+
+def remove_score_timeline(movie_path: Path):
+    """Remove the timeline of a previous detection, once the segments are detected without saving a new one"""
+    if (timeline_path := score_timeline_path(movie_path)).exists():
+        logger.debug('Removing the stale score timeline "%s"', timeline_path)
+        timeline_path.unlink(missing_ok=True)
+
+
+def load_score_timeline(movie_path: Path) -> Optional[np.ndarray]:
+    if not (timeline_path := score_timeline_path(movie_path)).exists():
+        return None
+
+    return np.load(timeline_path)
+
+
+def segments_from_score_timeline(
+    timeline: np.ndarray,
+    threshold: float,
+    min_gap: float,
+    min_duration: float
+) -> list[DetectedSegment]:
+    """Rebuild the segments of a score timeline, as `OpenCVBaseDetect._update_segments` does during the detection
+
+    Args:
+        timeline (np.ndarray): positions and scores of the matched frames
+        threshold (float): minimum score of a frame with the template
+        min_gap (float): frames further apart start a new segment
+        min_duration (float): shorter segments are dropped, except the last one
+
+    Returns:
+        list[DetectedSegment]: segments where the template is found
+    """
+    positions, scores = timeline
+    positions = np.round(positions[scores >= threshold].astype(np.float64), 2)
+
+    if positions.size == 0:
+        return []
+
+    breaks = np.flatnonzero(np.diff(positions) > min_gap) + 1
+    starts = positions[np.r_[0, breaks]]
+    ends = positions[np.r_[breaks - 1, positions.size - 1]]
+    durations = np.round(ends - starts, 2)
+
+    # the detection only drops the short segments when a new one starts, the last one is always kept
+    kept = durations > min_duration
+    kept[-1] = True
+
+    return [
+        DetectedSegment(start=float(start), end=float(end), duration=float(duration))
+        for start, end, duration in zip(starts[kept], ends[kept], durations[kept])
+    ]
@@ -0,0 +1,156 @@
+import logging
+import math
+import multiprocessing
+import queue
+from collections import deque
+from multiprocessing import shared_memory
+from typing import Any, Callable, Generator, Iterable, Optional
+
+import cv2
+import numpy as np
+
+logger = logging.getLogger(__name__)
+
+MatchFunction = Callable[[cv2.typing.MatLike, cv2.typing.MatLike], Any]
+
+
+class SharedFrameRing:
+    """Fixed number of gray frame slots in shared memory
+
+    The parent process creates the ring and writes the frames, the matcher processes
+    attach to it by name and only receive slot indices.
+    """
+
+    def __init__(self, slot_count: int, frame_shape: tuple[int, ...], name: Optional[str] = None) -> None:
+        self._owner = name is None
+        self._shared_memory = shared_memory.SharedMemory(
+            name=name,
+            create=self._owner,
+            size=slot_count * math.prod(frame_shape) if self._owner else 0
+        )
+        self.slots: np.ndarray = np.ndarray((slot_count, *frame_shape), dtype=np.uint8, buffer=self._shared_memory.buf)
+
+    @property
+    def name(self) -> str:
+        return self._shared_memory.name
+
+    def close(self):
+        # the shared memory cannot be closed while an array still exports its buffer
+        del self.slots
+        self._shared_memory.close()
+
+        if self._owner:
+            self._shared_memory.unlink()
+
+
+def _match_frames(
+    match: MatchFunction,
+    template: cv2.typing.MatLike,
+    ring_name: str,
+    slot_count: int,
+    frame_shape: tuple[int, ...],
+    task_queue,
+    result_queue
+):
+    ring = SharedFrameRing(slot_count, frame_shape, name=ring_name)
+
+    try:
+        while (task := task_queue.get()) is not None:
+            frame_pos, slot = task
+            result_queue.put((frame_pos, slot, match(ring.slots[slot], template)))
+    finally:
+        ring.close()
+
+
+def match_frames_in_processes(
+    match: MatchFunction,
+    template: cv2.typing.MatLike,
+    frames: Iterable[tuple[np.ndarray, int, float]],
+    processes: int
+) -> Generator[tuple[int, float, Any], None, None]:
+    """Run `match` on each frame in `processes` matcher processes
+
+    The frames are copied into a shared memory ring, only their slot index is sent to the
+    matcher processes. `match` (and the object it is bound to) and `template` are pickled once,
+    when the processes start.
+
+    Args:
+        match (MatchFunction): picklable function matching a frame with the template
+        template (cv2.typing.MatLike): template given to `match`
+        frames (Iterable[tuple[np.ndarray, int, float]]): frame, frame position and position in seconds
+        processes (int): number of matcher processes
+
+    Yields:
+        tuple[int, float, Any]: frame position, position in seconds and match result, in frame order
+    """
+    # enough slots to keep every matcher busy while the parent collects the results
+    slot_count = 4 * processes
+    task_queue = multiprocessing.Queue()
+    result_queue = multiprocessing.Queue()
+
+    ring: Optional[SharedFrameRing] = None
+    workers: list[multiprocessing.Process] = []
+    free_slots: list[int] = []
+    submitted_frames: deque[tuple[int, float]] = deque()
+    results: dict[int, Any] = {}
+
+    def collect_result():
+        while True:
+            try:
+                frame_pos, slot, result = result_queue.get(timeout=1.)
+                break
+            except queue.Empty:
+                if not all(worker.is_alive() for worker in workers):
+                    raise RuntimeError('A template matcher process exited unexpectedly')
+
+        free_slots.append(slot)
+        results[frame_pos] = result
+
+    def ordered_results():
+        while len(submitted_frames) > 0 and submitted_frames[0][0] in results:
+            frame_pos, position_in_s = submitted_frames.popleft()
+            yield frame_pos, position_in_s, results.pop(frame_pos)
+
+    try:
+        for frame, frame_pos, position_in_s in frames:
+            if ring is None:
+                ring = SharedFrameRing(slot_count, frame.shape)
+                free_slots = list(range(slot_count))
+                workers = [
+                    multiprocessing.Process(
+                        target=_match_frames,
+                        args=(match, template, ring.name, slot_count, frame.shape, task_queue, result_queue),
+                        name=f'template-matcher-{index}',
+                        daemon=True
+                    )
+                    for index in range(processes)
+                ]
+
+                for worker in workers:
+                    worker.start()
+
+            while len(free_slots) == 0:
+                collect_result()
+
+            slot = free_slots.pop()
+            np.copyto(ring.slots[slot], frame)
+            submitted_frames.append((frame_pos, position_in_s))
+            task_queue.put((frame_pos, slot))
+
+            yield from ordered_results()
+
+        while len(submitted_frames) > 0:
+            collect_result()
+            yield from ordered_results()
+    finally:
+        for _ in workers:
+            task_queue.put(None)
+
+        for worker in workers:
+            worker.join(timeout=5)
+
+            if worker.is_alive():
+                worker.terminate()
+
+        if ring is not None:
+            ring.close()
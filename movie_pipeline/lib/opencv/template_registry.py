@@ -0,0 +1,97 @@
+import logging
+import threading
+from configparser import ConfigParser
+from dataclasses import dataclass
+from pathlib import Path
+from typing import Optional
+
+import cv2
+import numpy as np
+
+logger = logging.getLogger(__name__)
+
+CropBox = tuple[int, int, int, int]
+
+
+@dataclass(frozen=True)
+class ChannelTemplate:
+    # gray template, read only since it is shared by every detector of the process
+    image: np.ndarray
+    # (x, y, w, h) region where the template is searched, None if unknown
+    crop_box: Optional[CropBox]
+
+
+def get_template_metadata(template_path: Path):
+    template_metadata_path = template_path.with_suffix('.ini')
+
+    if not template_metadata_path.exists():
+        logger.warning('Cannot found template metadata, cropping disabled')
+        return None
+
+    config = ConfigParser()
+    config.read(template_metadata_path)
+
+    return config['General']
+
+
+def get_template_crop_box(template_path: Path) -> Optional[CropBox]:
+    """Return the (x, y, w, h) region where the template is searched, None if unknown"""
+    template_metadata = get_template_metadata(template_path)
+
+    if template_metadata is None:
+        return None
+
+    w = template_metadata.getint('x2') - template_metadata.getint('x1')
+    h = template_metadata.getint('y2') - template_metadata.getint('y1')
+    x, y = template_metadata.getint('x1'), template_metadata.getint('y1')
+
+    return x, y, w, h
+
+
+def _modification_times(template_path: Path) -> tuple[int, Optional[int]]:
+    template_metadata_path = template_path.with_suffix('.ini')
+
+    return (
+        template_path.stat().st_mtime_ns,
+        template_metadata_path.stat().st_mtime_ns if template_metadata_path.exists() else None
+    )
+
+
+_templates: dict[tuple[str, float], tuple[tuple[int, Optional[int]], ChannelTemplate]] = {}
+_templates_lock = threading.Lock()
+
+
+def load_channel_template(template_path: Path, scale=1.) -> ChannelTemplate:
+    """Load a channel template (`<templates_path>/<channel>.bmp`) and its crop box once per process
+
+    Entries are reloaded when the template or its `.ini` metadata is modified.
+
+    Args:
+        template_path (Path): template image, its metadata is read from the `.ini` next to it
+        scale (float, optional): resize factor of the template image, the crop box is not scaled. Defaults to 1.
+
+    Returns:
+        ChannelTemplate: gray template image and crop box
+    """
+    key = (str(template_path.resolve()), scale)
+    modification_times = _modification_times(template_path)
+
+    with _templates_lock:
+        if (entry := _templates.get(key)) is not None and entry[0] == modification_times:
+            return entry[1]
+
+    logger.debug('Loading template "%s" (scale %s)...', template_path, scale)
+
+    if (image := cv2.imread(str(template_path), cv2.IMREAD_GRAYSCALE)) is None:
+        raise ValueError(f'Cannot read template "{template_path}"')
+
+    if scale != 1.:
+        image = cv2.resize(image, None, fx=scale, fy=scale, interpolation=cv2.INTER_AREA)
+
+    image.setflags(write=False)
+    channel_template = ChannelTemplate(image, get_template_crop_box(template_path))
+
+    with _templates_lock:
+        _templates[key] = (modification_times, channel_template)
+
+    return channel_template
@@ -0,0 +1,142 @@
+import contextlib
+import logging
+import time
+from pathlib import Path
+from typing import Iterator, Literal, Optional
+
+from filelock import FileLock, Timeout
+
+from ..settings import Settings
+
+logger = logging.getLogger(__name__)
+
+ResourceKind = Literal['cpu', 'encoder', 'disk_io']
+# every job takes its tokens in this order
+RESOURCE_KINDS: tuple[ResourceKind, ...] = ('cpu', 'encoder', 'disk_io')
+
+
+class ResourcePool:
+    """Tokens of the host resources, shared by all the processes using the same `locks_path`
+
+    Each token is a file lock, it is released when its holder ends, even when killed.
+
+    Args:
+        locks_path (Path): folder of the tokens lock files
+        capacities (dict[ResourceKind, int]): number of tokens of each kind
+        poll_interval (float): delay between two attempts when the tokens are taken
+    """
+
+    def __init__(self, locks_path: Path, capacities: dict[ResourceKind, int], poll_interval=0.5) -> None:
+        self._locks_path = locks_path
+        self._capacities = capacities
+        self._poll_interval = poll_interval
+
+    def _try_acquire(self, kind: ResourceKind, count: int) -> list[FileLock]:
+        locks: list[FileLock] = []
+
+        for slot in range(self._capacities.get(kind, 0)):
+            if len(locks) == count:
+                break
+
+            lock = FileLock(self._locks_path / f'{kind}.{slot}.lock', timeout=0)
+
+            try:
+                lock.acquire()
+                locks.append(lock)
+            except Timeout:
+                continue
+
+        return locks
+
+    @contextlib.contextmanager
+    def acquire(self, timeout: Optional[float] = None, **counts: int) -> Iterator[dict[ResourceKind, int]]:
+        """Wait until all the requested tokens are free and hold them
+
+        The tokens are taken all at once, a job never holds some of them while waiting for the others.
+        A request is capped to the capacity of each kind, so that it can always be granted.
+
+        Args:
+            timeout (Optional[float]): maximum waiting time in seconds, wait forever if None
+            **counts (int): number of tokens by kind, eg. `cpu=4, encoder=1`
+
+        Yields:
+            dict[ResourceKind, int]: number of tokens held by kind
+        """
+        wanted: dict[ResourceKind, int] = {
+            kind: min(counts[kind], self._capacities.get(kind, 0))
+            for kind in RESOURCE_KINDS
+            if counts.get(kind, 0) > 0
+        }
+        deadline = time.monotonic() + timeout if timeout is not None else None
+        locks: list[FileLock] = []
+
+        while True:
+            for kind, count in wanted.items():
+                locks.extend(kind_locks := self._try_acquire(kind, count))
+
+                if len(kind_locks) < count:
+                    break
+            else:
+                break
+
+            for lock in locks:
+                lock.release()
+            locks.clear()
+
+            if deadline is not None and time.monotonic() >= deadline:
+                raise TimeoutError(f'Resources {wanted} not available after {timeout}s')
+
+            time.sleep(self._poll_interval)
+
+        logger.debug('Holding resources %s', wanted)
+
+        try:
+            yield wanted
+        finally:
+            for lock in locks:
+                lock.release()
+
+
+def job_threads(config: Settings, workers=1) -> Optional[int]:
+    """Threads of each of the `workers` ffmpeg processes of a job, None when the resources are not limited"""
+    if config.Resources is None:
+        return None
+
+    return max(1, config.Resources.threads_per_job // workers)
+
+
+def detection_cpu_tokens(config: Settings) -> Optional[int]:
+    """Cpu tokens of a segments detection, None when the resources are not limited
+
+    Each of the `detection_shards` processes decodes with `job_threads` threads and
+    feeds its own `matcher_processes`.
+    """
+    if config.Resources is None:
+        return None
+
+    detection_config = config.SegmentDetection
+
+    return detection_config.detection_shards * (config.Resources.threads_per_job + detection_config.matcher_processes)
+
+
+@contextlib.contextmanager
+def acquire_job_resources(config: Settings, encoder=0, disk_io=0, cpu: Optional[int] = None) -> Iterator[Optional[dict[ResourceKind, int]]]:
+    """Hold the tokens of a job for its whole duration, do nothing when the resources are not limited
+
+    A job takes the cpu tokens of its `job_threads` unless `cpu` is given, capped to the cpu cores.
+    """
+    if (resources_config := config.Resources) is None:
+        yield None
+        return
+
+    resource_pool = ResourcePool(resources_config.locks_path, {
+        'cpu': resources_config.cpu_cores,
+        'encoder': resources_config.encoder_sessions,
+        'disk_io': resources_config.disk_io_slots
+    })
+
+    with resource_pool.acquire(
+        timeout=resources_config.timeout,
+        cpu=resources_config.threads_per_job if cpu is None else cpu, encoder=encoder, disk_io=disk_io
+    ) as held:
+        yield held
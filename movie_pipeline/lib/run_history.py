@@ -0,0 +1,133 @@
+import contextlib
+import logging
+import sqlite3
+import time
+from dataclasses import dataclass
+from pathlib import Path
+from typing import Iterator, Optional
+
+import numpy as np
+
+logger = logging.getLogger(__name__)
+
+SCHEMA = '''
+CREATE TABLE IF NOT EXISTS step_runs (
+    step_name TEXT NOT NULL,
+    input_duration REAL NOT NULL,
+    kept_duration REAL NOT NULL,
+    width INTEGER NOT NULL,
+    height INTEGER NOT NULL,
+    codec TEXT NOT NULL,
+    vcodec TEXT NOT NULL,
+    hwaccel TEXT NOT NULL,
+    segments_count INTEGER NOT NULL,
+    elapsed_time REAL NOT NULL,
+    speed REAL,
+    recorded_at REAL NOT NULL
+);
+CREATE INDEX IF NOT EXISTS step_runs_by_step ON step_runs (step_name, vcodec, hwaccel, recorded_at);
+'''
+
+
+@dataclass(frozen=True)
+class RunFeatures:
+    """What is known about a job before it starts"""
+    input_duration: float
+    kept_duration: float
+    width: int
+    height: int
+    # codec of the source video
+    codec: str
+    # encoder settings
+    vcodec: str
+    hwaccel: str
+    segments_count: int
+
+    @property
+    def regressors(self) -> list[float]:
+        # the encoding time grows with the pixels of the kept part, the reading and the moves with the whole input
+        return [self.kept_duration * self.width * self.height / 1e6, self.input_duration, self.segments_count, 1.]
+
+
+@dataclass(frozen=True)
+class StepRun:
+    step_name: str
+    features: RunFeatures
+    elapsed_time: float
+    # last speed reported by ffmpeg, if the step runs ffmpeg
+    speed: Optional[float] = None
+
+
+@dataclass(frozen=True)
+class CostModel:
+    """Least squares fit of the elapsed time of a step on the `RunFeatures.regressors`"""
+    coefficients: np.ndarray
+
+    @classmethod
+    def fit(cls, step_runs: list[StepRun]) -> 'CostModel':
+        regressors = np.array([step_run.features.regressors for step_run in step_runs], dtype=np.float64)
+        elapsed_times = np.array([step_run.elapsed_time for step_run in step_runs], dtype=np.float64)
+        coefficients, *_ = np.linalg.lstsq(regressors, elapsed_times, rcond=None)
+
+        return cls(coefficients)
+
+    def predict(self, features: RunFeatures) -> float:
+        return max(float(np.dot(self.coefficients, features.regressors)), 0.)
+
+
+class RunHistory:
+    """Elapsed times of the steps of the previous jobs, in a SQLite database shared by the processes of the host
+
+    Args:
+        db_path (Path): database file, created on first use
+        max_samples (int): only the latest runs of a step are used to fit its model
+    """
+
+    def __init__(self, db_path: Path, max_samples=500) -> None:
+        self._db_path = db_path
+        self._max_samples = max_samples
+
+    @contextlib.contextmanager
+    def _connect(self) -> Iterator[sqlite3.Connection]:
+        # one short-lived connection by operation, the jobs record their steps from several threads and processes
+        with contextlib.closing(sqlite3.connect(self._db_path, timeout=30)) as connection:
+            with connection:
+                connection.executescript(SCHEMA)
+                yield connection
+
+    def record(self, step_run: StepRun):
+        features = step_run.features
+
+        with self._connect() as connection:
+            connection.execute(
+                'INSERT INTO step_runs VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)',
+                (
+                    step_run.step_name, features.input_duration, features.kept_duration, features.width, features.height,
+                    features.codec, features.vcodec, features.hwaccel, features.segments_count,
+                    step_run.elapsed_time, step_run.speed, time.time()
+                )
+            )
+
+    def step_runs(self, step_name: str, vcodec: str, hwaccel: str) -> list[StepRun]:
+        """Latest runs of a step with the same encoder settings"""
+        with self._connect() as connection:
+            rows = connection.execute(
+                '''
+                SELECT input_duration, kept_duration, width, height, codec, vcodec, hwaccel, segments_count, elapsed_time, speed
+                FROM step_runs
+                WHERE step_name = ? AND vcodec = ? AND hwaccel = ?
+                ORDER BY recorded_at DESC
+                LIMIT ?
+                ''',
+                (step_name, vcodec, hwaccel, self._max_samples)
+            ).fetchall()
+
+        return [StepRun(step_name, RunFeatures(*row[:8]), elapsed_time=row[8], speed=row[9]) for row in rows]
+
+    def cost_model(self, step_name: str, vcodec: str, hwaccel: str, min_samples: int) -> Optional[CostModel]:
+        """Model of the elapsed time of a step, None until it has run `min_samples` times"""
+        if len(step_runs := self.step_runs(step_name, vcodec, hwaccel)) < min_samples:
+            logger.debug('Not enough runs of %s to predict its elapsed time: %d', step_name, len(step_runs))
+            return None
+
+        return CostModel.fit(step_runs)
@@ -1,7 +1,9 @@
 from abc import ABC
 from dataclasses import dataclass, field
 import time
-from typing import Generic, Iterator, Optional, TypeVar
+from typing import ClassVar, Generator, Generic, Iterator, Optional, TypeVar
+
+from ..util import RateLimiter
 
 
 ContextT = TypeVar('ContextT')
@@ -25,6 +27,8 @@ class BaseStep(ABC, Generic[ContextT]):
     description: str
     cost: float
     next_step: Optional['BaseStep[ContextT]']
+    # steps of a `StepGraph` holding the same resource do not run at the same time
+    resources: ClassVar[tuple[str, ...]] = ()
 
     @property
     def all_steps(self) -> list['BaseStep[ContextT]']:
@@ -50,7 +54,7 @@ class BaseStep(ABC, Generic[ContextT]):
     def _after_perform(self) -> None:
         pass
 
-    def handle(self) -> Iterator[tuple[float, float]]:
+    def handle(self) -> Generator[tuple[float, float], None, None]:
         start_time = time.perf_counter()
         self._before_perform()
 
@@ -60,8 +64,18 @@ class BaseStep(ABC, Generic[ContextT]):
         self._after_perform()
         yield 1, time.perf_counter() - start_time
 
-    def process_all(self) -> Iterator[StepProgressResult]:
+    def process_all(self, max_rate: float = 0.) -> Iterator[StepProgressResult]:
+        """Run all the steps, reporting their progress
+
+        Args:
+            max_rate (float, optional): maximum number of results per second, the progress in between is merged
+            into the next result. The first and last results of each step are always sent. Defaults to 0 (unlimited).
+
+        Yields:
+            Iterator[StepProgressResult]: progress of the current step and of all the steps
+        """
         total_cost = self.total_cost
+        rate_limiter = RateLimiter(max_rate)
 
         completed_percent = 0.0
         current_step = self
@@ -69,7 +83,13 @@ class BaseStep(ABC, Generic[ContextT]):
         while current_step is not None:
             total_normalized_current_cost = current_step.cost / float(total_cost) # (0..1)
 
+            step_started = False
+
             for progress_percent, progress_elapsed_time in current_step.handle():
+                if not rate_limiter.ready(force=not step_started or progress_percent == 1):
+                    continue
+
+                step_started = True
                 yield StepProgressResult(
                     current_step=current_step,
                     current_step_percent=progress_percent,
@@ -0,0 +1,195 @@
+import concurrent.futures
+import logging
+import queue
+import threading
+from collections import Counter
+from dataclasses import dataclass, field
+from typing import Callable, Iterable, Iterator, Literal, Optional
+
+from ..util import RateLimiter
+from .step import BaseStep, StepProgressResult
+
+logger = logging.getLogger(__name__)
+
+StepState = Literal['waiting', 'running', 'done', 'failed', 'skipped']
+# called with a completed step and its elapsed time
+StepDoneCallback = Callable[[BaseStep, float], None]
+
+
+@dataclass(eq=False)
+class _StepNode:
+    step: BaseStep
+    depends_on: list['_StepNode']
+    on_done: Optional[StepDoneCallback] = None
+    state: StepState = 'waiting'
+    percent: float = 0.
+    elapsed_time: float = 0.
+
+
+@dataclass
+class _StepProgress:
+    node: _StepNode
+    percent: float
+    elapsed_time: float
+
+
+@dataclass
+class _StepDone:
+    node: _StepNode
+    error: Optional[BaseException]
+
+
+@dataclass
+class StepGraph:
+    """Steps with dependencies, the independent steps run concurrently
+
+    A step starts once all the steps it depends on are done, and when no running step holds
+    the `resources` it declares. Each resource is held by one step at a time, unless a higher
+    limit is given in `resource_limits`.
+
+    Args:
+        max_workers (int): maximum number of steps running at the same time
+        resource_limits (dict[str, int]): number of steps which can hold each resource at the same time
+    """
+    max_workers: int = 2
+    resource_limits: dict[str, int] = field(default_factory=dict)
+    _nodes: dict[int, _StepNode] = field(default_factory=dict, init=False)
+
+    def add_step(self, step: BaseStep, depends_on: Iterable[BaseStep] = (), on_done: Optional[StepDoneCallback] = None) -> BaseStep:
+        """Add a step, it runs after `depends_on` steps which must be already added
+
+        `on_done` is called from `process_all` once the step has completed successfully.
+        """
+        self._nodes[id(step)] = _StepNode(step, [self._nodes[id(dependency)] for dependency in depends_on], on_done)
+        return step
+
+    def add_chain(self, root_step: BaseStep, depends_on: Iterable[BaseStep] = (), on_done: Optional[StepDoneCallback] = None) -> list[BaseStep]:
+        """Add all the linked steps of `root_step`, each one runs after the previous one"""
+        steps = root_step.all_steps
+
+        for previous_step, step in zip([None, *steps], steps):
+            self.add_step(step, [previous_step] if previous_step is not None else depends_on, on_done)
+
+        return steps
+
+    @property
+    def all_steps(self) -> list[BaseStep]:
+        return [node.step for node in self._nodes.values()]
+
+    @property
+    def total_cost(self) -> float:
+        return sum(step.cost for step in self.all_steps)
+
+    def _start_ready_nodes(self, resources_in_use: Counter, nb_running: int) -> list[_StepNode]:
+        started_nodes: list[_StepNode] = []
+
+        # the dependencies are added before their dependents, their state is already updated
+        for node in self._nodes.values():
+            if node.state != 'waiting':
+                continue
+
+            if any(dependency.state in ('failed', 'skipped') for dependency in node.depends_on):
+                logger.warning('Skipping "%s", a step it depends on has not completed', node.step.description)
+                node.state = 'skipped'
+                continue
+
+            if nb_running + len(started_nodes) >= self.max_workers:
+                continue
+
+            if not all(dependency.state == 'done' for dependency in node.depends_on):
+                continue
+
+            if any(resources_in_use[resource] >= self.resource_limits.get(resource, 1) for resource in node.step.resources):
+                continue
+
+            node.state = 'running'
+            resources_in_use.update(node.step.resources)
+            started_nodes.append(node)
+
+        return started_nodes
+
+    def process_all(self, max_rate: float = 0.) -> Iterator[StepProgressResult]:
+        """Run all the steps, reporting their progress
+
+        The progress of the concurrent steps is interleaved, the total progress is weighted by the cost of each step.
+        When a step fails, the steps depending on it are skipped, the other ones still run, and the
+        first error is raised once they are completed.
+
+        Args:
+            max_rate (float, optional): maximum number of results per second, the progress in between is merged
+            into the next result. The first and last results of each step are always sent. Defaults to 0 (unlimited).
+
+        Yields:
+            Iterator[StepProgressResult]: progress of the step which has progressed and of all the steps
+        """
+        total_cost = float(self.total_cost)
+        rate_limiter = RateLimiter(max_rate)
+
+        events: queue.Queue[_StepProgress | _StepDone] = queue.Queue()
+        stop_event = threading.Event()
+        resources_in_use: Counter = Counter()
+        reported_nodes: set[int] = set()
+        first_error: Optional[BaseException] = None
+        nb_running = 0
+
+        def run_step(node: _StepNode):
+            progress = node.step.handle()
+
+            try:
+                for percent, elapsed_time in progress:
+                    if stop_event.is_set():
+                        return
+
+                    events.put(_StepProgress(node, percent, elapsed_time))
+            finally:
+                progress.close()
+
+        def on_step_done(node: _StepNode, future: concurrent.futures.Future):
+            events.put(_StepDone(node, future.exception()))
+
+        with concurrent.futures.ThreadPoolExecutor(max_workers=self.max_workers, thread_name_prefix='step') as executor:
+            try:
+                while True:
+                    for node in self._start_ready_nodes(resources_in_use, nb_running):
+                        nb_running += 1
+                        executor.submit(run_step, node).add_done_callback(lambda future, node=node: on_step_done(node, future))
+
+                    if nb_running == 0:
+                        break
+
+                    match events.get():
+                        case _StepProgress(node=node, percent=percent, elapsed_time=elapsed_time):
+                            node.percent = percent
+                            node.elapsed_time = elapsed_time
+                            force = id(node) not in reported_nodes or percent == 1
+
+                            if not rate_limiter.ready(force=force):
+                                continue
+
+                            reported_nodes.add(id(node))
+                            yield StepProgressResult(
+                                current_step=node.step,
+                                current_step_percent=percent,
+                                current_step_elapsed_time=elapsed_time,
+                                total_percent=sum(graph_node.step.cost * graph_node.percent for graph_node in self._nodes.values()) / total_cost
+                            )
+
+                        case _StepDone(node=node, error=error):
+                            nb_running -= 1
+                            resources_in_use.subtract(node.step.resources)
+
+                            if error is None:
+                                node.state = 'done'
+
+                                if node.on_done is not None:
+                                    node.on_done(node.step, node.elapsed_time)
+                            else:
+                                logger.error('Step "%s" failed: %s', node.step.description, error)
+                                node.state = 'failed'
+                                first_error = first_error or error
+            finally:
+                # the running steps stop at their next progress when the caller gives up
+                stop_event.set()
+
+        if first_error is not None:
+            raise first_error
@@ -6,7 +6,7 @@ from datetime import timedelta
 from pathlib import Path
 from typing import Iterator
 
-import ffmpeg
+from .media_probe import probe_media
 
 
 def position_in_seconds(time: str) -> float:
@@ -26,7 +26,7 @@ def seconds_to_position(seconds: float) -> str:
 
 
 def total_movie_duration(movie_file_path: Path | str) -> float:
-    return float(ffmpeg.probe(movie_file_path, select_streams='V')['streams'][0]['duration'])
+    return probe_media(movie_file_path).duration
 
 
 @contextmanager
@@ -44,6 +44,31 @@ def timed_run(func, *args, **kwargs):
     return result, end_time - start_time
 
 
+class RateLimiter:
+    """Let at most `max_rate` events per second through, a `max_rate` of 0 disables the limit"""
+
+    def __init__(self, max_rate: float) -> None:
+        self._min_interval = 1. / max_rate if max_rate > 0 else 0.
+        self._last_time: float | None = None
+
+    def ready(self, force=False) -> bool:
+        """Tell if an event can be sent now, `force` sends it anyway (first, last or transition event)
+
+        Args:
+            force (bool, optional): send the event whatever the rate. Defaults to False.
+
+        Returns:
+            bool: True if the event must be sent, the next events are then delayed from now
+        """
+        now = time.perf_counter()
+
+        if not force and self._last_time is not None and now - self._last_time < self._min_interval:
+            return False
+
+        self._last_time = now
+        return True
+
+
 def progress_to_task_iterator(progress_iterator: Iterator[float], count=100) -> Iterator[int]:
     """
     Take a progress iterator (value is increasing from 0.0 to 1.0)
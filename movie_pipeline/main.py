@@ -40,6 +40,17 @@ def detect_segments(
         command(filepath, selected_detectors_keys, config)
 
 
+@app.command('resegment')
+def resegment(
+    filepath: Annotated[Path, typer.Argument(help='File or folder to process')],
+    detector: Annotated[DetectorKey, typer.Option(help='Detector whose segments are replaced in the segments file')] = DetectorKey.match_template
+):
+    """Recompute template matching segments from saved score timelines, without decoding again"""
+    from movie_pipeline.commands.resegment import command
+    if config is not None:
+        command(filepath, detector.name, config)
+
+
 @app.command('process_movie')
 def process_movie(
     filepath: Annotated[Path, typer.Argument(help='File or folder to process')],
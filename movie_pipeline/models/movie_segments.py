@@ -1,7 +1,10 @@
 from dataclasses import dataclass
 import itertools
+from pathlib import Path
 from typing import cast
 
+import ffmpeg
+
 from ..lib.util import position_in_seconds
 
 
@@ -24,11 +27,11 @@ class MovieSegments:
     def total_seconds(self) -> float:
         return sum([stop - start for start, stop in self.segments])
 
-    def to_ffmpeg_concat_segments(self, in_file, audio_streams):
+    def to_ffmpeg_concat_segments(self, in_file, audio_streams, video=True):
         return itertools.chain.from_iterable(
             (
                 # concat video stream
-                in_file.video.filter_('trim', start=start, end=end).filter_('setpts', 'PTS-STARTPTS'),
+                *([in_file.video.filter_('trim', start=start, end=end).filter_('setpts', 'PTS-STARTPTS')] if video else []),
                 # concat audio streams
                 *(
                     in_file[str(audio['index'])].filter_('atrim', start=start, end=end).filter_('asetpts', 'PTS-STARTPTS')
@@ -37,3 +40,45 @@ class MovieSegments:
             )
             for start, end in self.segments
         )
+
+    def to_ffmpeg_seeked_segments(self, in_path: Path, audio_streams, **input_kwargs):
+        """Open one input per segment with `-ss`/`-t` input seeking, so that the discarded parts are never decoded
+
+        The decoding starts at the keyframe before each segment, the frames before it are dropped by ffmpeg.
+        `trim`/`atrim` then cut each stream to the exact segment duration.
+        """
+        def seeked_segment(start: float, end: float):
+            in_file = ffmpeg.input(str(in_path), ss=start, t=end - start, **input_kwargs)
+
+            return (
+                # concat video stream
+                in_file.video.filter_('trim', duration=end - start).filter_('setpts', 'PTS-STARTPTS'),
+                # concat audio streams
+                *(
+                    in_file[str(audio['index'])].filter_('atrim', duration=end - start).filter_('asetpts', 'PTS-STARTPTS')
+                    for audio in audio_streams
+                )
+            )
+
+        return itertools.chain.from_iterable(seeked_segment(start, end) for start, end in self.segments)
+
+    def to_ffmpeg_select_filtergraph(self, audio_streams) -> tuple[str, list[str]]:
+        """One `select`/`aselect` chain per stream instead of one `trim`/`atrim` chain per segment and stream
+
+        The kept frames are renumbered by `setpts`/`asetpts`, which assumes a constant frame rate.
+
+        Returns:
+            tuple[str, list[str]]: filtergraph, and its output labels (video then audio streams)
+        """
+        # same bounds as `trim`, the end is excluded
+        expression = '+'.join(f'gte(t,{start})*lt(t,{end})' for start, end in self.segments)
+
+        chains = [
+            f"[0:v]select='{expression}',setpts=N/FRAME_RATE/TB[v]",
+            *(
+                f"[0:{audio['index']}]aselect='{expression}',asetpts=N/SR/TB[a{index}]"
+                for index, audio in enumerate(audio_streams)
+            )
+        ]
+
+        return ';\n'.join(chains), ['v', *(f'a{index}' for index in range(len(audio_streams)))]
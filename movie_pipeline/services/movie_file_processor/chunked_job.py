@@ -0,0 +1,308 @@
+import contextlib
+import logging
+import os
+import shutil
+import socket
+import threading
+import time
+from pathlib import Path
+from typing import Any, Iterator, Optional
+
+from pydantic import BaseModel
+
+from ...lib.ffmpeg.ffmpeg_chunked_encode import audio_command, chunk_command, join_chunks_command, plan_chunks, run_commands_with_progress
+from ...lib.ffmpeg.ffmpeg_cli_presets import get_ffprefixes, get_ffthreads_prefixes
+from ...lib.ffmpeg.ffmpeg_smart_cut import write_concat_list
+from ...lib.media_probe import probe_keyframes, probe_media
+from ...lib.resource_tokens import acquire_job_resources, job_threads
+from ...lib.step_runner.exception import BaseStepInterruptedError
+from ...models.movie_segments import MovieSegments
+from ...settings import Settings
+from .core import MovieFileProcessor
+from .movie_file_processor_step import ProcessStep
+
+logger = logging.getLogger(__name__)
+
+AUDIO_UNIT = 'audio'
+MANIFEST_NAME = 'manifest.json'
+MERGE_OWNER_NAME = 'merge.owner'
+
+
+class ChunkedJob(BaseModel):
+    """Chunks of one movie, encoded by several satellites sharing the chunks directory"""
+    in_file_path: Path
+    raw_segments: str
+    chunks: list[tuple[float, float]]
+    audio_streams: list[dict[str, Any]]
+
+    @property
+    def units(self) -> list[str]:
+        """Names of the encoding jobs: one per video chunk, plus one for all the audio streams"""
+        return [f'{index:04d}' for index in range(len(self.chunks))] + ([AUDIO_UNIT] if self.audio_streams else [])
+
+    @property
+    def video_units(self) -> list[str]:
+        return [unit for unit in self.units if unit != AUDIO_UNIT]
+
+    def output_path(self, chunks_path: Path, unit: str) -> Path:
+        return chunks_path / (f'{unit}.mka' if unit == AUDIO_UNIT else f'{unit}.mkv')
+
+    def unit_command(self, unit: str, output_path: Path, config: Settings):
+        """Return the ffmpeg command of a unit, and its output duration"""
+        movie_segments = MovieSegments(raw_segments=self.raw_segments)
+
+        if unit == AUDIO_UNIT:
+            return audio_command(self.in_file_path, movie_segments, self.audio_streams, output_path), movie_segments.total_seconds
+
+        start, end = chunk = self.chunks[int(unit)]
+        return chunk_command(self.in_file_path, chunk, output_path, config, job_threads(config)), end - start
+
+    @classmethod
+    def load(cls, chunks_path: Path) -> 'ChunkedJob':
+        return cls.model_validate_json((chunks_path / MANIFEST_NAME).read_text(encoding='utf-8'))
+
+    def save(self, chunks_path: Path):
+        temp_manifest_path = chunks_path / f'{MANIFEST_NAME}.tmp'
+        temp_manifest_path.write_text(self.model_dump_json(), encoding='utf-8')
+        temp_manifest_path.replace(chunks_path / MANIFEST_NAME)
+
+
+def chunks_dir_path(in_file_path: Path) -> Path:
+    return in_file_path.with_suffix(f'{in_file_path.suffix}.chunks')
+
+
+def _owner_identity() -> str:
+    return f'{socket.gethostname()} {os.getpid()}'
+
+
+def _create_owner_file(owner_path: Path) -> bool:
+    try:
+        owner_fd = os.open(owner_path, os.O_CREAT | os.O_EXCL | os.O_WRONLY)
+    except FileExistsError:
+        return False
+
+    with os.fdopen(owner_fd, 'w', encoding='utf-8') as owner_file:
+        owner_file.write(f'{_owner_identity()}\n')
+
+    return True
+
+
+def _is_process_alive(pid: int) -> bool:
+    if os.name == 'nt':
+        # os.kill would send a CTRL_C_EVENT, only the lease expiry tells that the owner is gone
+        return True
+
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return False
+    except PermissionError:
+        return True
+
+    return True
+
+
+def is_lease_stale(owner_path: Path, lease_timeout: float) -> bool:
+    """Tell if the owner of a unit is gone: it has not renewed its lease, or its process is dead on this host"""
+    try:
+        if time.time() - owner_path.stat().st_mtime > lease_timeout:
+            return True
+
+        host, pid = owner_path.read_text(encoding='utf-8').split()
+    except FileNotFoundError:
+        return False
+    except ValueError:
+        # still being written by its owner
+        return False
+
+    return host == socket.gethostname() and not _is_process_alive(int(pid))
+
+
+def claim(owner_path: Path, lease_timeout: Optional[float] = None) -> bool:
+    """Take the ownership of a job unit, only one satellite can create the owner file on the shared volume
+
+    The owner renews its lease while it works on the unit (see `renewed_lease`). With a `lease_timeout`,
+    a unit whose owner is gone (see `is_lease_stale`) is taken over.
+
+    Returns:
+        bool: True if this process owns the unit
+    """
+    if _create_owner_file(owner_path):
+        return True
+
+    if lease_timeout is None or not is_lease_stale(owner_path, lease_timeout):
+        return False
+
+    # only one satellite moves the stale owner file away, the others do not find it anymore
+    stale_path = owner_path.with_name(f'{owner_path.name}.stale.{socket.gethostname()}.{os.getpid()}')
+
+    try:
+        owner_path.rename(stale_path)
+    except FileNotFoundError:
+        return False
+
+    if not is_lease_stale(stale_path, lease_timeout):
+        # another satellite took the unit over in between, give its lease back unless a third one has already claimed it
+        logger.warning('"%s" has been taken over by another satellite', owner_path)
+
+        with contextlib.suppress(FileExistsError):
+            os.link(stale_path, owner_path)
+
+        stale_path.unlink(missing_ok=True)
+        return False
+
+    logger.warning('Taking over "%s" from %s', owner_path, stale_path.read_text(encoding='utf-8').strip())
+    stale_path.unlink(missing_ok=True)
+
+    return _create_owner_file(owner_path)
+
+
+@contextlib.contextmanager
+def renewed_lease(owner_path: Path, lease_timeout: float) -> Iterator[None]:
+    """Renew the lease of an owned unit, by touching its owner file a few times per `lease_timeout`"""
+    stop_event = threading.Event()
+
+    def renew():
+        while not stop_event.wait(lease_timeout / 4):
+            try:
+                os.utime(owner_path)
+            except FileNotFoundError:
+                logger.warning('Lost the lease of "%s"', owner_path)
+                return
+
+    renewer = threading.Thread(target=renew, name='lease-renewer', daemon=True)
+    renewer.start()
+
+    try:
+        yield
+    finally:
+        stop_event.set()
+        renewer.join()
+
+
+def _describe_owner(owner_path: Path) -> str:
+    try:
+        return owner_path.read_text(encoding='utf-8').strip()
+    except FileNotFoundError:
+        return 'another satellite'
+
+
+def prepare_chunked_job(edl_path: Path, chunk_duration: float, config: Settings) -> tuple[Path, ChunkedJob]:
+    """Split the kept segments of an EDL into GOP aligned chunks, and write their manifest next to the movie
+
+    Returns:
+        tuple[Path, ChunkedJob]: chunks directory, shared by the encode and merge jobs, and its manifest
+    """
+    context = MovieFileProcessor(edl_path, config).movie_file_processor_root_step.context
+    in_file_path = context.in_file_path
+    segments = context.movie_segments.segments
+
+    job = ChunkedJob(
+        in_file_path=in_file_path,
+        raw_segments=context.edl_file.content['segments'],
+        chunks=plan_chunks(segments, probe_keyframes(in_file_path, segments), chunk_duration),
+        audio_streams=probe_media(in_file_path, config).audio_streams
+    )
+
+    chunks_path = chunks_dir_path(in_file_path)
+    chunks_path.mkdir(exist_ok=True)
+    job.save(chunks_path)
+
+    logger.info('"%s" split in %d units in "%s"', in_file_path, len(job.units), chunks_path)
+    return chunks_path, job
+
+
+def encode_unit_with_progress(chunks_path: Path, unit: str, config: Settings) -> Iterator[float]:
+    """Encode a unit of a chunked job, unless it is already encoded or owned by another satellite
+
+    Nothing is yielded for a unit encoded by another satellite. The unit is released if its encoding fails,
+    so that it can be encoded again.
+    """
+    job = ChunkedJob.load(chunks_path)
+    output_path = job.output_path(chunks_path, unit)
+    owner_path = chunks_path / f'{unit}.owner'
+    lease_timeout = config.Encoding.unit_lease_timeout
+
+    if output_path.exists():
+        logger.info('"%s" is already encoded', output_path)
+        return
+
+    if not claim(owner_path, lease_timeout):
+        logger.info('"%s" is owned by %s', output_path, _describe_owner(owner_path))
+        return
+
+    # the owner taken over may have completed the unit in between
+    if output_path.exists():
+        logger.info('"%s" is already encoded', output_path)
+        return
+
+    # a satellite which has lost its lease may still be writing its own partial output
+    partial_path = output_path.with_name(f'{unit}.{socket.gethostname()}-{os.getpid()}.partial{output_path.suffix}')
+
+    try:
+        command = job.unit_command(unit, partial_path, config)
+        cmd = ['ffmpeg', *get_ffthreads_prefixes(job_threads(config)), *get_ffprefixes(config.ffmpeg_hwaccel)]
+
+        with (
+            renewed_lease(owner_path, lease_timeout),
+            acquire_job_resources(config, encoder=int(unit != AUDIO_UNIT and config.ffmpeg_hwaccel != 'none'), disk_io=1)
+        ):
+            yield from run_commands_with_progress([command], workers=1, cmd=cmd)
+
+        partial_path.replace(output_path)
+
+    except BaseException:
+        partial_path.unlink(missing_ok=True)
+        owner_path.unlink(missing_ok=True)
+        raise
+
+
+class MergeChunksStep(ProcessStep):
+    """Join the units of a chunked job once all of them are encoded, in place of the encoding"""
+    poll_interval = 10.
+
+    def _perform(self) -> Iterator[float]:
+        self._chunks_path = chunks_dir_path(self.context.in_file_path)
+        job = ChunkedJob.load(self._chunks_path)
+
+        encoding_config = self.context.config.Encoding
+
+        if not claim(merge_owner_path := self._chunks_path / MERGE_OWNER_NAME, encoding_config.unit_lease_timeout):
+            raise BaseStepInterruptedError(f'"{self._chunks_path}" is already merged by another job')
+
+        try:
+            with renewed_lease(merge_owner_path, encoding_config.unit_lease_timeout):
+                yield from self._wait_for_units(job, encoding_config.merge_timeout)
+
+                chunks_list_path = self._chunks_path / 'chunks.txt'
+                write_concat_list([job.output_path(self._chunks_path, unit) for unit in job.video_units], chunks_list_path)
+                audio_path = job.output_path(self._chunks_path, AUDIO_UNIT) if job.audio_streams else None
+
+                command = join_chunks_command(chunks_list_path, audio_path, self._dest_filepath)
+
+                for progress in self._run_with_progress(command, 0., self.context.movie_segments.total_seconds):
+                    yield .5 + .5 * progress
+
+        except BaseException:
+            merge_owner_path.unlink(missing_ok=True)
+            raise
+
+    def _wait_for_units(self, job: ChunkedJob, merge_timeout: float) -> Iterator[float]:
+        """Wait until all the units are encoded, raise a TimeoutError once none has been encoded for `merge_timeout` seconds"""
+        last_missing_count, last_encoded_time = len(job.units) + 1, time.monotonic()
+
+        while missing_units := [unit for unit in job.units if not job.output_path(self._chunks_path, unit).exists()]:
+            if len(missing_units) < last_missing_count:
+                last_missing_count, last_encoded_time = len(missing_units), time.monotonic()
+            elif time.monotonic() - last_encoded_time > merge_timeout:
+                raise TimeoutError(f'No unit of "{self._chunks_path}" encoded for {merge_timeout}s, missing: {", ".join(missing_units)}')
+
+            logger.info('Waiting for %d units of "%s"...', len(missing_units), self._chunks_path)
+            yield .5 * (1 - len(missing_units) / len(job.units))
+            time.sleep(self.poll_interval)
+
+    def _after_perform(self) -> None:
+        super()._after_perform()
+
+        # before the backup, which moves every file starting with the movie name
+        shutil.rmtree(self._chunks_path)
@@ -1,13 +1,17 @@
 import logging
 from pathlib import Path
+from typing import Iterator
 
 import yaml
 from schema import Optional, Regex, Schema
 
 from ...lib.backup_policy_executor import BackupPolicyExecutor, EdlFile
+from ...lib.step_runner.step import BaseStep, StepProgressResult
+from ...lib.step_runner.step_graph import StepGraph
 from ...models.movie_segments import MovieSegments
 from ...settings import Settings
 from .movie_file_processor_step import BackupStep,  MovieFileProcessorContext, ProcessStep
+from .step_history import StepRunsRecorder, record_step_runs
 
 logger = logging.getLogger(__name__)
 
@@ -22,11 +26,19 @@ edl_content_schema = Schema({
 
 
 class MovieFileProcessor:
-    def __init__(self, edl_path: Path, config: Settings, *, backup_policy_executor=BackupPolicyExecutor) -> None:
+    def __init__(
+        self,
+        edl_path: Path,
+        config: Settings,
+        *,
+        backup_policy_executor=BackupPolicyExecutor,
+        process_step_type: type[ProcessStep] = ProcessStep
+    ) -> None:
         """
         Args:
             edl_path (Path): path to edit decision list file
                 (naming: {movie file with suffix}.txt)
+            process_step_type (type[ProcessStep], optional): step producing the destination file. Defaults to ProcessStep.
         """
         edl_content = yaml.safe_load(edl_path.read_text(encoding='utf-8'))
         edl_content = edl_content_schema.validate(edl_content)
@@ -41,11 +53,12 @@ class MovieFileProcessor:
             dest_filename=edl_file.content['filename']
         )
 
+        self._context = context
         self.movie_segments = context.movie_segments
         self.segments = context.movie_segments.segments
         self.dest_filename = context.dest_filename
 
-        self.movie_file_processor_root_step = ProcessStep(
+        self.movie_file_processor_root_step = process_step_type(
             context=context,
             description=self.dest_filename,
             cost=0.8,
@@ -57,10 +70,31 @@ class MovieFileProcessor:
             )
         )
 
+    def process_all(self, max_rate: float = 0.) -> Iterator[StepProgressResult]:
+        """`process_all` of the steps, recorded in the run history if enabled"""
+        step_progress_results = self.movie_file_processor_root_step.process_all(max_rate)
+
+        if (history_config := self._context.config.History) is None:
+            return step_progress_results
+
+        return record_step_runs(step_progress_results, self._context.in_file_path, self.movie_segments, history_config, self._context.config)
+
+    def add_to_step_graph(self, step_graph: StepGraph) -> list[BaseStep]:
+        """Add the steps as a chain of `step_graph`, each completed step recorded in the run history if enabled"""
+        if (history_config := self._context.config.History) is None:
+            return step_graph.add_chain(self.movie_file_processor_root_step)
+
+        step_runs_recorder = StepRunsRecorder.from_movie(self._context.in_file_path, self.movie_segments, history_config, self._context.config)
+
+        return step_graph.add_chain(
+            self.movie_file_processor_root_step,
+            on_done=step_runs_recorder.record if step_runs_recorder is not None else None
+        )
+
     def process_with_progress(self):
         logger.info(self.dest_filename)
 
-        for step_progress_result in self.movie_file_processor_root_step.process_all():
+        for step_progress_result in self.process_all():
             yield step_progress_result.total_percent
 
         logger.info('"%s" processed successfully', self.dest_filename)
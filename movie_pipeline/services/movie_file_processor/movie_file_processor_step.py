@@ -1,23 +1,49 @@
 import logging
 import math
 import shutil
+import tempfile
+import time
 from dataclasses import dataclass
 from pathlib import Path
-from typing import Any, Iterator, cast
+from typing import Iterator, Optional, cast
 
 import ffmpeg
-from deffcode import Sourcer
 
 from ...lib.backup_policy_executor import BackupPolicyExecutor, EdlFile
-from ...lib.ffmpeg.ffmpeg_cli_presets import get_ffencode_audio_params, get_ffencode_video_params, get_ffprefixes
+from ...lib.ffmpeg.ffmpeg_cli_presets import (
+    get_ffencode_audio_params,
+    get_ffencode_video_params,
+    get_ffinput_params,
+    get_ffprefixes,
+    get_ffthreads_prefixes
+)
+from ...lib.ffmpeg.ffmpeg_chunked_encode import (
+    audio_command,
+    chunk_command,
+    join_chunks_command,
+    plan_chunks,
+    run_commands_with_progress
+)
+from ...lib.ffmpeg.ffmpeg_filter_script import FFmpegFilterScriptCommand
+from ...lib.ffmpeg.ffmpeg_piece_cache import PieceCache, segment_piece_command
+from ...lib.ffmpeg.ffmpeg_smart_cut import (
+    can_smart_cut,
+    cut_piece_command,
+    edge_piece_mismatches,
+    keyframes_search_intervals,
+    plan_smart_cut,
+    write_concat_list
+)
 from ...lib.ffmpeg.ffmpeg_with_progress import ffmpeg_command_with_progress
+from ...lib.media_probe import probe_keyframes, probe_media
 from ...lib.movie_path_destination_finder import MoviePathDestinationFinder
+from ...lib.resource_tokens import acquire_job_resources, job_threads
 from ...lib.step_runner.exception import BaseStepError, BaseStepInterruptedError
 from ...lib.step_runner.step import BaseStep
 from ...lib.util import position_in_seconds
 from ...models.movie_file import LegacyMovieFile
 from ...models.movie_segments import MovieSegments
-from ...settings import Settings
+from ...settings import CacheSettings, Settings
 
 logger = logging.getLogger(__name__)
 
@@ -34,15 +60,18 @@ class MovieFileProcessorContext:
     def validate_dest_file(self, dest_path: Path, config: Settings):
         try:
             dest_filepath = dest_path / self.dest_filename
-            sourcer = Sourcer(str(dest_filepath), custom_ffmpeg=str(config.ffmpeg_path)).probe_stream()
-            video_metadata = cast(dict[str, Any], sourcer.retrieve_metadata())
-            return math.isclose(video_metadata['source_duration_sec'], self.movie_segments.total_seconds, abs_tol=1)
+            media_probe = probe_media(dest_filepath)
+            return math.isclose(media_probe.duration, self.movie_segments.total_seconds, abs_tol=1)
 
-        except ValueError:
+        except (ValueError, OSError, ffmpeg.Error):
             return False
 
 
 class ProcessStep(BaseStep[MovieFileProcessorContext]):
+    resources = ('encode',)
+    # last speed reported by ffmpeg, kept in the run history
+    ffmpeg_speed: Optional[float] = None
+
     def _before_perform(self) -> None:
         self._in_file = ffmpeg.input(str(self.context.in_file_path))
         self._dest_path = MoviePathDestinationFinder(LegacyMovieFile(self.context.dest_filename), self.context.config).resolve_destination()
@@ -67,45 +96,259 @@ class ProcessStep(BaseStep[MovieFileProcessorContext]):
     def _perform(self) -> Iterator[float]:
         logger.info('Processing "%s" from "%s"...', self._dest_filepath, self.context.in_file_path)
 
-        self._audio_streams = ffmpeg.probe(self.context.in_file_path, select_streams='a')['streams']
+        self._media_probe = probe_media(self.context.in_file_path, self.context.config)
+        self._audio_streams = self._media_probe.audio_streams
         self._nb_audio_streams = len(self._audio_streams)
         logger.debug(f'{self._nb_audio_streams=}')
 
-        command = (
-            ffmpeg
-            .concat(
-                *self.context.movie_segments.to_ffmpeg_concat_segments(self._in_file, self._audio_streams),
-                v=1, a=self._nb_audio_streams
-            )
-            .output(
-                str(self._dest_filepath),
-                **get_ffencode_video_params(self.context.config.ffmpeg_hwaccel, self.context.config.ffmpeg_vcodec),
-                **get_ffencode_audio_params(),
-                **{f'map_metadata:s:a:{index}': f'0:s:a:{index}' for index in range(self._nb_audio_streams)},
-                dn=None, sn=None, ignore_unknown=None,
-            )
-        )
+        # the tokens are shared with the other jobs of the host, a hardware encoder also takes an encoder session
+        with acquire_job_resources(self.context.config, encoder=int(self.context.config.ffmpeg_hwaccel != 'none'), disk_io=1):
+            if self.context.config.Encoding.cut_mode == 'smart' and can_smart_cut(self._media_probe, self.context.config):
+                yield from self._perform_smart_cut()
+            else:
+                yield from self._perform_full_encode()
+
+    def _perform_full_encode(self) -> Iterator[float]:
+        if self.context.config.Cache is not None and self.context.config.Cache.pieces_path is not None:
+            yield from self._perform_cached_encode()
+        elif self.context.config.Encoding.chunk_duration > 0:
+            yield from self._perform_chunked_encode()
+        else:
+            yield from self._perform_reencode()
+
+    def _run_with_progress(
+        self,
+        command,
+        processed_seconds: float,
+        total_seconds: float,
+        ffprefixes: Optional[list[str]] = None
+    ) -> Iterator[float]:
+        if ffprefixes is None:
+            ffprefixes = get_ffprefixes(self.context.config.ffmpeg_hwaccel)
 
         try:
-            logger.debug(f'{self.context.movie_segments.segments=}')
             logger.info('Running: %s', command.compile())
 
-            total_seconds = self.context.movie_segments.total_seconds
-            for item in ffmpeg_command_with_progress(command, cmd=['ffmpeg', *get_ffprefixes(self.context.config.ffmpeg_hwaccel)]):
-                if item.get('time'):
-                    processed_time = max(position_in_seconds(item['time']), 0)
-                    yield processed_time / total_seconds
+            cmd = ['ffmpeg', *get_ffthreads_prefixes(job_threads(self.context.config)), *ffprefixes]
+
+            for item in ffmpeg_command_with_progress(command, cmd=cmd):
+                if (speed := item.get('speed', 'N/A').strip().removesuffix('x')) not in ('N/A', ''):
+                    self.ffmpeg_speed = float(speed)
+
+                if (progress_time := item.get('time')):
+                    processed_time = max(position_in_seconds(progress_time), 0)
+                    yield (processed_seconds + processed_time) / total_seconds
 
         except ffmpeg.Error as e:
             logger.exception(e.stderr)
             raise e
 
+    def _perform_reencode(self) -> Iterator[float]:
+        segments_graph = self.context.config.Encoding.segments_graph
+        output_kwargs = {
+            **get_ffencode_video_params(self.context.config.ffmpeg_hwaccel, self.context.config.ffmpeg_vcodec, job_threads(self.context.config)),
+            **get_ffencode_audio_params(),
+            **{f'map_metadata:s:a:{index}': f'0:s:a:{index}' for index in range(self._nb_audio_streams)},
+            'dn': None, 'sn': None, 'ignore_unknown': None,
+        }
+        ffprefixes = None
+
+        with tempfile.TemporaryDirectory(prefix='movie_pipeline_') as graph_dir:
+            match segments_graph:
+                case 'select':
+                    filtergraph, output_labels = self.context.movie_segments.to_ffmpeg_select_filtergraph(self._audio_streams)
+                    command = FFmpegFilterScriptCommand(
+                        in_path=self.context.in_file_path,
+                        filtergraph=filtergraph,
+                        output_labels=output_labels,
+                        script_path=Path(graph_dir) / 'filtergraph.txt',
+                        dest_path=self._dest_filepath,
+                        output_kwargs=output_kwargs
+                    )
+                case 'input_seek':
+                    segments_streams = self.context.movie_segments.to_ffmpeg_seeked_segments(
+                        self.context.in_file_path, self._audio_streams,
+                        **get_ffinput_params(self.context.config.ffmpeg_hwaccel)
+                    )
+                    command = ffmpeg.concat(*segments_streams, v=1, a=self._nb_audio_streams).output(str(self._dest_filepath), **output_kwargs)
+                    # the hardware acceleration is an option of each input
+                    ffprefixes = []
+                case _:
+                    segments_streams = self.context.movie_segments.to_ffmpeg_concat_segments(self._in_file, self._audio_streams)
+                    command = ffmpeg.concat(*segments_streams, v=1, a=self._nb_audio_streams).output(str(self._dest_filepath), **output_kwargs)
+
+            yield from self._run_encode_with_progress(command, segments_graph, ffprefixes)
+
+    def _run_encode_with_progress(self, command, segments_graph: str, ffprefixes: Optional[list[str]]) -> Iterator[float]:
+        logger.debug(f'{self.context.movie_segments.segments=}')
+        total_seconds = self.context.movie_segments.total_seconds
+        start_time = time.perf_counter()
+
+        yield from self._run_with_progress(command, 0., total_seconds, ffprefixes)
+
+        # compare the throughput of the segments graphs on the same EDL
+        encode_time = time.perf_counter() - start_time
+        logger.info(
+            'Encoded %d segments (%.1fs) with the %s graph in %.1fs, %.2fx realtime',
+            len(self.context.movie_segments.segments), total_seconds, segments_graph, encode_time, total_seconds / (encode_time or 1.)
+        )
+
+    def _perform_cached_encode(self) -> Iterator[float]:
+        cache_config = cast(CacheSettings, self.context.config.Cache)
+        piece_cache = PieceCache(cast(Path, cache_config.pieces_path), max_size=int(cache_config.max_size_in_gb * 1024 ** 3))
+
+        # the number of threads does not make another piece, it is left out of the key
+        encoder_params = get_ffencode_video_params(self.context.config.ffmpeg_hwaccel, self.context.config.ffmpeg_vcodec)
+        output_kwargs = get_ffencode_video_params(self.context.config.ffmpeg_hwaccel, self.context.config.ffmpeg_vcodec, job_threads(self.context.config))
+
+        segments = self.context.movie_segments.segments
+        keys = [PieceCache.key(self.context.in_file_path, start, end, encoder_params) for start, end in segments]
+        missing_pieces = [(segment, key) for segment, key in zip(segments, keys) if piece_cache.get(key) is None]
+
+        logger.info('%d of %d segments found in the pieces cache', len(segments) - len(missing_pieces), len(segments))
+
+        # the audio of all the segments and the join are fast, they weight like a tenth of the kept duration each
+        kept_seconds = self.context.movie_segments.total_seconds
+        missing_seconds = sum(end - start for (start, end), _ in missing_pieces)
+        total_seconds = missing_seconds + (.2 if self._nb_audio_streams > 0 else .1) * kept_seconds
+        processed_seconds = 0.
+
+        for (start, end), key in missing_pieces:
+            command = segment_piece_command(
+                self.context.in_file_path, (start, end), piece_cache.partial_path(key), output_kwargs,
+                **get_ffinput_params(self.context.config.ffmpeg_hwaccel)
+            )
+
+            try:
+                yield from self._run_with_progress(command, processed_seconds, total_seconds, ffprefixes=[])
+            except BaseException:
+                piece_cache.partial_path(key).unlink(missing_ok=True)
+                raise
+
+            piece_cache.commit(key)
+            processed_seconds += end - start
+
+        with tempfile.TemporaryDirectory(prefix='movie_pipeline_') as join_dir:
+            audio_path = Path(join_dir) / 'audio.mka' if self._nb_audio_streams > 0 else None
+
+            if audio_path is not None:
+                command = audio_command(self.context.in_file_path, self.context.movie_segments, self._audio_streams, audio_path)
+
+                for progress in self._run_with_progress(command, 0., kept_seconds):
+                    yield (processed_seconds + .1 * kept_seconds * progress) / total_seconds
+
+                processed_seconds += .1 * kept_seconds
+
+            pieces_list_path = Path(join_dir) / 'pieces.txt'
+            write_concat_list([piece_cache.piece_path(key) for key in keys], pieces_list_path)
+
+            for progress in self._run_with_progress(join_chunks_command(pieces_list_path, audio_path, self._dest_filepath), 0., kept_seconds):
+                yield (processed_seconds + progress * (total_seconds - processed_seconds)) / total_seconds
+
+        piece_cache.evict()
+
+    def _perform_chunked_encode(self) -> Iterator[float]:
+        encoding_config = self.context.config.Encoding
+        segments = self.context.movie_segments.segments
+        chunks = plan_chunks(segments, probe_keyframes(self.context.in_file_path, segments), encoding_config.chunk_duration)
+
+        logger.info('Encoding %d segments in %d chunks with %d workers', len(segments), len(chunks), encoding_config.chunk_workers)
+
+        # the threads of the job are shared by the concurrent chunks
+        threads = job_threads(self.context.config, workers=encoding_config.chunk_workers)
+
+        with tempfile.TemporaryDirectory(prefix='.chunks_', dir=self._dest_path) as chunks_dir:
+            chunks_paths = [Path(chunks_dir) / f'{index:04d}.mkv' for index in range(len(chunks))]
+            commands = [
+                (chunk_command(self.context.in_file_path, chunk, chunk_path, self.context.config, threads), chunk[1] - chunk[0])
+                for chunk, chunk_path in zip(chunks, chunks_paths)
+            ]
+
+            audio_path = Path(chunks_dir) / 'audio.mka' if self._nb_audio_streams > 0 else None
+
+            if audio_path is not None:
+                # encoded alongside the chunks, much faster than the video
+                commands.append((audio_command(self.context.in_file_path, self.context.movie_segments, self._audio_streams, audio_path), 0.))
+
+            ffprefixes = [*get_ffthreads_prefixes(threads), *get_ffprefixes(self.context.config.ffmpeg_hwaccel)]
+
+            # the join is a copy, it only weights for a small part of the progress
+            for progress in run_commands_with_progress(commands, encoding_config.chunk_workers, cmd=['ffmpeg', *ffprefixes]):
+                yield .9 * progress
+
+            chunks_list_path = Path(chunks_dir) / 'chunks.txt'
+            write_concat_list(chunks_paths, chunks_list_path)
+
+            for progress in self._run_with_progress(join_chunks_command(chunks_list_path, audio_path, self._dest_filepath), 0., self.context.movie_segments.total_seconds):
+                yield .9 + .1 * progress
+
+    def _perform_smart_cut(self) -> Iterator[float]:
+        segments = self.context.movie_segments.segments
+        # one frame absorbs the rounding of the segments positions
+        min_duration = 1. / self._media_probe.framerate
+        keyframes = probe_keyframes(self.context.in_file_path, keyframes_search_intervals(segments, min_duration))
+        pieces = plan_smart_cut(segments, keyframes, min_duration)
+
+        logger.info(
+            'Smart cut of %d segments: %.1fs copied, %.1fs re-encoded',
+            len(segments),
+            sum(piece.duration for piece in pieces if piece.copy),
+            sum(piece.duration for piece in pieces if not piece.copy)
+        )
+
+        # the audio of all the segments and the join each count as one more pass on the kept duration
+        kept_seconds = self.context.movie_segments.total_seconds
+        total_seconds = (3 if self._nb_audio_streams > 0 else 2) * kept_seconds
+        processed_seconds = 0.
+        edges_verified = False
+
+        with tempfile.TemporaryDirectory(prefix='.smart_cut_', dir=self._dest_path) as pieces_dir:
+            pieces_paths: list[Path] = []
+
+            for index, piece in enumerate(pieces):
+                piece_path = Path(pieces_dir) / f'{index:04d}.ts'
+                command = cut_piece_command(self.context.in_file_path, piece, piece_path, self._media_probe, self.context.config)
+
+                yield from self._run_with_progress(command, processed_seconds, total_seconds)
+                processed_seconds += piece.duration
+                pieces_paths.append(piece_path)
+
+                if piece.copy or edges_verified:
+                    continue
+
+                # all the edges are encoded with the same options, the first one tells if they can be joined with the copied GOPs
+                if mismatches := edge_piece_mismatches(probe_media(piece_path), self._media_probe):
+                    logger.warning('Cannot smart cut "%s", the re-encoded edges differ from the source: %s', self.context.in_file_path, mismatches)
+                    processed_percent = processed_seconds / total_seconds
+
+                    for progress in self._perform_full_encode():
+                        yield processed_percent + (1 - processed_percent) * progress
+
+                    return
+
+                edges_verified = True
+
+            audio_path = Path(pieces_dir) / 'audio.mka' if self._nb_audio_streams > 0 else None
+
+            if audio_path is not None:
+                # encoded at once, the AAC priming of each piece would leave gaps at the joins
+                command = audio_command(self.context.in_file_path, self.context.movie_segments, self._audio_streams, audio_path)
+                yield from self._run_with_progress(command, processed_seconds, total_seconds)
+                processed_seconds += kept_seconds
+
+            pieces_list_path = Path(pieces_dir) / 'pieces.txt'
+            write_concat_list(pieces_paths, pieces_list_path)
+
+            yield from self._run_with_progress(join_chunks_command(pieces_list_path, audio_path, self._dest_filepath), processed_seconds, total_seconds)
+
     def _after_perform(self) -> None:
         if not self.context.validate_dest_file(self._dest_path, self.context.config):
             raise BaseStepError(f'"{self._dest_filepath}" does not conform to processing decision file')
 
 
 class BackupStep(BaseStep[MovieFileProcessorContext]):
+    resources = ('backup',)
+
     def _perform(self) -> Iterator[float]:
         logger.info('Backuping "%s"...', self.context.dest_filename)
         self.context.backup_policy_executor.execute(original_file_path=self.context.in_file_path)
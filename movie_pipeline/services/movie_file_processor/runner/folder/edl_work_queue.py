@@ -0,0 +1,87 @@
+import logging
+import threading
+from pathlib import Path
+from typing import Callable, Optional
+
+import yaml
+
+from .....lib.media_probe import probe_media
+from .....models.movie_segments import MovieSegments
+
+logger = logging.getLogger(__name__)
+
+# cost of a movie which cannot be probed
+DEFAULT_RESOLUTION = (1920, 1080)
+
+
+def edl_cost(edl_path: Path) -> float:
+    """Estimate the encoding cost of an EDL: kept duration times the number of pixels per frame"""
+    try:
+        segments = yaml.safe_load(edl_path.read_text(encoding='utf-8'))['segments']
+        total_seconds = MovieSegments(raw_segments=segments).total_seconds
+    except (OSError, KeyError, TypeError, ValueError, yaml.YAMLError) as e:
+        logger.warning('Cannot estimate the cost of "%s": %s', edl_path, e)
+        return 0.
+
+    try:
+        width, height = probe_media(edl_path.with_suffix('')).resolution
+    except Exception as e:
+        logger.warning('Cannot probe the movie of "%s", assuming %dx%d: %s', edl_path, *DEFAULT_RESOLUTION, e)
+        width, height = DEFAULT_RESOLUTION
+
+    return total_seconds * width * height
+
+
+class EdlWorkQueue:
+    """Shared queue of the EDLs of a folder, the most expensive one is given first to the next free worker
+
+    The folder is scanned again on each request, so that the EDLs added during the run are processed too.
+    A given EDL is renamed to `.pending_yml_{worker_id}`, like with the static distribution.
+
+    Args:
+        folder_path (Path): folder of the EDLs
+        edl_ext (str): extension of the EDLs to process
+        cost (Callable[[Path], float], optional): cost of an EDL. Defaults to `edl_cost`.
+    """
+
+    def __init__(self, folder_path: Path, edl_ext: str, cost: Callable[[Path], float] = edl_cost) -> None:
+        self._folder_path = folder_path
+        self._edl_ext = edl_ext
+        self._cost = cost
+        self._lock = threading.Lock()
+        self._costs: dict[Path, float] = {}
+        self.given_count = 0
+
+    @property
+    def known_count(self) -> int:
+        """Number of EDLs given or waiting, as of the last scan"""
+        return self.given_count + len(self._costs)
+
+    def _scan(self) -> None:
+        edls = set(self._folder_path.glob(f'*{self._edl_ext}'))
+
+        for edl in edls - self._costs.keys():
+            self._costs[edl] = self._cost(edl)
+
+        # taken by another runner
+        for edl in self._costs.keys() - edls:
+            del self._costs[edl]
+
+    def next_edl(self, worker_id: int) -> Optional[Path]:
+        """Give the most expensive waiting EDL to a worker, None once the folder has no more EDL"""
+        with self._lock:
+            self._scan()
+
+            while self._costs:
+                edl = max(self._costs, key=self._costs.__getitem__)
+                del self._costs[edl]
+
+                try:
+                    pending_edl = edl.rename(edl.with_suffix(f'.pending_yml_{worker_id}'))
+                except FileNotFoundError:
+                    continue
+
+                self.given_count += 1
+                return pending_edl
+
+            return None
@@ -1,6 +1,7 @@
 import concurrent.futures
 import itertools
 import logging
+from datetime import timedelta
 from pathlib import Path
 from typing import TypedDict, cast
 
@@ -11,10 +12,13 @@ from rich.progress import Progress, TaskID
 from rich.tree import Tree
 
 from .....lib.step_runner.step import BaseStep, StepProgressResult
+from .....lib.step_runner.step_graph import StepGraph
 from .....lib.ui_factory import ProgressListener, ProgressUIFactory
 from .....lib.util import diff_tracking
 from .....settings import Settings
 from ...core import MovieFileProcessor
+from ...step_history import EdlTimePredictor
+from .edl_work_queue import EdlWorkQueue, edl_cost
 
 logger = logging.getLogger(__name__)
 
@@ -27,8 +31,20 @@ class MovieFileProcessorFolderRunner:
         self._config = config
 
         self._nb_worker = config.Processor.nb_worker if config.Processor else 1
+        self._scheduling = config.Processor.scheduling if config.Processor else 'static'
+        self._overlap_steps = config.Processor.overlap_steps if config.Processor else False
         self._jobs_progresses = [ProgressUIFactory.create_job_progress() for _ in range(self._nb_worker)]
 
+        # None until the run history has enough runs, the movie size or its pixels are used instead
+        self._edl_time_predictor = EdlTimePredictor.from_config(config)
+        self._predicted_times: dict[Path, float] = {}
+
+    def _predicted_time(self, edl: Path) -> float:
+        if (predicted_time := self._predicted_times.get(edl)) is None:
+            predicted_time = self._predicted_times[edl] = (cast(EdlTimePredictor, self._edl_time_predictor).predict(edl) or 0.)
+
+        return predicted_time
+
     def _distribute_fairly_edl(self):
         edls = list(self._folder_path.glob(f'*{self._edl_ext}'))
 
@@ -38,14 +54,21 @@ class MovieFileProcessorFolderRunner:
         return binpacking.to_constant_bin_number(
             edls,
             N_bin=self._nb_worker,
-            key=lambda f: f.with_suffix('').stat().st_size
+            key=self._predicted_time if self._edl_time_predictor is not None else lambda f: f.with_suffix('').stat().st_size
         )
 
+    def _describe_predicted_time(self, edls: list[Path], nb_worker=1) -> str:
+        if self._edl_time_predictor is None or len(edls) == 0:
+            return ''
+
+        predicted_time = sum(self._predicted_time(edl) for edl in edls) / nb_worker
+        return f' (~{timedelta(seconds=round(predicted_time))})'
+
     def _prepare_processing(self, tree_logger: Tree):
         groups: list[list[Path]] = []
 
         for index, group in enumerate(self._distribute_fairly_edl()):
-            subtree = tree_logger.add(f'Worker {index}')
+            subtree = tree_logger.add(f'Worker {index}{self._describe_predicted_time(cast(list[Path], group))}')
             subgroup: list[Path] = []
 
             # rename distributed edls
@@ -60,40 +83,92 @@ class MovieFileProcessorFolderRunner:
 
         return groups
 
+    def _process_edl(self, job_progress: Progress, task_id: TaskID, edl: Path, overall_weight: float):
+        movie_file_processor = MovieFileProcessor(edl, self._config)
+        prev_edl_progress = [0.]  # mutable!
+
+        for edl_progress in process_with_progress_tui(job_progress, movie_file_processor, self._config.progress_max_rate):
+            with diff_tracking(prev_edl_progress, edl_progress) as diff_edl_progress:
+                job_progress.advance(task_id, advance=diff_edl_progress)
+                self._progress.overall_progress.advance(self._progress.overall_task, advance=diff_edl_progress * overall_weight)
+
+        logger.info('"%s" processed successfully', edl)
+
     def _execute_processing(self, worker_id: int, edls: list[Path], edl_ext: str):
         job_progress = self._jobs_progresses[worker_id]
         task_id = job_progress.add_task(f'{edl_ext}...', total=len(edls))
 
+        if self._overlap_steps and len(edls) > 0:
+            self._process_edls_overlapped(job_progress, task_id, edls)
+            return
+
         for edl in sorted(edls, key=lambda edl: edl.stat().st_size, reverse=True):
-            movie_file_processor = MovieFileProcessor(edl, self._config)
-            prev_edl_progress = [0.]  # mutable!
+            self._process_edl(job_progress, task_id, edl, overall_weight=1 / len(edls))
 
-            for edl_progress in process_with_progress_tui(job_progress, movie_file_processor.movie_file_processor_root_step):
-                with diff_tracking(prev_edl_progress, edl_progress) as diff_edl_progress:
-                    job_progress.advance(task_id, advance=diff_edl_progress)
-                    self._progress.overall_progress.advance(self._progress.overall_task, advance=diff_edl_progress / len(edls))
+    def _process_edls_overlapped(self, job_progress: Progress, task_id: TaskID, edls: list[Path]):
+        # one encode and one backup at a time, the backup of a movie runs alongside the encode of the next one
+        step_graph = StepGraph(max_workers=2)
 
-            logger.info('"%s" processed successfully', edl)
+        for edl in sorted(edls, key=lambda edl: edl.stat().st_size, reverse=True):
+            MovieFileProcessor(edl, self._config).add_to_step_graph(step_graph)
 
-    def process_directory(self):
-        logger.info('Processing: "%s"', self._folder_path)
+        prev_group_progress = [0.]  # mutable!
+
+        for group_progress in process_graph_with_progress_tui(job_progress, step_graph, self._config.progress_max_rate):
+            with diff_tracking(prev_group_progress, group_progress) as diff_group_progress:
+                job_progress.advance(task_id, advance=diff_group_progress * len(edls))
+                self._progress.overall_progress.advance(self._progress.overall_task, advance=diff_group_progress)
+
+        logger.info('%s processed successfully', ', '.join(f'"{edl}"' for edl in edls))
 
-        tree = Tree("EDL to be processed")
+    def _execute_work_stealing(self, worker_id: int, work_queue: EdlWorkQueue):
+        job_progress = self._jobs_progresses[worker_id]
+        task_id = job_progress.add_task(f'.pending_yml_{worker_id}...', total=0)
+
+        while (edl := work_queue.next_edl(worker_id)) is not None:
+            job_progress.update(task_id, total=cast(float, job_progress.tasks[task_id].total) + 1)
+            # the overall progress counts the EDLs, its total grows with the EDLs found during the run
+            self._progress.overall_progress.update(self._progress.overall_task, total=work_queue.known_count)
+
+            try:
+                self._process_edl(job_progress, task_id, edl, overall_weight=1.)
+            except Exception as e:
+                # the worker goes on with the next EDL
+                logger.error('Exception when processing "%s": %s', edl, e)
+
+    def _submit_workers(self, executor: concurrent.futures.Executor):
+        if self._scheduling == 'work_stealing':
+            work_queue = EdlWorkQueue(self._folder_path, self._edl_ext, cost=self._predicted_time if self._edl_time_predictor is not None else edl_cost)
+            edls = list(self._folder_path.glob(f'*{self._edl_ext}'))
+            print(f'EDL to be processed: {len(edls)} in a shared queue{self._describe_predicted_time(edls, self._nb_worker)}')
+
+            return {
+                executor.submit(self._execute_work_stealing, index, work_queue): f'.pending_yml_{index}'
+                for index in range(self._nb_worker)
+            }
+
+        tree = Tree(f"EDL to be processed{self._describe_predicted_time(list(self._folder_path.glob(f'*{self._edl_ext}')), self._nb_worker)}")
         edl_groups = self._prepare_processing(tree_logger=tree)
         print(tree)
 
+        self._progress.overall_progress.update(self._progress.overall_task, total=self._nb_worker)
+
+        return {
+            executor.submit(self._execute_processing, index, group, edl_ext): edl_ext
+            for index, edl_ext, group in map(
+                lambda index: (index, f'.pending_yml_{index}', edl_groups[index]),
+                range(self._nb_worker)
+            )
+        }
+
+    def process_directory(self):
+        logger.info('Processing: "%s"', self._folder_path)
+
         with Live(self._progress.layout, refresh_per_second=10):
-            self._progress.overall_progress.update(self._progress.overall_task, total=self._nb_worker)
             ProgressUIFactory.create_job_panel_row_from_job_progress(self._progress.layout, self._jobs_progresses)
 
             with concurrent.futures.ThreadPoolExecutor(max_workers=self._nb_worker) as executor:
-                future_tasks = {
-                    executor.submit(self._execute_processing, index, group, edl_ext): edl_ext
-                    for index, edl_ext, group in map(
-                        lambda index: (index, f'.pending_yml_{index}', edl_groups[index]),
-                        range(self._nb_worker)
-                    )
-                }
+                future_tasks = self._submit_workers(executor)
 
                 for future in concurrent.futures.as_completed(future_tasks):
                     edl_ext = future_tasks[future]
@@ -110,7 +185,7 @@ class MovieFileProcessorFolderRunner:
 ProgressState = TypedDict('ProgressState', {'current_step': BaseStep | None, 'task_id': TaskID | None})
 
 
-def process_with_progress_tui(progress: Progress, movie_file_processor_root_step: BaseStep):
+def process_with_progress_tui(progress: Progress, movie_file_processor_root_step: BaseStep | MovieFileProcessor, max_rate: float = 0.):
     state: ProgressState = {'current_step': None, 'task_id': None}
 
     def stop_previous_task():
@@ -130,9 +205,28 @@ def process_with_progress_tui(progress: Progress, movie_file_processor_root_step
             return
         progress.update(state['task_id'], completed=step_progress_result.current_step_percent)
 
-    for step_progress_result in movie_file_processor_root_step.process_all():
+    for step_progress_result in movie_file_processor_root_step.process_all(max_rate):
         add_task_if_needed(step_progress_result)
         update_task(step_progress_result)
         yield step_progress_result.total_percent
 
     stop_previous_task()
+
+
+def process_graph_with_progress_tui(progress: Progress, step_graph: StepGraph, max_rate: float = 0.):
+    """Same as `process_with_progress_tui`, with one task for each running step of the graph"""
+    tasks_ids: dict[int, TaskID] = {}
+
+    for step_progress_result in step_graph.process_all(max_rate):
+        step = step_progress_result.current_step
+
+        if id(step) not in tasks_ids:
+            tasks_ids[id(step)] = progress.add_task(description=step.description, total=1.0)
+
+        progress.update(tasks_ids[id(step)], completed=step_progress_result.current_step_percent)
+
+        if step_progress_result.current_step_percent == 1:
+            progress.stop_task(tasks_ids[id(step)])
+            progress.update(tasks_ids[id(step)], visible=False)
+
+        yield step_progress_result.total_percent
@@ -1,14 +1,18 @@
 import json
+import time
 from datetime import datetime
-from typing import Iterator
+from pathlib import Path
+from typing import Any, Iterator
 
 from pydantic import BaseModel
-from pydantic.types import DirectoryPath, FilePath
+from pydantic.types import DirectoryPath, FilePath, PositiveFloat
 
 from .....jobs.base_xyops_plugin import ReportedProgress
-from .....lib.util import timed_run
+from .....lib.util import RateLimiter, timed_run
 from .....settings import Settings
+from ...chunked_job import MergeChunksStep, encode_unit_with_progress, prepare_chunked_job
 from ...core import MovieFileProcessor
+from ...step_history import EdlTimePredictor
 
 
 class FileInput(BaseModel):
@@ -16,19 +20,65 @@ class FileInput(BaseModel):
     edl_ext: str
 
 
-def process_file(input: FileInput, config: Settings) -> Iterator[ReportedProgress]:
+def _rename_edl_to_pending(input: FileInput) -> Path:
     edl = input.file_path.with_suffix(f'{input.file_path.suffix}{input.edl_ext}')
     new_edl_name = edl.with_suffix(f'.pending_yml_{int(datetime.utcnow().timestamp())}')
     edl.rename(new_edl_name)
 
-    movie_file_processor = MovieFileProcessor(new_edl_name, config)
+    return new_edl_name
+
+
+def _process_with_reported_progress(movie_file_processor: MovieFileProcessor, config: Settings) -> Iterator[ReportedProgress]:
     elapsed_times: dict[str, float] = {}
 
-    for step_progress_result in movie_file_processor.movie_file_processor_root_step.process_all():
+    for step_progress_result in movie_file_processor.process_all(config.progress_max_rate):
         elapsed_times[step_progress_result.current_step_name] = round(step_progress_result.current_step_elapsed_time, 2)
         yield {'xy': 1, 'progress': round(step_progress_result.total_percent, 2), 'perf': elapsed_times}
 
 
+def process_file(input: FileInput, config: Settings) -> Iterator[ReportedProgress]:
+    yield from _process_with_reported_progress(MovieFileProcessor(_rename_edl_to_pending(input), config), config)
+
+
+class ChunkedFileInput(FileInput):
+    chunk_duration: PositiveFloat = 600.
+
+
+def split_file(input: ChunkedFileInput, config: Settings) -> Iterator[ReportedProgress]:
+    """Split a movie into chunks to be encoded by several satellites, then merged by a `merge_chunks` job"""
+    def submit_chunks():
+        new_edl_name = _rename_edl_to_pending(input)
+        chunks_path, chunked_job = prepare_chunked_job(new_edl_name, input.chunk_duration, config)
+
+        encode_unit_inputs = [{'chunks_path': str(chunks_path), 'unit': unit} for unit in chunked_job.units]
+        merge_chunks_input = {'file_path': str(input.file_path), 'edl_ext': new_edl_name.suffix}
+        print(json.dumps({'xy': 1, 'data': {'encode_unit_inputs': encode_unit_inputs, 'merge_chunks_input': merge_chunks_input}}))
+
+    _, process_time = timed_run(submit_chunks)
+    yield {'xy': 1, 'progress': 1., 'perf': {'SubmitChunks': process_time}}
+
+
+class UnitInput(BaseModel):
+    chunks_path: DirectoryPath
+    unit: str
+
+
+def encode_unit(input: UnitInput, config: Settings) -> Iterator[ReportedProgress]:
+    rate_limiter = RateLimiter(config.progress_max_rate)
+    start_time = time.perf_counter()
+
+    for progress in encode_unit_with_progress(input.chunks_path, input.unit, config):
+        if rate_limiter.ready(force=progress == 1):
+            yield {'xy': 1, 'progress': round(progress, 2), 'perf': {'EncodeUnit': round(time.perf_counter() - start_time, 2)}}
+
+
+def merge_chunks(input: FileInput, config: Settings) -> Iterator[ReportedProgress]:
+    """Join the encoded units once all of them are present, `input.edl_ext` is the pending EDL given by `split_file`"""
+    edl = input.file_path.with_suffix(f'{input.file_path.suffix}{input.edl_ext}')
+
+    yield from _process_with_reported_progress(MovieFileProcessor(edl, config, process_step_type=MergeChunksStep), config)
+
+
 class DirectoryInput(BaseModel):
     folder_path: DirectoryPath
     edl_ext: str
@@ -43,7 +93,15 @@ def process_directory(input: DirectoryInput, config: Settings) -> Iterator[Repor
             edl.rename(new_edl_name)
             edls.append(new_edl_name)
 
-        process_file_inputs = [{'file_path': str(edl_path.with_suffix('')), 'edl_ext': edl_path.suffix} for edl_path in edls]
+        process_file_inputs: list[dict[str, Any]] = [{'file_path': str(edl_path.with_suffix('')), 'edl_ext': edl_path.suffix} for edl_path in edls]
+
+        if (edl_time_predictor := EdlTimePredictor.from_config(config)) is not None:
+            # the longest jobs are submitted first, so that they do not end the run alone
+            for process_file_input, edl_path in zip(process_file_inputs, edls):
+                process_file_input['predicted_time'] = round(edl_time_predictor.predict(edl_path) or 0., 2)
+
+            process_file_inputs.sort(key=lambda process_file_input: process_file_input['predicted_time'], reverse=True)
+
         print(json.dumps({'xy': 1, 'data': {'process_file_inputs': process_file_inputs}}))
 
     _, process_time = timed_run(submit_actions)
@@ -0,0 +1,145 @@
+import logging
+import sqlite3
+from pathlib import Path
+from typing import Iterator, Optional
+
+import ffmpeg
+import yaml
+
+from ...lib.media_probe import probe_media
+from ...lib.run_history import CostModel, RunFeatures, RunHistory, StepRun
+from ...lib.step_runner.step import BaseStep, StepProgressResult
+from ...models.movie_segments import MovieSegments
+from ...settings import HistorySettings, Settings
+
+logger = logging.getLogger(__name__)
+
+# steps of a movie, their predicted elapsed times are summed
+PREDICTED_STEPS_NAMES = ('ProcessStep', 'BackupStep')
+
+
+def movie_run_features(in_file_path: Path, movie_segments: MovieSegments, config: Settings) -> RunFeatures:
+    media_probe = probe_media(in_file_path, config)
+    width, height = media_probe.resolution
+
+    return RunFeatures(
+        input_duration=media_probe.duration,
+        kept_duration=movie_segments.total_seconds,
+        width=width,
+        height=height,
+        codec=media_probe.video_stream.get('codec_name', 'unknown'),
+        vcodec=config.ffmpeg_vcodec,
+        hwaccel=config.ffmpeg_hwaccel,
+        segments_count=len(movie_segments.segments)
+    )
+
+
+class StepRunsRecorder:
+    """Record the completed steps of a movie in the run history"""
+
+    def __init__(self, features: RunFeatures, history_config: HistorySettings) -> None:
+        self._features = features
+        self._run_history = RunHistory(history_config.db_path)
+
+    @classmethod
+    def from_movie(
+        cls,
+        in_file_path: Path,
+        movie_segments: MovieSegments,
+        history_config: HistorySettings,
+        config: Settings
+    ) -> Optional['StepRunsRecorder']:
+        """None when the movie cannot be probed, it must be probed before the backup moves it away"""
+        try:
+            return cls(movie_run_features(in_file_path, movie_segments, config), history_config)
+        except (OSError, ValueError, KeyError, ffmpeg.Error) as e:
+            logger.warning('Cannot record the run of "%s": %s', in_file_path, e)
+            return None
+
+    def record(self, step: BaseStep, elapsed_time: float):
+        step_run = StepRun(
+            type(step).__name__,
+            self._features,
+            elapsed_time=elapsed_time,
+            speed=getattr(step, 'ffmpeg_speed', None)
+        )
+
+        try:
+            self._run_history.record(step_run)
+        except sqlite3.Error as e:
+            logger.warning('Cannot record the run of %s: %s', step_run.step_name, e)
+
+
+def record_step_runs(
+    step_progress_results: Iterator[StepProgressResult],
+    in_file_path: Path,
+    movie_segments: MovieSegments,
+    history_config: HistorySettings,
+    config: Settings
+) -> Iterator[StepProgressResult]:
+    """Forward the progress of the steps of a movie, recording each completed step in the run history
+
+    A step is recorded once, from its last progress: the steps run one after the other, a step is completed
+    when the next one reports its progress, the last one when all the steps are done.
+    A failed step, or a step left behind by the caller, is not recorded.
+    """
+    if (step_runs_recorder := StepRunsRecorder.from_movie(in_file_path, movie_segments, history_config, config)) is None:
+        yield from step_progress_results
+        return
+
+    last_progress_result: Optional[StepProgressResult] = None
+
+    def record(progress_result: StepProgressResult):
+        step_runs_recorder.record(progress_result.current_step, progress_result.current_step_elapsed_time)
+
+    for step_progress_result in step_progress_results:
+        if last_progress_result is not None and step_progress_result.current_step is not last_progress_result.current_step:
+            record(last_progress_result)
+
+        last_progress_result = step_progress_result
+        yield step_progress_result
+
+    if last_progress_result is not None:
+        record(last_progress_result)
+
+
+class EdlTimePredictor:
+    """Predict the processing time of EDLs, from the runs of the previous movies with the same encoder settings"""
+
+    def __init__(self, cost_models: dict[str, CostModel], config: Settings) -> None:
+        self._cost_models = cost_models
+        self._config = config
+
+    @classmethod
+    def from_config(cls, config: Settings) -> Optional['EdlTimePredictor']:
+        """None when the run history is disabled, or does not have enough runs yet"""
+        if (history_config := config.History) is None:
+            return None
+
+        run_history = RunHistory(history_config.db_path)
+
+        try:
+            cost_models = {
+                step_name: cost_model
+                for step_name in PREDICTED_STEPS_NAMES
+                if (cost_model := run_history.cost_model(step_name, config.ffmpeg_vcodec, config.ffmpeg_hwaccel, history_config.min_samples)) is not None
+            }
+        except sqlite3.Error as e:
+            logger.warning('Cannot read the run history: %s', e)
+            return None
+
+        if 'ProcessStep' not in cost_models:
+            return None
+
+        return cls(cost_models, config)
+
+    def predict(self, edl_path: Path) -> Optional[float]:
+        """Predicted processing time of an EDL in seconds, None if its movie cannot be probed"""
+        try:
+            segments = yaml.safe_load(edl_path.read_text(encoding='utf-8'))['segments']
+            features = movie_run_features(edl_path.with_suffix(''), MovieSegments(raw_segments=segments), self._config)
+        except (OSError, ValueError, KeyError, TypeError, yaml.YAMLError, ffmpeg.Error) as e:
+            logger.warning('Cannot predict the processing time of "%s": %s', edl_path, e)
+            return None
+
+        return sum(cost_model.predict(features) for cost_model in self._cost_models.values())
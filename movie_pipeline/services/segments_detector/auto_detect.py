@@ -36,6 +36,10 @@ class AutoDetect(BaseDetect):
 
         raise NoSuitableSegmentDetectorFound(f'No suitable segment detector found for "{str(movie_path)}"')
 
+    @property
+    def detector(self) -> BaseDetect:
+        return self._detector
+
     def should_proceed(self) -> bool:
         return False
 
@@ -1,7 +1,12 @@
+import concurrent.futures
+import copy
 from abc import ABC
 from pathlib import Path
 from typing import Callable, Generator, Optional, Type
 
+import numpy as np
+
+from ...lib.media_probe import probe_keyframes
 from ...lib.util import total_movie_duration
 from ...models.detected_segments import DetectedSegment
 from ...settings import Settings
@@ -9,8 +14,14 @@ from ...settings import Settings
 
 SegmentDetector = Type['BaseDetect'] | Callable[[Path, Settings], 'BaseDetect']
 
+# the keyframe interval is probed on this duration from the middle of the movie
+KEYFRAME_INTERVAL_PROBE_DURATION = 60.
+
 
 class BaseDetect(ABC):
+    # True if `detect_with_progress` can run on a time range of the movie (seek_ss, seek_t)
+    seekable = False
+
     def __init__(self, movie_path: Path, config: Settings) -> None:
         self._movie_path = movie_path
         self._config = config
@@ -18,6 +29,10 @@ class BaseDetect(ABC):
     def should_proceed(self) -> bool:
         ...
 
+    def copy_for_probe(self) -> 'BaseDetect':
+        """Return an independent detector sharing this one metadata"""
+        return copy.copy(self)
+
     def detect_with_progress(
         self,
         target_fps=5.0,
@@ -26,6 +41,89 @@ class BaseDetect(ABC):
     ) -> Generator[float, None, list[DetectedSegment]]:
         ...
 
+    def post_process_segments(self, raw_segments: list[DetectedSegment]) -> list[DetectedSegment]:
+        """Apply to the segments detected with `no_post_processing` the cleaning of a whole movie detection"""
+        return raw_segments
+
+
+def _run_sample_window_probe(detector: BaseDetect, position: float, window_duration: float) -> list[DetectedSegment]:
+    detect_progress = detector.detect_with_progress(seek_ss=position, seek_t=window_duration, no_post_processing=True)  # type: ignore
+
+    try:
+        while True:
+            next(detect_progress)
+    except StopIteration as e:
+        return e.value
+
+
+def sample_window_duration(movie_path: Path, duration: float, config: Settings) -> float:
+    """Duration of the windows probed by `should_proceed`
+
+    One second is enough when every sampled frame is decoded. With `keyframes_only`, a window
+    must span at least one GOP to decode a frame: it lasts twice the longest keyframe interval
+    found in the middle of the movie.
+    """
+    if not config.SegmentDetection.keyframes_only:
+        return 1.
+
+    probe_start = max(duration / 2 - KEYFRAME_INTERVAL_PROBE_DURATION / 2, 0.)
+    keyframes = probe_keyframes(movie_path, [(probe_start, probe_start + KEYFRAME_INTERVAL_PROBE_DURATION)])
+
+    if len(keyframes) < 2:
+        return KEYFRAME_INTERVAL_PROBE_DURATION
+
+    return max(1., 2 * max(next_keyframe - keyframe for keyframe, next_keyframe in zip(keyframes, keyframes[1:])))
+
+
+def probe_sample_windows(
+    detector: BaseDetect,
+    nframes: int,
+    framerate: float,
+    target_nframes: int,
+    max_workers: int,
+    window_duration: float = 1.
+) -> list[DetectedSegment]:
+    """Run the detector on `target_nframes` windows spread over the movie
+
+    The windows are probed concurrently, each one by a shallow copy of `detector`
+    so that the parent metadata is reused instead of probed again.
+
+    Args:
+        window_duration (float, optional): duration of each window in seconds (see `sample_window_duration`). Defaults to 1.
+
+    Returns:
+        list[DetectedSegment]: the first segment found in each window (if any)
+    """
+    positions = [frame_position / framerate for frame_position in range(0, nframes, nframes // target_nframes)]
+
+    with concurrent.futures.ThreadPoolExecutor(max_workers=max_workers) as executor:
+        windows_segments = executor.map(
+            lambda position: _run_sample_window_probe(detector.copy_for_probe(), position, window_duration),
+            positions
+        )
+
+        return [segments[0] for segments in windows_segments if len(segments) > 0]
+
+
+class SharedDecodeDetect(ABC):
+    """Detector able to subscribe to a shared decode of the movie (see `FrameBus`)"""
+
+    # pass-through filter inserted in the shared ffmpeg filter chain, its log lines are forwarded to `on_log_line`
+    shared_video_filter = ''
+
+    def begin_shared_decode(self) -> None:
+        ...
+
+    def on_frame(self, frame: np.ndarray, position_in_s: float, target_fps: float) -> bool:
+        """Handle a decoded gray frame, return True to stop the shared decode"""
+        return False
+
+    def on_log_line(self, line: str) -> None:
+        pass
+
+    def end_shared_decode(self) -> list[DetectedSegment]:
+        ...
+
 
 class DummyDetect(BaseDetect):
     def should_proceed(self) -> bool:
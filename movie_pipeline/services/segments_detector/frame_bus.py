@@ -0,0 +1,54 @@
+import logging
+from pathlib import Path
+from typing import Generator
+
+from ...lib.ffmpeg.ffmpeg_with_progress import ffmpeg_rawvideo_frame_producer
+from ...lib.media_probe import probe_media
+from ...models.detected_segments import DetectedSegment
+from ...settings import Settings
+from .core import SharedDecodeDetect
+
+logger = logging.getLogger(__name__)
+
+
+class FrameBus:
+    """Decode a movie once and feed every subscribed detector with the same frames
+
+    Each subscriber keeps its own state, the results are returned in subscription order.
+    """
+
+    def __init__(self, movie_path: Path, subscribers: list[SharedDecodeDetect], config: Settings) -> None:
+        self._movie_path = movie_path
+        self._subscribers = subscribers
+        self._config = config
+
+        media_probe = probe_media(movie_path, config)
+        self._duration = media_probe.duration
+        self._frame_size = media_probe.resolution
+
+    def _dispatch_log_line(self, line: str):
+        for subscriber in self._subscribers:
+            subscriber.on_log_line(line)
+
+    def run_with_progress(self, target_fps=5.0) -> Generator[float, None, list[list[DetectedSegment]]]:
+        for subscriber in self._subscribers:
+            subscriber.begin_shared_decode()
+
+        video_filter = ','.join(filter(bool, (subscriber.shared_video_filter for subscriber in self._subscribers)))
+
+        for frame, _, position_in_s in ffmpeg_rawvideo_frame_producer(
+            self._movie_path,
+            target_fps=target_fps,
+            frame_size=self._frame_size,
+            config=self._config,
+            video_filter=video_filter,
+            on_log_line=self._dispatch_log_line,
+            keyframes_only=self._config.SegmentDetection.keyframes_only
+        ):
+            should_exit = [subscriber.on_frame(frame, position_in_s, target_fps) for subscriber in self._subscribers]
+            yield min(position_in_s / self._duration, 1.)
+
+            if any(should_exit):
+                break
+
+        return [subscriber.end_shared_decode() for subscriber in self._subscribers]
@@ -67,7 +67,7 @@ def detect_segments(input: Input, config: Settings) -> Iterator[ReportedProgress
                 next_step=None
             )
 
-            for step_progress_result in segment_detector.process_all():
+            for step_progress_result in segment_detector.process_all(config.progress_max_rate):
                 elapsed_times[f'Item{index}'] = step_progress_result.current_step_elapsed_time
                 
                 yield {
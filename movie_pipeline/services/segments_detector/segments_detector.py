@@ -7,11 +7,14 @@ from rich.progress import Progress
 
 from ...lib.ffmpeg.ffmpeg_detect_filter import AudioCrossCorrelationDetect, CropDetect
 from ...lib.opencv.opencv_detect import OpenCVDetectWithInjectedTemplate, OpenCVTemplateDetect
+from ...lib.resource_tokens import acquire_job_resources, detection_cpu_tokens
 from ...lib.ui_factory import transient_task_progress
 from ...models.detected_segments import humanize_segments, merge_adjacent_segments
-from ...services.segments_detector.core import DummyDetect, SegmentDetector
+from ...services.segments_detector.core import DummyDetect, SegmentDetector, SharedDecodeDetect
 from ...settings import Settings
 from .auto_detect import AutoDetect
+from .frame_bus import FrameBus
+from .sharded_detect import ShardedDetect
 
 logger = logging.getLogger(__name__)
 
@@ -28,22 +31,50 @@ def run_segment_detectors_with_progress(movie_path: Path, selected_detectors_key
     detected_segments = {}
 
     try:
-        selected_detectors = { key: REGISTERED_SEGMENT_DETECTOR[key] for key in selected_detectors_key }
-        selected_detectors_size = len(selected_detectors)
+        # the whole detection of the movie holds the cpu tokens of all its shards and matcher processes
+        with acquire_job_resources(config, cpu=detection_cpu_tokens(config)):
+            selected_detectors = { key: REGISTERED_SEGMENT_DETECTOR[key] for key in selected_detectors_key }
+            selected_detectors_size = len(selected_detectors)
 
+            detector_instances = { key: value(movie_path, config) for key, value in selected_detectors.items() }
 
-        for detector_key, detector_value in selected_detectors.items():
-            logger.info('Running %s detection...', detector_key)
+            shared_decode_detectors = {
+                key: detector_instance
+                for key, detector_instance in detector_instances.items()
+                if isinstance(detector_instance, SharedDecodeDetect)
+            } if config.SegmentDetection.shared_decode else {}
 
-            detector_instance = detector_value(movie_path, config)
-            detect_progress = detector_instance.detect_with_progress()
+            if len(shared_decode_detectors) > 1:
+                logger.info('Running %s detection with a shared decode...', ', '.join(shared_decode_detectors))
 
-            try:
-                while True:
-                    progress_percent = next(detect_progress)
-                    yield progress_percent / float(selected_detectors_size)
-            except StopIteration as e:
-                detected_segments[detector_key] = humanize_segments(merge_adjacent_segments(e.value))
+                frame_bus = FrameBus(movie_path, list(shared_decode_detectors.values()), config)
+                detect_progress = frame_bus.run_with_progress()
+
+                try:
+                    while True:
+                        progress_percent = next(detect_progress)
+                        yield progress_percent * len(shared_decode_detectors) / float(selected_detectors_size)
+                except StopIteration as e:
+                    for detector_key, segments in zip(shared_decode_detectors, e.value):
+                        detected_segments[detector_key] = humanize_segments(merge_adjacent_segments(segments))
+
+            for detector_key, detector_instance in detector_instances.items():
+                if detector_key in detected_segments:
+                    continue
+
+                logger.info('Running %s detection...', detector_key)
+
+                if (nb_shards := config.SegmentDetection.detection_shards) > 1 and ShardedDetect.supports(detector_instance):
+                    detector_instance = ShardedDetect(detector_instance, movie_path, config, nb_shards)
+
+                detect_progress = detector_instance.detect_with_progress()
+
+                try:
+                    while True:
+                        progress_percent = next(detect_progress)
+                        yield progress_percent / float(selected_detectors_size)
+                except StopIteration as e:
+                    detected_segments[detector_key] = humanize_segments(merge_adjacent_segments(e.value))
 
     except Exception as e:
         logger.exception(e)
@@ -52,7 +83,7 @@ def run_segment_detectors_with_progress(movie_path: Path, selected_detectors_key
         if raise_error:
             raise e
 
-    return detected_segments
+    return { key: detected_segments[key] for key in selected_detectors_key if key in detected_segments }
 
 
 def run_segment_detectors(movie_path: Path, selected_detectors_key, config: Settings):
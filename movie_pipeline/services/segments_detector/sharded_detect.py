@@ -0,0 +1,105 @@
+import concurrent.futures
+import logging
+import multiprocessing
+import queue
+from pathlib import Path
+from typing import Generator
+
+from ...lib.media_probe import probe_media
+from ...lib.opencv.score_timeline import remove_score_timeline
+from ...models.detected_segments import DetectedSegment
+from ...settings import Settings
+from .auto_detect import AutoDetect
+from .core import BaseDetect
+
+logger = logging.getLogger(__name__)
+
+
+def _detect_shard(detector: BaseDetect, shard_index: int, seek_ss: float, seek_t: float, duration: float, progress_queue) -> list[DetectedSegment]:
+    detect_progress = detector.detect_with_progress(seek_ss=seek_ss, seek_t=seek_t, no_post_processing=True)  # type: ignore
+    reported_progress = 0.
+
+    try:
+        while True:
+            # detectors report the position in the shard relative to the whole movie
+            shard_progress = min(next(detect_progress) * duration / seek_t, 1.)
+
+            if shard_progress - reported_progress >= 0.01:
+                progress_queue.put((shard_index, shard_progress))
+                reported_progress = shard_progress
+    except StopIteration as e:
+        progress_queue.put((shard_index, 1.))
+
+        return [
+            DetectedSegment(start=round(segment['start'] + seek_ss, 2), end=round(segment['end'] + seek_ss, 2), duration=segment['duration'])
+            for segment in e.value
+        ]
+
+
+def stitch_shards_segments(shards_segments: list[list[DetectedSegment]], min_gap: float) -> list[DetectedSegment]:
+    """Join the raw segments of consecutive shards
+
+    The last segment of a shard and the first one of the next shard are merged back together when they are
+    separated by less than `min_gap`, they are a segment cut by the shard boundary.
+    """
+    stitched_segments: list[DetectedSegment] = []
+
+    for shard_segments in shards_segments:
+        for index, segment in enumerate(shard_segments):
+            if index == 0 and len(stitched_segments) > 0 and segment['start'] - stitched_segments[-1]['end'] <= min_gap:
+                last_segment = stitched_segments[-1]
+                last_segment['end'] = max(last_segment['end'], segment['end'])
+                last_segment['duration'] = round(last_segment['end'] - last_segment['start'], 2)
+            else:
+                stitched_segments.append(DetectedSegment(**segment))
+
+    return stitched_segments
+
+
+class ShardedDetect(BaseDetect):
+    """Split the movie in time ranges and run the detector on each of them in a process pool"""
+
+    def __init__(self, detector: BaseDetect, movie_path: Path, config: Settings, nb_shards: int) -> None:
+        super().__init__(movie_path, config)
+        self._detector = detector.detector if isinstance(detector, AutoDetect) else detector
+        self._nb_shards = nb_shards
+
+    @staticmethod
+    def supports(detector: BaseDetect) -> bool:
+        return (detector.detector if isinstance(detector, AutoDetect) else detector).seekable
+
+    def should_proceed(self) -> bool:
+        return self._detector.should_proceed()
+
+    def detect_with_progress(self, *_, **__) -> Generator[float, None, list[DetectedSegment]]:
+        duration = probe_media(self._movie_path, self._config).duration
+        shard_duration = duration / self._nb_shards
+
+        logger.info('Running %s on %d shards of %.0fs', type(self._detector).__name__, self._nb_shards, shard_duration)
+
+        shards_progress = [0.] * self._nb_shards
+
+        with multiprocessing.Manager() as manager, concurrent.futures.ProcessPoolExecutor(max_workers=self._nb_shards) as executor:
+            progress_queue = manager.Queue()
+            futures = [
+                executor.submit(_detect_shard, self._detector, index, index * shard_duration, shard_duration, duration, progress_queue)
+                for index in range(self._nb_shards)
+            ]
+
+            while not all(future.done() for future in futures) or not progress_queue.empty():
+                try:
+                    shard_index, shard_progress = progress_queue.get(timeout=0.5)
+                    shards_progress[shard_index] = shard_progress
+                    yield sum(shards_progress) / self._nb_shards
+                except queue.Empty:
+                    continue
+
+            shards_segments = [future.result() for future in futures]
+
+        stitched_segments = stitch_shards_segments(shards_segments, min_gap=self._config.SegmentDetection.segments_min_gap)
+
+        # the shards do not save the scores of the whole movie, the timeline of a previous detection is stale
+        remove_score_timeline(self._movie_path)
+
+        # same cleaning as a single detection of the whole movie
+        return self._detector.post_process_segments(stitched_segments)
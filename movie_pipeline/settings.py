@@ -1,8 +1,10 @@
+import os
 import shutil
+from pathlib import Path
 from typing import Literal, Optional
 
 from pydantic import BaseModel
-from pydantic.types import DirectoryPath, FilePath, PositiveInt, PositiveFloat
+from pydantic.types import DirectoryPath, FilePath, NonNegativeFloat, NonNegativeInt, PositiveInt, PositiveFloat
 from pydantic_settings import BaseSettings, SettingsConfigDict
 
 
@@ -24,10 +26,70 @@ class SegmentDetectionSettings(BaseModel):
     segments_min_duration: PositiveFloat = 120.0
     match_template_threshold: PositiveFloat = 0.8
     padding_duration: PositiveFloat = 1800.0
+    shared_decode: bool = True
+    sample_probe_workers: PositiveInt = 4
+    frame_sampling: Literal['full', 'adaptive'] = 'full'
+    coarse_fps: PositiveFloat = 0.2
+    detection_shards: PositiveInt = 1
+    frame_queue_size: NonNegativeInt = 8
+    frame_producer: Literal['deffcode', 'rawvideo'] = 'deffcode'
+    matcher_processes: NonNegativeInt = 0
+    keyframes_only: bool = False
+    detection_scale: PositiveFloat = 1.0
+    score_timeline: bool = True
+
+
+class EncodingSettings(BaseModel):
+    # smart: stream copy between the keyframes of each segment, only the edges are re-encoded with the
+    # source profile and level, falls back to reencode when the source or the encoder do not allow it
+    cut_mode: Literal['reencode', 'smart'] = 'reencode'
+    # input_seek: one input per segment, the discarded parts are not decoded
+    # select: one select/aselect chain per stream, for EDLs with many segments and audio streams
+    segments_graph: Literal['trim', 'input_seek', 'select'] = 'trim'
+    # split the re-encode in GOP aligned chunks of this duration (in seconds) encoded concurrently, 0 to disable
+    chunk_duration: NonNegativeFloat = 0.
+    chunk_workers: PositiveInt = 4
+    # chunks encoded by several satellites: a unit whose owner has not renewed its lease for this duration (in seconds)
+    # is taken over, it must exceed the clock skew between the satellites
+    unit_lease_timeout: PositiveFloat = 120.
+    # the merge of the chunks fails once no unit has been encoded for this duration (in seconds)
+    merge_timeout: PositiveFloat = 7200.
+
+
+class CacheSettings(BaseModel):
+    # encoded segments, reused when a movie is processed again with the same segment and encoder parameters
+    pieces_path: Optional[DirectoryPath] = None
+    max_size_in_gb: PositiveFloat = 50.0
+    # ffprobe results of the movies, reused by the next runs until a movie is modified
+    probes_path: Optional[DirectoryPath] = None
 
 
 class ProcessorSettings(BaseModel):
     nb_worker: PositiveInt
+    # static: EDLs bin-packed by file size up front, work_stealing: workers pull the most expensive EDL when free
+    scheduling: Literal['static', 'work_stealing'] = 'static'
+    # static scheduling only: back up a movie while the next one of the worker is encoded
+    overlap_steps: bool = False
+
+
+class ResourcesSettings(BaseModel):
+    # lock files of the tokens, shared by all the CLI and job processes of the host
+    locks_path: DirectoryPath
+    cpu_cores: PositiveInt = os.cpu_count() or 1
+    # concurrent hardware encoder sessions, limited by the driver of consumer cards
+    encoder_sessions: PositiveInt = 3
+    disk_io_slots: PositiveInt = 2
+    # cpu tokens taken by each encode or detection shard, and ffmpeg threads
+    threads_per_job: PositiveInt = 4
+    # maximum waiting time for the tokens in seconds, wait forever if not set
+    timeout: Optional[NonNegativeFloat] = None
+
+
+class HistorySettings(BaseModel):
+    # SQLite database of the steps elapsed times, created on first use
+    db_path: Path
+    # runs of a step needed before its elapsed time is predicted
+    min_samples: PositiveInt = 5
 
 
 class LoggerSettings(BaseModel):
@@ -42,11 +104,17 @@ class Settings(BaseSettings):
     Paths: PathSettings
     Archive: Optional[ArchiveSettings] = None
     SegmentDetection: SegmentDetectionSettings = SegmentDetectionSettings()
+    Encoding: EncodingSettings = EncodingSettings()
+    Cache: Optional[CacheSettings] = None
     Processor: Optional[ProcessorSettings] = None
+    Resources: Optional[ResourcesSettings] = None
+    History: Optional[HistorySettings] = None
     Logger: Optional[LoggerSettings] = None
 
     ffmpeg_path: FilePath = shutil.which('ffmpeg')  # type: ignore
     ffmpeg_hwaccel: HwAccel = 'none'
     ffmpeg_vcodec: VideoCodec = 'h264'
+    # progress updates sent per second and per job to the TUI or xyOps, 0 for unlimited
+    progress_max_rate: NonNegativeFloat = 2.0
 
     model_config = SettingsConfigDict(env_nested_delimiter='__')
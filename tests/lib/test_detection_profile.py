@@ -0,0 +1,26 @@
+import unittest
+
+from movie_pipeline.lib.opencv.opencv_detect import DetectionProfile
+
+
+class TestDetectionProfile(unittest.TestCase):
+    def test_crop_only(self):
+        profile = DetectionProfile((1500, 40, 320, 180))
+
+        self.assertEqual((320, 180), profile.frame_size((1920, 1080)))
+        self.assertEqual('crop=w=320:h=180:x=1500:y=40', profile.video_filter((1920, 1080)))
+        self.assertEqual((1510, 60), profile.to_source_location((10, 20)))
+
+    def test_scale_without_crop(self):
+        profile = DetectionProfile(None, 0.5)
+
+        self.assertEqual((960, 540), profile.frame_size((1920, 1080)))
+        self.assertEqual('scale=w=960:h=540:flags=area', profile.video_filter((1920, 1080)))
+        self.assertEqual((20, 40), profile.to_source_location((10, 20)))
+
+    def test_crop_then_scale(self):
+        profile = DetectionProfile((1500, 40, 320, 180), 0.5)
+
+        self.assertEqual((160, 90), profile.frame_size((1920, 1080)))
+        self.assertEqual('crop=w=320:h=180:x=1500:y=40,scale=w=160:h=90:flags=area', profile.video_filter((1920, 1080)))
+        self.assertEqual((1520, 80), profile.to_source_location((10, 20)))
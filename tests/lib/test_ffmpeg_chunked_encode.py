@@ -0,0 +1,59 @@
+import stat
+import sys
+import tempfile
+import unittest
+from pathlib import Path
+
+import ffmpeg
+
+from movie_pipeline.lib.ffmpeg.ffmpeg_chunked_encode import plan_chunks, run_commands_with_progress
+
+# stands for ffmpeg: write a progress block at 2s then exit with the code given as output file name
+FAKE_FFMPEG = f'''#!{sys.executable}
+import sys
+
+sys.stdout.write('frame=50\\nout_time=00:00:02.000000\\nprogress=continue\\n')
+sys.stdout.write('frame=100\\nout_time=00:00:04.000000\\nprogress=end\\n')
+sys.exit(int(sys.argv[-1]))
+'''
+
+
+class TestFFmpegChunkedEncode(unittest.TestCase):
+    def setUp(self) -> None:
+        self.temp_dir = tempfile.TemporaryDirectory()
+        self.ffmpeg_path = Path(self.temp_dir.name) / 'ffmpeg'
+        self.ffmpeg_path.write_text(FAKE_FFMPEG, encoding='utf-8')
+        self.ffmpeg_path.chmod(self.ffmpeg_path.stat().st_mode | stat.S_IEXEC)
+
+    def test_plan_chunks(self):
+        keyframes = [float(position) for position in range(0, 200, 2)]
+
+        self.assertEqual(
+            [(1., 62.), (62., 122.), (122., 190.), (195., 205.)],
+            plan_chunks([(1., 190.), (195., 205.)], keyframes, chunk_duration=60.)
+        )
+
+    def test_plan_chunks_merge_short_remaining_part(self):
+        keyframes = [float(position) for position in range(0, 200, 2)]
+
+        self.assertEqual([(0., 60.), (60., 140.)], plan_chunks([(0., 140.)], keyframes, chunk_duration=60.))
+
+    def test_plan_chunks_without_keyframes(self):
+        self.assertEqual([(0., 140.)], plan_chunks([(0., 140.)], [], chunk_duration=60.))
+
+    def test_run_commands_with_progress(self):
+        commands = [(ffmpeg.input('movie.ts').output('0'), 4.), (ffmpeg.input('movie.ts').output('0'), 4.)]
+
+        progress = list(run_commands_with_progress(commands, workers=2, cmd=[str(self.ffmpeg_path)]))
+
+        self.assertEqual(1., progress[-1])
+        self.assertEqual(sorted(progress), progress)
+
+    def test_run_commands_with_progress_raise_first_error(self):
+        commands = [(ffmpeg.input('movie.ts').output('0'), 4.), (ffmpeg.input('movie.ts').output('1'), 4.)]
+
+        with self.assertRaises(ffmpeg.Error):
+            list(run_commands_with_progress(commands, workers=2, cmd=[str(self.ffmpeg_path)]))
+
+    def tearDown(self) -> None:
+        self.temp_dir.cleanup()
@@ -0,0 +1,25 @@
+import tempfile
+import unittest
+from pathlib import Path
+
+from movie_pipeline.lib.ffmpeg.ffmpeg_filter_script import FFmpegFilterScriptCommand
+
+
+class TestFFmpegFilterScript(unittest.TestCase):
+    def test_compile_write_filtergraph_script(self):
+        with tempfile.TemporaryDirectory() as temp_dir:
+            script_path = Path(temp_dir) / 'filtergraph.txt'
+            command = FFmpegFilterScriptCommand(
+                in_path=Path('movie.ts'),
+                filtergraph="[0:v]select='lt(t,5)'[v];\n[0:1]aselect='lt(t,5)'[a0]",
+                output_labels=['v', 'a0'],
+                script_path=script_path,
+                dest_path=Path('movie.mp4'),
+                output_kwargs={'vcodec': 'libx264', 'dn': None}
+            )
+
+            self.assertEqual([
+                'ffmpeg', '-nostats', '-i', 'movie.ts', '-filter_complex_script', str(script_path),
+                '-map', '[v]', '-map', '[a0]', '-dn', '-vcodec', 'libx264', 'movie.mp4'
+            ], command.compile(cmd=['ffmpeg', '-nostats']))
+            self.assertEqual(command.filtergraph, script_path.read_text(encoding='utf-8'))
@@ -0,0 +1,106 @@
+import tempfile
+import unittest
+from pathlib import Path
+
+from movie_pipeline.lib.ffmpeg.ffmpeg_smart_cut import (
+    CutPiece,
+    can_smart_cut,
+    cut_piece_command,
+    edge_piece_mismatches,
+    keyframes_search_intervals,
+    plan_smart_cut,
+    write_concat_list
+)
+from movie_pipeline.lib.media_probe import MediaProbe
+from movie_pipeline.settings import Settings
+
+
+def get_media_probe(codec_name='h264', field_order='progressive', profile='High', level=40, **video_stream):
+    return MediaProbe({
+        'streams': [{
+            'index': 0, 'codec_type': 'video', 'codec_name': codec_name, 'field_order': field_order, 'avg_frame_rate': '25/1',
+            'profile': profile, 'level': level, 'pix_fmt': 'yuv420p', 'width': 1920, 'height': 1080, 'sample_aspect_ratio': '1:1',
+            **video_stream
+        }],
+        'format': {'duration': '3600.000000', 'start_time': '1.400000'}
+    })
+
+
+class TestFFmpegSmartCut(unittest.TestCase):
+    def test_plan_smart_cut(self):
+        keyframes = [0., 2., 4., 6., 8., 10., 12.]
+
+        self.assertEqual([
+            CutPiece(1., 2., copy=False), CutPiece(2., 8., copy=True), CutPiece(8., 9., copy=False),
+            # no complete GOP
+            CutPiece(10.5, 11.5, copy=False),
+            # starts on a keyframe
+            CutPiece(4., 6., copy=True), CutPiece(6., 7., copy=False),
+        ], plan_smart_cut([(1., 9.), (10.5, 11.5), (4.02, 7.)], keyframes, min_duration=.04))
+
+    def test_can_smart_cut(self):
+        config = Settings.model_construct(ffmpeg_vcodec='h264')  # type: ignore
+
+        self.assertTrue(can_smart_cut(get_media_probe(), config))
+        self.assertFalse(can_smart_cut(get_media_probe(codec_name='mpeg2video'), config))
+        self.assertFalse(can_smart_cut(get_media_probe(field_order='tt'), config))
+        self.assertFalse(can_smart_cut(get_media_probe(profile='High 4:2:2'), config))
+        self.assertFalse(can_smart_cut(get_media_probe(level=-99), config))
+        self.assertFalse(can_smart_cut(get_media_probe(), Settings.model_construct(ffmpeg_vcodec='h264', ffmpeg_hwaccel='cuda')))  # type: ignore
+
+    def test_cut_piece_command(self):
+        config = Settings.model_construct(ffmpeg_vcodec='h264', ffmpeg_hwaccel='none', Resources=None)  # type: ignore
+        media_probe = get_media_probe(profile='Main', level=31)
+
+        copy_args = cut_piece_command(Path('movie.ts'), CutPiece(2., 8., copy=True), Path('0001.ts'), media_probe, config).get_args()
+        edge_args = cut_piece_command(Path('movie.ts'), CutPiece(1., 2., copy=False), Path('0000.ts'), media_probe, config).get_args()
+
+        # video only MPEG-TS pieces, with the stream headers before each keyframe
+        for args in (copy_args, edge_args):
+            self.assertEqual(['-f', 'mpegts'], args[args.index('-f'):args.index('-f') + 2])
+            self.assertIn('-an', args)
+
+        self.assertEqual('h264_mp4toannexb,dump_extra', copy_args[copy_args.index('-bsf:v') + 1])
+        self.assertEqual('repeat-headers=1', edge_args[edge_args.index('-x264-params') + 1])
+        self.assertEqual(['main', '3.1', 'yuv420p'], [edge_args[edge_args.index(option) + 1] for option in ('-profile:v', '-level:v', '-pix_fmt')])
+
+    def test_edge_piece_mismatches(self):
+        self.assertEqual({}, edge_piece_mismatches(get_media_probe(), get_media_probe()))
+        self.assertEqual({'level': (40, 41), 'sample_aspect_ratio': ('1:1', '4:3')}, edge_piece_mismatches(get_media_probe(level=41, sample_aspect_ratio='4:3'), get_media_probe()))
+
+    def test_keyframes_search_intervals(self):
+        # the planner searches up to min_duration before and after each segment
+        self.assertEqual([(9.5, 40.), (70., 100.5), (0., 30.), (0., 5.5)], keyframes_search_intervals([(10., 100.), (0., 5.)], min_duration=.5))
+
+    def test_cut_pieces_do_not_overlap(self):
+        config = Settings.model_construct(ffmpeg_vcodec='h264', ffmpeg_hwaccel='none', Resources=None)  # type: ignore
+        media_probe = get_media_probe()
+        keyframes = [0., 2., 4., 6., 8., 10.]
+        frame_duration = 1. / media_probe.framerate
+        pieces = plan_smart_cut([(1., 9.)], keyframes, min_duration=frame_duration)
+        pieces_ranges = []
+
+        for piece in pieces:
+            args = cut_piece_command(Path('movie.ts'), piece, Path('piece.ts'), media_probe, config).get_args()
+            seek_position = float(args[args.index('-ss') + 1])
+
+            if piece.copy:
+                # the copy starts at the keyframe before the seek position, and ends at the `-to` position
+                start = max(keyframe for keyframe in keyframes if keyframe <= seek_position)
+                pieces_ranges.append((start, float(args[args.index('-to') + 1])))
+            else:
+                pieces_ranges.append((seek_position, seek_position + float(args[args.index('-t') + 1])))
+
+        self.assertEqual([False, True, False], [piece.copy for piece in pieces])
+
+        for (_, end), (next_start, _) in zip(pieces_ranges, pieces_ranges[1:]):
+            # no frame is kept twice, nor dropped
+            self.assertLessEqual(end, next_start)
+            self.assertGreater(end, next_start - frame_duration)
+
+    def test_write_concat_list(self):
+        with tempfile.TemporaryDirectory() as temp_dir:
+            list_path = Path(temp_dir) / 'pieces.txt'
+            write_concat_list([Path('/pieces/0000.ts'), Path("/pieces/l'0001.ts")], list_path)
+
+            self.assertEqual("file '/pieces/0000.ts'\nfile '/pieces/l'\\''0001.ts'\n", list_path.read_text(encoding='utf-8'))
@@ -0,0 +1,120 @@
+import asyncio
+import stat
+import sys
+import tempfile
+import unittest
+from pathlib import Path
+
+import ffmpeg
+
+from movie_pipeline.lib.ffmpeg.ffmpeg_with_progress import (
+    FFmpegMetadataContainer,
+    FFmpegMetadataReader,
+    async_ffmpeg_command_with_progress,
+    ffmpeg_command_with_progress
+)
+
+# stands for ffmpeg: write 2 progress blocks on stdout, some noise looking like progress on stderr
+FAKE_FFMPEG = f'''#!{sys.executable}
+import sys
+import time
+
+assert sys.argv[2:5] == ['-nostats', '-progress', 'pipe:1']
+sys.stderr.write('frame=  999 fps=0.0 q=-0.0 size=N/A time=99:00:00.00 bitrate=N/A speed=0x\\n')
+
+for frame, out_time, progress in [(10, '00:00:02.000000', 'continue'), (20, '00:00:04.000000', 'end')]:
+    sys.stdout.write(f'frame={{frame}}\\nfps=25.00\\ntotal_size=N/A\\nout_time_us=0\\nout_time={{out_time}}\\nspeed=2x\\nprogress={{progress}}\\n')
+    sys.stdout.flush()
+
+if sys.argv[1] == 'hang':
+    time.sleep(60)
+
+sys.exit(int(sys.argv[1]))
+'''
+
+
+class TestFFmpegWithProgress(unittest.TestCase):
+    def setUp(self) -> None:
+        self.temp_dir = tempfile.TemporaryDirectory()
+        self.ffmpeg_path = Path(self.temp_dir.name) / 'ffmpeg'
+        self.ffmpeg_path.write_text(FAKE_FFMPEG, encoding='utf-8')
+        self.ffmpeg_path.chmod(self.ffmpeg_path.stat().st_mode | stat.S_IEXEC)
+
+        self.command = ffmpeg.input('movie.ts').output('-', f='null')
+
+    def test_progress_from_progress_blocks(self):
+        items = list(ffmpeg_command_with_progress(self.command, cmd=[str(self.ffmpeg_path), '0']))
+
+        self.assertEqual([
+            {'frame': '10', 'fps': '25.00', 'time': '00:00:02.000000', 'speed': '2x'},
+            {'frame': '20', 'fps': '25.00', 'time': '00:00:04.000000', 'speed': '2x'}
+        ], items)
+
+    def test_progress_raise_ffmpeg_error(self):
+        with self.assertRaises(ffmpeg.Error):
+            list(ffmpeg_command_with_progress(self.command, cmd=[str(self.ffmpeg_path), '1']))
+
+    def test_async_progress_from_progress_blocks(self):
+        async def collect_progress():
+            return [item async for item in async_ffmpeg_command_with_progress(self.command, cmd=[str(self.ffmpeg_path), '0'])]
+
+        self.assertEqual(['00:00:02.000000', '00:00:04.000000'], [item['time'] for item in asyncio.run(collect_progress())])
+
+    def test_async_progress_timeout(self):
+        async def collect_progress():
+            return [item async for item in async_ffmpeg_command_with_progress(self.command, cmd=[str(self.ffmpeg_path), 'hang'], timeout=1)]
+
+        with self.assertRaises(TimeoutError):
+            asyncio.run(collect_progress())
+
+    def test_async_progress_cancel(self):
+        async def cancel_progress():
+            async def follow_progress():
+                async for _ in async_ffmpeg_command_with_progress(self.command, cmd=[str(self.ffmpeg_path), 'hang']):
+                    progress_started.set()
+
+            progress_started = asyncio.Event()
+            task = asyncio.create_task(follow_progress())
+            await progress_started.wait()
+            task.cancel()
+
+            with self.assertRaises(asyncio.CancelledError):
+                await task
+
+        asyncio.run(asyncio.wait_for(cancel_progress(), timeout=10))
+
+    def test_progress_stop_on_close(self):
+        progress = ffmpeg_command_with_progress(self.command, cmd=[str(self.ffmpeg_path), 'hang'])
+
+        self.assertEqual('00:00:02.000000', next(progress)['time'])
+        progress.close()
+
+    def test_metadata_reader_give_complete_blocks(self):
+        metadata_path = Path(self.temp_dir.name) / 'metadata.txt'
+        container = FFmpegMetadataContainer()
+        reader = FFmpegMetadataReader(metadata_path, container)
+
+        reader.read_available()
+
+        with metadata_path.open('w', encoding='utf-8') as metadata_file:
+            metadata_file.write('frame:0    pts:0       pts_time:0\nlavfi.cropdetect.w=1920\nlavfi.crop')
+            metadata_file.flush()
+            reader.read_available()
+
+            self.assertEqual([], container.blocks)
+
+            metadata_file.write('detect.h=800\nframe:1    pts:18000   pts_time:0.2\nlavfi.cropdetect.w=1920\n')
+            metadata_file.flush()
+            reader.read_available()
+
+            self.assertEqual([{'frame': '0', 'pts': '0', 'pts_time': '0', 'lavfi.cropdetect.w': '1920', 'lavfi.cropdetect.h': '800'}], container.blocks)
+
+            metadata_file.write('lavfi.cropdetect.h=1080\n')
+
+        reader.close()
+
+        self.assertEqual(2, len(container.blocks))
+        self.assertEqual({'frame': '1', 'pts': '18000', 'pts_time': '0.2', 'lavfi.cropdetect.w': '1920', 'lavfi.cropdetect.h': '1080'}, container.blocks[1])
+
+    def tearDown(self) -> None:
+        self.temp_dir.cleanup()
@@ -0,0 +1,47 @@
+import threading
+import unittest
+
+from movie_pipeline.lib.frame_pipeline import FramePipelineStats, prefetch_frames
+
+
+class TestFramePipeline(unittest.TestCase):
+    def setUp(self) -> None:
+        self.produced_count = 0
+        self.producer_closed = threading.Event()
+
+    def produce(self, count: int, error_at: int = -1):
+        try:
+            for index in range(count):
+                if index == error_at:
+                    raise ValueError('decoding error')
+
+                self.produced_count += 1
+                yield index
+        finally:
+            self.producer_closed.set()
+
+    def test_prefetch_keep_frames_order(self):
+        stats = FramePipelineStats()
+
+        self.assertEqual(list(range(100)), list(prefetch_frames(self.produce(100), 4, stats)))
+        self.assertEqual(100, stats.frames)
+        self.assertTrue(self.producer_closed.is_set())
+
+    def test_prefetch_stop_reader_on_close(self):
+        frames = prefetch_frames(self.produce(1000), 4, FramePipelineStats())
+
+        for index in frames:
+            if index == 10:
+                break
+
+        frames.close()
+
+        self.assertTrue(self.producer_closed.is_set())
+        # backpressure: the reader is at most one queue (plus the frame being put) ahead
+        self.assertLessEqual(self.produced_count, 10 + 1 + 4 + 1)
+
+    def test_prefetch_forward_producer_error(self):
+        frames = prefetch_frames(self.produce(100, error_at=50), 4, FramePipelineStats())
+
+        with self.assertRaises(ValueError):
+            list(frames)
@@ -0,0 +1,102 @@
+import json
+import os
+import tempfile
+import unittest
+from pathlib import Path
+from unittest.mock import patch
+
+import movie_pipeline.lib.media_probe as media_probe_module
+from movie_pipeline.lib.media_probe import MediaProbe, probe_cache_path, probe_keyframes, probe_media
+from movie_pipeline.settings import CacheSettings, Settings
+
+
+def get_ffprobe_output(duration='30.000000'):
+    return {
+        'streams': [
+            {'index': 0, 'codec_type': 'video', 'avg_frame_rate': '25/1', 'duration': duration, 'width': 1920, 'height': 1080, 'disposition': {'attached_pic': 0}},
+            {'index': 1, 'codec_type': 'audio', 'disposition': {'visual_impaired': 0, 'descriptions': 0}},
+            {'index': 2, 'codec_type': 'audio', 'disposition': {'visual_impaired': 1, 'descriptions': 0}}
+        ],
+        'format': {'duration': '30.040000'}
+    }
+
+
+class TestMediaProbe(unittest.TestCase):
+    def setUp(self) -> None:
+        self.temp_dir = tempfile.TemporaryDirectory()
+        self.media_path = Path(self.temp_dir.name) / 'channel 1_Movie Name_2022-11-1601-20.ts'
+        self.media_path.write_bytes(b'\0' * 16)
+
+        self.probes_path = Path(self.temp_dir.name) / 'probes'
+        self.probes_path.mkdir()
+        self.config = Settings.model_construct(Cache=CacheSettings(probes_path=self.probes_path))  # type: ignore
+
+    def test_probe_media(self):
+        with patch('ffmpeg.probe', return_value=get_ffprobe_output()):
+            media_probe = probe_media(self.media_path)
+
+        self.assertEqual(30., media_probe.duration)
+        self.assertEqual(25., media_probe.framerate)
+        self.assertEqual(750, media_probe.nframes)
+        self.assertEqual((1920, 1080), media_probe.resolution)
+        self.assertEqual([1, 2], [stream['index'] for stream in media_probe.audio_streams])
+
+    def test_probe_media_once(self):
+        with patch('ffmpeg.probe', return_value=get_ffprobe_output()) as mock_probe:
+            probe_media(self.media_path, self.config)
+            probe_media(self.media_path, self.config)
+
+        mock_probe.assert_called_once()
+        self.assertTrue(probe_cache_path(self.media_path, self.probes_path).exists())
+        # nothing is left next to the media
+        self.assertEqual([self.media_path], list(self.media_path.parent.glob(f'{self.media_path.name}*')))
+
+    def test_probe_media_reuse_persisted_probe(self):
+        with patch('ffmpeg.probe', return_value=get_ffprobe_output(duration='12.000000')):
+            probe_media(self.media_path, self.config)
+
+        persisted_probe = json.loads(probe_cache_path(self.media_path, self.probes_path).read_text(encoding='utf-8'))
+        self.assertEqual(self.media_path.stat().st_size, persisted_probe['size'])
+
+        # simulate a new pipeline run
+        media_probe_module._memory_cache.clear()
+
+        with patch('ffmpeg.probe', side_effect=AssertionError('should not probe again')):
+            self.assertEqual(12., probe_media(self.media_path, self.config).duration)
+
+    def test_probe_media_invalidated_on_change(self):
+        with patch('ffmpeg.probe', return_value=get_ffprobe_output()):
+            probe_media(self.media_path, self.config)
+
+        self.media_path.write_bytes(b'\0' * 32)
+        os.utime(self.media_path, ns=(0, 0))
+
+        with patch('ffmpeg.probe', return_value=get_ffprobe_output(duration='10.000000')) as mock_probe:
+            media_probe = probe_media(self.media_path, self.config)
+
+        mock_probe.assert_called_once()
+        self.assertEqual(10., media_probe.duration)
+
+    def test_probe_media_without_persistence(self):
+        with patch('ffmpeg.probe', return_value=get_ffprobe_output()):
+            probe_media(self.media_path)
+
+        self.assertEqual([], list(self.probes_path.iterdir()))
+
+    def test_probe_media_without_video(self):
+        media_probe = MediaProbe({'streams': [{'index': 0, 'codec_type': 'audio'}], 'format': {'duration': '30.0'}})
+
+        with self.assertRaisesRegex(ValueError, 'No video stream'):
+            media_probe.duration
+
+    def test_probe_keyframes(self):
+        packets = [{'pts_time': '3.400000', 'flags': 'K__'}, {'pts_time': '3.440000', 'flags': '___'}, {'pts_time': 'N/A', 'flags': 'K__'}]
+        ffprobe_output = {**get_ffprobe_output(), 'format': {'duration': '30.040000', 'start_time': '1.400000'}}
+
+        with patch('ffmpeg.probe', side_effect=[ffprobe_output, {'packets': packets}]) as mock_probe:
+            self.assertEqual([2.], probe_keyframes(self.media_path, [(0., 10.), (20., 25.)]))
+
+        self.assertEqual('1.4%11.4,21.4%26.4', mock_probe.call_args.kwargs['read_intervals'])
+
+    def tearDown(self) -> None:
+        self.temp_dir.cleanup()
@@ -0,0 +1,107 @@
+import os
+import tempfile
+import threading
+import time
+import unittest
+from pathlib import Path
+
+from movie_pipeline.lib.ffmpeg.ffmpeg_piece_cache import PieceCache, segment_piece_command
+
+
+class TestPieceCache(unittest.TestCase):
+    def setUp(self) -> None:
+        self.temp_dir = tempfile.TemporaryDirectory()
+        self.in_path = Path(self.temp_dir.name) / 'movie.ts'
+        self.in_path.write_bytes(b'\0' * 16)
+
+        self.cache_path = Path(self.temp_dir.name) / 'cache'
+        self.cache_path.mkdir()
+
+    def add_piece(self, piece_cache: PieceCache, key: str, size: int, last_used_time: float):
+        piece_cache.partial_path(key).write_bytes(b'\0' * size)
+        os.utime(piece_cache.commit(key), (last_used_time, last_used_time))
+
+    def test_key_depends_on_segment_and_encoder(self):
+        key = PieceCache.key(self.in_path, 10., 20., {'vcodec': 'libx264', 'crf': 23})
+
+        self.assertEqual(key, PieceCache.key(self.in_path, 10., 20., {'crf': 23, 'vcodec': 'libx264'}))
+        self.assertNotEqual(key, PieceCache.key(self.in_path, 10., 21., {'vcodec': 'libx264', 'crf': 23}))
+        self.assertNotEqual(key, PieceCache.key(self.in_path, 10., 20., {'vcodec': 'libx264', 'crf': 28}))
+
+    def test_segment_piece_is_video_only(self):
+        args = segment_piece_command(self.in_path, (10., 20.), Path('piece.mkv'), {'vcodec': 'libx264'}).get_args()
+
+        self.assertEqual(['-ss', '10.0', '-t', '10.0', '-i', str(self.in_path)], args[:6])
+        self.assertIn('-an', args)
+        self.assertNotIn('atrim', ' '.join(args))
+
+    def test_key_depends_on_input(self):
+        key = PieceCache.key(self.in_path, 10., 20., {})
+        self.in_path.write_bytes(b'\0' * 32)
+
+        self.assertNotEqual(key, PieceCache.key(self.in_path, 10., 20., {}))
+
+    def test_get_committed_piece(self):
+        piece_cache = PieceCache(self.cache_path, max_size=1024)
+
+        self.assertIsNone(piece_cache.get('a'))
+
+        piece_cache.partial_path('a').write_bytes(b'piece')
+        piece_cache.commit('a')
+
+        self.assertEqual(b'piece', piece_cache.get('a').read_bytes())  # type: ignore
+
+    def test_concurrent_writers_commit_whole_pieces(self):
+        piece_cache = PieceCache(self.cache_path, max_size=1024)
+        written = threading.Barrier(2)
+        partial_paths = []
+
+        def write_piece(content: bytes):
+            partial_path = piece_cache.partial_path('a')
+            partial_paths.append(partial_path)
+
+            with partial_path.open('wb') as f:
+                f.write(content[:4])
+                # both writers are encoding the piece at the same time
+                written.wait(timeout=5)
+                f.write(content[4:])
+
+            piece_cache.commit('a')
+
+        writers = [threading.Thread(target=write_piece, args=(content,)) for content in (b'first piece', b'second piece')]
+
+        for writer in writers:
+            writer.start()
+        for writer in writers:
+            writer.join()
+
+        self.assertNotEqual(partial_paths[0], partial_paths[1])
+        self.assertIn(piece_cache.get('a').read_bytes(), (b'first piece', b'second piece'))  # type: ignore
+        self.assertEqual(['a.mkv'], [path.name for path in self.cache_path.iterdir()])
+
+    def test_evict_least_recently_used_pieces(self):
+        piece_cache = PieceCache(self.cache_path, max_size=250, grace_period=60.)
+        now = time.time()
+
+        self.add_piece(piece_cache, 'old', 100, now - 3000)
+        self.add_piece(piece_cache, 'used', 100, now - 2000)
+        self.add_piece(piece_cache, 'new', 100, now - 1000)
+        piece_cache.get('used')
+
+        piece_cache.evict()
+
+        self.assertEqual(['new', 'used'], sorted(path.stem for path in self.cache_path.iterdir()))
+
+    def test_evict_keep_pieces_in_use(self):
+        piece_cache = PieceCache(self.cache_path, max_size=50, grace_period=60.)
+        now = time.time()
+
+        self.add_piece(piece_cache, 'old', 100, now - 3000)
+        self.add_piece(piece_cache, 'recent', 100, now - 10)
+
+        piece_cache.evict()
+
+        self.assertEqual(['recent'], [path.stem for path in self.cache_path.iterdir()])
+
+    def tearDown(self) -> None:
+        self.temp_dir.cleanup()
@@ -0,0 +1,85 @@
+import stat
+import sys
+import tempfile
+import unittest
+from pathlib import Path
+
+from movie_pipeline.lib.ffmpeg.ffmpeg_with_progress import ffmpeg_rawvideo_frame_producer
+from movie_pipeline.settings import Settings
+
+# stands for ffmpeg: write 5 gray frames of 4x2 pixels (filled with the frame index) to the rawvideo pipe
+FAKE_FFMPEG = f'''#!{sys.executable}
+import sys
+
+for index in range(5):
+    for byte in bytes([index]) * 8:
+        sys.stdout.buffer.write(bytes([byte]))
+        sys.stdout.buffer.flush()
+'''
+
+# stands for ffmpeg decoding only the key frames: log their timestamp with showinfo before writing them
+FAKE_KEYFRAMES_FFMPEG = f'''#!{sys.executable}
+import sys
+
+assert sys.argv[sys.argv.index('-i') - 2:sys.argv.index('-i')] == ['-skip_frame', 'nokey']
+assert sys.argv[sys.argv.index('-vf') + 1] == 'crop=w=4:h=2:x=0:y=0,showinfo'
+
+for index, pts_time in enumerate([0.0, 1.92, 4.48]):
+    sys.stderr.write(f'[Parsed_showinfo_1 @ 0x5581] n:{{index}} pts:{{int(pts_time * 90000)}} pts_time:{{pts_time}} duration:3600\\n')
+    sys.stderr.write(f'[Parsed_crop_0 @ 0x5580] frame {{index}}\\n')
+    sys.stderr.flush()
+    sys.stdout.buffer.write(bytes([index]) * 8)
+    sys.stdout.buffer.flush()
+'''
+
+
+class TestRawvideoFrameProducer(unittest.TestCase):
+    def setUp(self) -> None:
+        self.temp_dir = tempfile.TemporaryDirectory()
+        self.config = self.get_config(FAKE_FFMPEG)
+
+    def get_config(self, fake_ffmpeg: str) -> Settings:
+        ffmpeg_path = Path(self.temp_dir.name) / 'ffmpeg'
+        ffmpeg_path.write_text(fake_ffmpeg, encoding='utf-8')
+        ffmpeg_path.chmod(ffmpeg_path.stat().st_mode | stat.S_IEXEC)
+
+        return Settings.model_construct(ffmpeg_path=ffmpeg_path, ffmpeg_hwaccel='none')  # type: ignore
+
+    def test_frames_read_into_reused_buffers(self):
+        frames = []
+
+        for frame, frame_pos, position_in_s in ffmpeg_rawvideo_frame_producer(Path('movie.ts'), 5., (4, 2), self.config, buffer_count=2):
+            self.assertEqual((2, 4), frame.shape)
+            self.assertTrue((frame == frame_pos - 1).all())
+            self.assertAlmostEqual(frame_pos / 5., position_in_s)
+            frames.append(frame)
+
+        self.assertEqual(5, len(frames))
+        # the frames are written in turn in the 2 preallocated buffers
+        self.assertEqual(
+            [frames[0].ctypes.data, frames[1].ctypes.data] * 2 + [frames[0].ctypes.data],
+            [frame.ctypes.data for frame in frames]
+        )
+        self.assertNotEqual(frames[0].ctypes.data, frames[1].ctypes.data)
+
+    def test_keyframes_positions_from_timestamps(self):
+        config = self.get_config(FAKE_KEYFRAMES_FFMPEG)
+        log_lines = []
+
+        positions = [
+            (int(frame[0, 0]), frame_pos, position_in_s)
+            for frame, frame_pos, position_in_s in ffmpeg_rawvideo_frame_producer(
+                Path('movie.ts'), 5., (4, 2), config,
+                video_filter='crop=w=4:h=2:x=0:y=0',
+                on_log_line=log_lines.append,
+                keyframes_only=True
+            )
+        ]
+
+        self.assertEqual([(0, 1, 0.), (1, 2, 1.92), (2, 3, 4.48)], positions)
+        # the showinfo lines are consumed by the producer
+        self.assertEqual(3, len(log_lines))
+        self.assertTrue(all('Parsed_crop_0' in line for line in log_lines))
+
+    def tearDown(self) -> None:
+        self.temp_dir.cleanup()
@@ -0,0 +1,75 @@
+import multiprocessing
+import tempfile
+import unittest
+from pathlib import Path
+
+from movie_pipeline.lib.ffmpeg.ffmpeg_cli_presets import get_ffthreads_prefixes
+from movie_pipeline.lib.resource_tokens import ResourcePool, acquire_job_resources, detection_cpu_tokens
+from movie_pipeline.settings import ResourcesSettings, SegmentDetectionSettings, Settings
+
+
+def _hold_cpu_tokens(locks_path: Path, count: int, held, release):
+    with ResourcePool(locks_path, {'cpu': 4}, poll_interval=0.05).acquire(cpu=count):
+        held.set()
+        release.wait(10)
+
+
+class TestResourceTokens(unittest.TestCase):
+    def setUp(self) -> None:
+        self.temp_dir = tempfile.TemporaryDirectory()
+        self.locks_path = Path(self.temp_dir.name)
+        self.resource_pool = ResourcePool(self.locks_path, {'cpu': 4}, poll_interval=0.05)
+
+    def test_acquire_until_capacity(self):
+        with self.resource_pool.acquire(cpu=3) as held:
+            self.assertEqual({'cpu': 3}, held)
+
+            with self.assertRaises(TimeoutError):
+                with self.resource_pool.acquire(timeout=0.1, cpu=2):
+                    pass
+
+            with self.resource_pool.acquire(timeout=0.1, cpu=1) as held:
+                self.assertEqual({'cpu': 1}, held)
+
+        # released on exit
+        with self.resource_pool.acquire(timeout=0.1, cpu=4) as held:
+            self.assertEqual({'cpu': 4}, held)
+
+    def test_acquire_capped_to_capacity(self):
+        with self.resource_pool.acquire(timeout=0.1, cpu=16, encoder=1) as held:
+            self.assertEqual({'cpu': 4, 'encoder': 0}, held)
+
+    def test_acquire_shared_between_processes(self):
+        context = multiprocessing.get_context('spawn')
+        held, release = context.Event(), context.Event()
+        process = context.Process(target=_hold_cpu_tokens, args=(self.locks_path, 3, held, release))
+        process.start()
+
+        try:
+            self.assertTrue(held.wait(30))
+
+            with self.assertRaises(TimeoutError):
+                with self.resource_pool.acquire(timeout=0.1, cpu=2):
+                    pass
+        finally:
+            release.set()
+            process.join()
+
+        with self.resource_pool.acquire(timeout=1, cpu=2) as held_tokens:
+            self.assertEqual({'cpu': 2}, held_tokens)
+
+    def test_sharded_detection_tokens(self):
+        config = Settings.model_construct(
+            Resources=ResourcesSettings(locks_path=self.locks_path, cpu_cores=16, threads_per_job=2),
+            SegmentDetection=SegmentDetectionSettings.model_construct(detection_shards=3, matcher_processes=1)
+        )  # type: ignore
+
+        with acquire_job_resources(config, cpu=detection_cpu_tokens(config)) as held:
+            self.assertEqual({'cpu': 9}, held)
+
+    def test_ffthreads_prefixes(self):
+        self.assertEqual(['-threads', '2', '-filter_threads', '2'], get_ffthreads_prefixes(2))
+        self.assertEqual([], get_ffthreads_prefixes(None))
+
+    def tearDown(self) -> None:
+        self.temp_dir.cleanup()
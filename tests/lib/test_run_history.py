@@ -0,0 +1,50 @@
+import tempfile
+import unittest
+from pathlib import Path
+
+from movie_pipeline.lib.run_history import RunFeatures, RunHistory, StepRun
+
+
+def _features(kept_duration: float, segments_count=2) -> RunFeatures:
+    return RunFeatures(
+        input_duration=2 * kept_duration,
+        kept_duration=kept_duration,
+        width=1920,
+        height=1080,
+        codec='mpeg2video',
+        vcodec='h264',
+        hwaccel='none',
+        segments_count=segments_count
+    )
+
+
+class TestRunHistory(unittest.TestCase):
+    def setUp(self) -> None:
+        self.temp_dir = tempfile.TemporaryDirectory()
+        self.run_history = RunHistory(Path(self.temp_dir.name) / 'history.sqlite')
+
+    def test_record_step_runs(self):
+        self.run_history.record(StepRun('ProcessStep', _features(60.), elapsed_time=30., speed=2.))
+        self.run_history.record(StepRun('BackupStep', _features(60.), elapsed_time=5.))
+
+        self.assertEqual([StepRun('ProcessStep', _features(60.), elapsed_time=30., speed=2.)], self.run_history.step_runs('ProcessStep', 'h264', 'none'))
+        self.assertEqual([], self.run_history.step_runs('ProcessStep', 'hevc', 'none'))
+
+    def test_predict_elapsed_time(self):
+        # 0.25s per second of kept 1080p video, 3s per segment
+        for kept_duration, segments_count in [(600., 2), (1200., 4), (1800., 3), (3600., 5), (5400., 8)]:
+            elapsed_time = 0.25 * kept_duration + 3 * segments_count
+            self.run_history.record(StepRun('ProcessStep', _features(kept_duration, segments_count), elapsed_time=elapsed_time))
+
+        cost_model = self.run_history.cost_model('ProcessStep', 'h264', 'none', min_samples=5)
+
+        self.assertIsNotNone(cost_model)
+        self.assertAlmostEqual(0.25 * 2400 + 3 * 6, cost_model.predict(_features(2400., 6)), places=3)  # type: ignore
+
+    def test_no_prediction_without_enough_runs(self):
+        self.run_history.record(StepRun('ProcessStep', _features(60.), elapsed_time=30.))
+
+        self.assertIsNone(self.run_history.cost_model('ProcessStep', 'h264', 'none', min_samples=5))
+
+    def tearDown(self) -> None:
+        self.temp_dir.cleanup()
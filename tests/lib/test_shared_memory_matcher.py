@@ -0,0 +1,45 @@
+import unittest
+
+import cv2
+import numpy as np
+
+from movie_pipeline.lib.opencv.shared_memory_matcher import match_frames_in_processes
+
+
+def match(image, template):
+    _, max_val, _, max_loc = cv2.minMaxLoc(cv2.matchTemplate(image, template, cv2.TM_CCOEFF_NORMED))
+    return round(max_val, 4), max_loc
+
+
+class TestSharedMemoryMatcher(unittest.TestCase):
+    def setUp(self) -> None:
+        rng = np.random.default_rng(42)
+        self.template = rng.integers(0, 256, (8, 12), dtype=np.uint8)
+        self.frames = []
+
+        for frame_pos in range(1, 41):
+            frame = rng.integers(0, 256, (36, 64), dtype=np.uint8)
+
+            if frame_pos % 3 == 0:
+                frame[10:18, frame_pos:frame_pos + 12] = self.template
+
+            self.frames.append((frame, frame_pos, frame_pos / 5.))
+
+    def produce_frames(self):
+        # a single reused buffer, like the rawvideo frame producer
+        buffer = np.empty_like(self.frames[0][0])
+
+        for frame, frame_pos, position_in_s in self.frames:
+            np.copyto(buffer, frame)
+            yield buffer, frame_pos, position_in_s
+
+    def test_match_frames_in_processes(self):
+        expected_results = [
+            (frame_pos, position_in_s, match(frame, self.template))
+            for frame, frame_pos, position_in_s in self.frames
+        ]
+
+        actual_results = list(match_frames_in_processes(match, self.template, self.produce_frames(), processes=3))
+
+        self.assertEqual(expected_results, actual_results)
+        self.assertEqual((3, 10), actual_results[2][2][1])
@@ -0,0 +1,37 @@
+import unittest
+from dataclasses import dataclass
+from typing import Iterator
+
+from movie_pipeline.lib.step_runner.step import BaseStep
+
+
+@dataclass
+class FakeStep(BaseStep[None]):
+    def _perform(self) -> Iterator[float]:
+        yield from (i / 1000 for i in range(1000))
+
+
+class TestStep(unittest.TestCase):
+    def setUp(self) -> None:
+        self.root_step = FakeStep(
+            context=None,
+            description='first',
+            cost=1,
+            next_step=FakeStep(context=None, description='second', cost=3, next_step=None)
+        )
+
+    def test_process_all(self):
+        step_progress_results = list(self.root_step.process_all())
+
+        self.assertEqual(2002, len(step_progress_results))
+        self.assertEqual(1., step_progress_results[-1].total_percent)
+
+    def test_process_all_with_max_rate(self):
+        step_progress_results = list(self.root_step.process_all(max_rate=0.001))
+
+        # first and last progress of each step
+        self.assertEqual(
+            [('first', 0.), ('first', 1), ('second', 0.), ('second', 1)],
+            [(result.current_step.description, result.current_step_percent) for result in step_progress_results]
+        )
+        self.assertEqual([0., 0.25, 0.25, 1.], [result.total_percent for result in step_progress_results])
@@ -0,0 +1,114 @@
+import threading
+import unittest
+from dataclasses import dataclass, field
+from typing import Iterator
+
+from movie_pipeline.lib.step_runner.step import BaseStep
+from movie_pipeline.lib.step_runner.step_graph import StepGraph
+
+
+@dataclass
+class StepLog:
+    lock: threading.Lock = field(default_factory=threading.Lock)
+    performed: list[str] = field(default_factory=list)
+    running: int = 0
+    max_running: int = 0
+
+
+@dataclass
+class FakeStep(BaseStep[StepLog]):
+    resources = ('encode',)
+
+    def _perform(self) -> Iterator[float]:
+        with self.context.lock:
+            self.context.running += 1
+            self.context.max_running = max(self.context.max_running, self.context.running)
+
+        yield from (i / 10 for i in range(10))
+
+        with self.context.lock:
+            self.context.running -= 1
+            self.context.performed.append(self.description)
+
+
+@dataclass
+class BarrierStep(BaseStep[threading.Barrier]):
+    def _perform(self) -> Iterator[float]:
+        # only passes when the other step runs at the same time
+        self.context.wait(timeout=5)
+        yield 0.5
+
+
+@dataclass
+class FailingStep(BaseStep[None]):
+    def _perform(self) -> Iterator[float]:
+        raise ValueError('failed')
+        yield 0.
+
+
+class TestStepGraph(unittest.TestCase):
+    def setUp(self) -> None:
+        self.step_log = StepLog()
+
+    def test_process_chain(self):
+        step_graph = StepGraph()
+        step_graph.add_chain(FakeStep(
+            context=self.step_log,
+            description='first',
+            cost=1,
+            next_step=FakeStep(context=self.step_log, description='second', cost=3, next_step=None)
+        ))
+
+        step_progress_results = list(step_graph.process_all())
+
+        self.assertEqual(['first', 'second'], self.step_log.performed)
+        self.assertEqual(22, len(step_progress_results))
+        self.assertEqual(0.25, step_progress_results[10].total_percent)
+        self.assertEqual(1., step_progress_results[-1].total_percent)
+
+    def test_process_independent_steps_concurrently(self):
+        barrier = threading.Barrier(2)
+        step_graph = StepGraph(max_workers=2)
+        step_graph.add_step(BarrierStep(context=barrier, description='backup', cost=1, next_step=None))
+        step_graph.add_step(BarrierStep(context=barrier, description='encode', cost=1, next_step=None))
+
+        self.assertEqual(1., list(step_graph.process_all())[-1].total_percent)
+
+    def test_process_steps_holding_same_resource_one_at_a_time(self):
+        step_graph = StepGraph(max_workers=4)
+
+        for index in range(3):
+            step_graph.add_step(FakeStep(context=self.step_log, description=str(index), cost=1, next_step=None))
+
+        list(step_graph.process_all())
+
+        self.assertEqual(['0', '1', '2'], self.step_log.performed)
+        self.assertEqual(1, self.step_log.max_running)
+
+    def test_process_skip_dependents_of_failed_step(self):
+        step_graph = StepGraph()
+        failing_step = step_graph.add_step(FailingStep(context=None, description='failing', cost=1, next_step=None))
+        step_graph.add_step(FakeStep(context=self.step_log, description='dependent', cost=1, next_step=None), depends_on=[failing_step])
+        step_graph.add_step(FakeStep(context=self.step_log, description='independent', cost=1, next_step=None))
+
+        with self.assertRaises(ValueError):
+            list(step_graph.process_all())
+
+        self.assertEqual(['independent'], self.step_log.performed)
+
+    def test_process_with_max_rate(self):
+        step_graph = StepGraph()
+        step_graph.add_chain(FakeStep(
+            context=self.step_log,
+            description='first',
+            cost=1,
+            next_step=FakeStep(context=self.step_log, description='second', cost=1, next_step=None)
+        ))
+
+        step_progress_results = list(step_graph.process_all(max_rate=0.001))
+
+        # first and last progress of each step
+        self.assertEqual(
+            [('first', 0.), ('first', 1), ('second', 0.), ('second', 1)],
+            [(result.current_step.description, result.current_step_percent) for result in step_progress_results]
+        )
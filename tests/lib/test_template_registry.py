@@ -0,0 +1,52 @@
+import os
+import tempfile
+import unittest
+from pathlib import Path
+from unittest.mock import patch
+
+import cv2
+import numpy as np
+
+from movie_pipeline.lib.opencv.template_registry import load_channel_template
+
+
+class TestTemplateRegistry(unittest.TestCase):
+    def setUp(self) -> None:
+        self.temp_dir = tempfile.TemporaryDirectory()
+        self.template_path = Path(self.temp_dir.name) / 'channel 1.bmp'
+        cv2.imwrite(str(self.template_path), np.full((4, 6), 128, dtype=np.uint8))
+        self.template_path.with_suffix('.ini').write_text('[General]\nx1=10\ny1=20\nx2=110\ny2=70\n', encoding='utf-8')
+
+    def test_load_channel_template(self):
+        channel_template = load_channel_template(self.template_path)
+
+        self.assertEqual((4, 6), channel_template.image.shape)
+        self.assertEqual((10, 20, 100, 50), channel_template.crop_box)
+        self.assertFalse(channel_template.image.flags.writeable)
+
+    def test_load_scaled_channel_template(self):
+        channel_template = load_channel_template(self.template_path, scale=0.5)
+
+        self.assertEqual((2, 3), channel_template.image.shape)
+        # the crop box stays in source coordinates
+        self.assertEqual((10, 20, 100, 50), channel_template.crop_box)
+        self.assertEqual((4, 6), load_channel_template(self.template_path).image.shape)
+
+    def test_load_channel_template_once(self):
+        first_channel_template = load_channel_template(self.template_path)
+
+        with patch('cv2.imread', side_effect=AssertionError('should not read again')):
+            self.assertIs(first_channel_template, load_channel_template(self.template_path))
+
+    def test_reload_channel_template_on_change(self):
+        load_channel_template(self.template_path)
+
+        template_metadata_path = self.template_path.with_suffix('.ini')
+        template_metadata_path.write_text('[General]\nx1=0\ny1=0\nx2=50\ny2=40\n', encoding='utf-8')
+        stat = template_metadata_path.stat()
+        os.utime(template_metadata_path, ns=(stat.st_atime_ns, stat.st_mtime_ns + 1_000_000))
+
+        self.assertEqual((0, 0, 50, 40), load_channel_template(self.template_path).crop_box)
+
+    def tearDown(self) -> None:
+        self.temp_dir.cleanup()
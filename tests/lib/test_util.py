@@ -1,6 +1,7 @@
 import unittest
+from unittest.mock import patch
 
-from movie_pipeline.lib.util import progress_to_task_iterator
+from movie_pipeline.lib.util import RateLimiter, progress_to_task_iterator
 
 class TestUtil(unittest.TestCase):
     def test_progress_to_task_iterator(self):
@@ -10,3 +11,17 @@ class TestUtil(unittest.TestCase):
         actual_task_iterator = progress_to_task_iterator(progress_iterator)
 
         self.assertEqual(list(expected_task_iterator), list(actual_task_iterator))
+
+    def test_rate_limiter(self):
+        rate_limiter = RateLimiter(max_rate=2.)
+
+        with patch('time.perf_counter', side_effect=[0., 0.1, 0.3, 0.9, 1.]):
+            self.assertEqual(
+                [True, False, True, True, False],
+                [rate_limiter.ready(), rate_limiter.ready(), rate_limiter.ready(force=True), rate_limiter.ready(), rate_limiter.ready()]
+            )
+
+    def test_rate_limiter_disabled(self):
+        rate_limiter = RateLimiter(max_rate=0.)
+
+        self.assertTrue(all(rate_limiter.ready() for _ in range(10)))
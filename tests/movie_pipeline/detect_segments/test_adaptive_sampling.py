@@ -0,0 +1,152 @@
+import tempfile
+import unittest
+from pathlib import Path
+from unittest.mock import patch
+
+import numpy as np
+
+from movie_pipeline.lib.opencv.opencv_detect import OpenCVTemplateDetect, RealTimeDetectResult
+from movie_pipeline.lib.opencv.score_timeline import load_score_timeline, segments_from_score_timeline
+from movie_pipeline.lib.opencv.template_registry import ChannelTemplate
+from movie_pipeline.services.segments_detector.core import sample_window_duration
+from movie_pipeline.settings import SegmentDetectionSettings, Settings
+
+
+KEYFRAME_INTERVAL = 2.
+
+
+def _seek_range(ffprefixes: list[str], duration: float) -> tuple[float, float]:
+    seek_ss = float(ffprefixes[ffprefixes.index('-ss') + 1]) if '-ss' in ffprefixes else 0.
+    seek_t = float(ffprefixes[ffprefixes.index('-t') + 1]) if '-t' in ffprefixes else duration - seek_ss
+
+    return seek_ss, seek_t
+
+
+def _fake_frame(presence_intervals: list[tuple[float, float]], position: float):
+    presence = any(start <= position <= end for start, end in presence_intervals)
+    return np.full((1, 1), 1. if presence else 0., dtype=np.float32)
+
+
+def get_fake_frame_producer(presence_intervals: list[tuple[float, float]], duration: float, decoded_frames: list[float]):
+    def fake_frame_producer(input, target_fps, config, other_video_filter='', custom_ffparams={}):
+        seek_ss, seek_t = _seek_range(custom_ffparams.get('-ffprefixes', []), duration)
+
+        for frame_pos in range(1, round(seek_t * target_fps) + 1):
+            decoded_frames.append(seek_ss + frame_pos / target_fps)
+            yield _fake_frame(presence_intervals, seek_ss + frame_pos / target_fps), frame_pos, frame_pos / target_fps
+
+    return fake_frame_producer
+
+
+def get_fake_keyframe_producer(presence_intervals: list[tuple[float, float]], duration: float, decoded_frames: list[float]):
+    def fake_keyframe_producer(input, target_fps, frame_size, config, video_filter='', ffprefixes=[], buffer_count=1, keyframes_only=False):
+        assert keyframes_only
+        seek_ss, seek_t = _seek_range(ffprefixes, duration)
+
+        for frame_pos in range(0, int(seek_t / KEYFRAME_INTERVAL)):
+            decoded_frames.append(seek_ss + frame_pos * KEYFRAME_INTERVAL)
+            yield _fake_frame(presence_intervals, seek_ss + frame_pos * KEYFRAME_INTERVAL), frame_pos, frame_pos * KEYFRAME_INTERVAL
+
+    return fake_keyframe_producer
+
+
+class FakeMediaProbe:
+    duration = 3600.
+    nframes = 90000
+    framerate = 25.
+    resolution = (1920, 1080)
+
+
+class TestAdaptiveSampling(unittest.TestCase):
+    def setUp(self) -> None:
+        self.presence_intervals = [(62.4, 1260.8), (1267.2, 1500.), (1801.6, 3000.2), (3250., 3253.), (3400., 3600.)]
+        self.matched_frames_count = 0
+        self.decoded_frames: list[float] = []
+
+    def fake_match(self, image, template):
+        self.matched_frames_count += 1
+        return RealTimeDetectResult(float(image[0, 0]), (0, 0))
+
+    def detect(self, frame_sampling: str, movie_path=Path('movie.ts'), score_timeline=False):
+        config = Settings.model_construct(SegmentDetection=SegmentDetectionSettings(frame_sampling=frame_sampling, score_timeline=score_timeline))  # type: ignore
+        self.matched_frames_count = 0
+        self.decoded_frames = []
+
+        with (
+            patch('movie_pipeline.lib.opencv.opencv_detect.probe_media', return_value=FakeMediaProbe()),
+            patch('movie_pipeline.lib.opencv.opencv_detect.load_channel_template', return_value=ChannelTemplate(np.ones((1, 1), dtype=np.uint8), None)),
+            patch('movie_pipeline.lib.opencv.opencv_detect.ffmpeg_frame_producer', get_fake_frame_producer(self.presence_intervals, FakeMediaProbe.duration, self.decoded_frames)),
+            patch('movie_pipeline.lib.opencv.opencv_detect.ffmpeg_rawvideo_frame_producer', get_fake_keyframe_producer(self.presence_intervals, FakeMediaProbe.duration, self.decoded_frames)),
+            patch.object(OpenCVTemplateDetect, '_match', lambda _, image, template: self.fake_match(image, template))
+        ):
+            detector = OpenCVTemplateDetect(movie_path, Path('channel 1.bmp'), config)
+            detect_progress = detector.detect_with_progress()
+
+            try:
+                while True:
+                    next(detect_progress)
+            except StopIteration as e:
+                return e.value
+
+    def test_adaptive_sampling_give_same_segments_as_full_sampling(self):
+        expected_segments = self.detect('full')
+        full_sampling_matched_frames_count = self.matched_frames_count
+        full_sampling_decoded_frames_count = len(self.decoded_frames)
+
+        actual_segments = self.detect('adaptive')
+
+        self.assertEqual(3, len(expected_segments))
+        self.assertEqual(expected_segments, actual_segments)
+        self.assertLess(self.matched_frames_count * 10, full_sampling_matched_frames_count)
+        # the coarse pass only decodes the key frames
+        self.assertLess(len(self.decoded_frames) * 5, full_sampling_decoded_frames_count)
+
+    def test_adaptive_sampling_save_score_timeline(self):
+        with tempfile.TemporaryDirectory() as temp_dir:
+            movie_path = Path(temp_dir) / 'movie.ts'
+            segments = self.detect('adaptive', movie_path, score_timeline=True)
+            timeline = load_score_timeline(movie_path)
+
+        assert timeline is not None
+        detection_config = SegmentDetectionSettings()
+
+        # the timeline only has the sampled frames, resegmenting it gives the detected segments
+        self.assertGreaterEqual(self.matched_frames_count, timeline.shape[1])
+        self.assertEqual(segments, segments_from_score_timeline(
+            timeline,
+            threshold=detection_config.match_template_threshold,
+            min_gap=detection_config.segments_min_gap,
+            min_duration=detection_config.segments_min_duration
+        ))
+
+
+class TestKeyframesOnlyProbeWindows(unittest.TestCase):
+    def setUp(self) -> None:
+        self.config = Settings.model_construct(SegmentDetection=SegmentDetectionSettings(keyframes_only=True, score_timeline=False))  # type: ignore
+        self.keyframes = [position * KEYFRAME_INTERVAL for position in range(int(FakeMediaProbe.duration / KEYFRAME_INTERVAL))]
+
+    def fake_probe_keyframes(self, _, intervals: list[tuple[float, float]]):
+        return [keyframe for keyframe in self.keyframes if any(start <= keyframe <= end for start, end in intervals)]
+
+    def test_probe_windows_span_two_keyframe_intervals(self):
+        with patch('movie_pipeline.services.segments_detector.core.probe_keyframes', self.fake_probe_keyframes):
+            self.assertEqual(2 * KEYFRAME_INTERVAL, sample_window_duration(Path('movie.ts'), FakeMediaProbe.duration, self.config))
+
+        self.assertEqual(1., sample_window_duration(Path('movie.ts'), FakeMediaProbe.duration, Settings.model_construct(SegmentDetection=SegmentDetectionSettings())))  # type: ignore
+
+    def test_should_proceed_decode_key_frames_in_each_probe_window(self):
+        decoded_frames: list[float] = []
+
+        with (
+            patch('movie_pipeline.lib.opencv.opencv_detect.probe_media', return_value=FakeMediaProbe()),
+            patch('movie_pipeline.services.segments_detector.core.probe_keyframes', self.fake_probe_keyframes),
+            patch('movie_pipeline.lib.opencv.opencv_detect.load_channel_template', return_value=ChannelTemplate(np.ones((1, 1), dtype=np.uint8), None)),
+            patch('movie_pipeline.lib.opencv.opencv_detect.ffmpeg_rawvideo_frame_producer', get_fake_keyframe_producer([(0., FakeMediaProbe.duration)], FakeMediaProbe.duration, decoded_frames)),
+            patch.object(OpenCVTemplateDetect, '_match', lambda _, image, template: RealTimeDetectResult(float(image[0, 0]), (0, 0)))
+        ):
+            detector = OpenCVTemplateDetect(Path('movie.ts'), Path('channel 1.bmp'), self.config)
+
+            self.assertTrue(detector.should_proceed())
+
+        # a one-second window would not contain any key frame
+        self.assertEqual(20, len(decoded_frames))
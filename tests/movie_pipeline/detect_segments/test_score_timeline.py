@@ -0,0 +1,80 @@
+import json
+import tempfile
+import unittest
+from pathlib import Path
+from unittest.mock import patch
+
+import numpy as np
+
+from movie_pipeline.commands.resegment import command as resegment_command
+from movie_pipeline.lib.opencv.opencv_detect import OpenCVTemplateDetect
+from movie_pipeline.lib.opencv.score_timeline import load_score_timeline, save_score_timeline, segments_from_score_timeline
+from movie_pipeline.lib.opencv.template_registry import ChannelTemplate
+from movie_pipeline.settings import SegmentDetectionSettings, Settings
+
+
+class FakeMediaProbe:
+    duration = 3600.
+    nframes = 90000
+    framerate = 25.
+    resolution = (1920, 1080)
+
+
+class TestScoreTimeline(unittest.TestCase):
+    def setUp(self) -> None:
+        self.temp_dir = tempfile.TemporaryDirectory()
+        self.movie_path = Path(self.temp_dir.name) / 'channel 1_Movie Name_2022-11-1601-20.ts'
+        self.config = Settings.model_construct(SegmentDetection=SegmentDetectionSettings())  # type: ignore
+
+        # noisy scores around the threshold, with a few long presence intervals
+        rng = np.random.default_rng(7)
+        self.positions = [frame_pos / 5. for frame_pos in range(1, 3600 * 5 + 1)]
+        presence = [any(start <= position <= end for start, end in [(60., 1250.), (1263., 1500.), (1800., 1900.), (2000., 3000.), (3580., 3590.)]) for position in self.positions]
+        self.scores = list(np.clip(np.where(presence, 0.9, 0.2) + rng.normal(0, 0.08, len(self.positions)), 0, 1).astype(np.float32))
+
+    def detect_segments(self, scores: list[float]):
+        with (
+            patch('movie_pipeline.lib.opencv.opencv_detect.probe_media', return_value=FakeMediaProbe()),
+            patch('movie_pipeline.lib.opencv.opencv_detect.load_channel_template', return_value=ChannelTemplate(np.ones((1, 1), dtype=np.uint8), None))
+        ):
+            detector = OpenCVTemplateDetect(self.movie_path, Path('channel 1.bmp'), self.config)
+
+        for position, score in zip(self.positions, scores):
+            detector._record_score(position, float(score))
+
+        return detector._segments
+
+    def test_segments_from_score_timeline_give_same_segments_as_detection(self):
+        expected_segments = self.detect_segments(self.scores)
+
+        save_score_timeline(self.movie_path, self.positions, self.scores)
+        timeline = load_score_timeline(self.movie_path)
+        assert timeline is not None
+
+        actual_segments = segments_from_score_timeline(
+            timeline,
+            threshold=self.config.SegmentDetection.match_template_threshold,
+            min_gap=self.config.SegmentDetection.segments_min_gap,
+            min_duration=self.config.SegmentDetection.segments_min_duration
+        )
+
+        self.assertEqual(np.float32, timeline.dtype)
+        self.assertEqual(4, len(actual_segments))
+        self.assertEqual(expected_segments, actual_segments)
+
+    def test_resegment_folder(self):
+        save_score_timeline(self.movie_path, self.positions, self.scores)
+        segments_path = self.movie_path.with_suffix('.ts.segments.json')
+        segments_path.write_text(json.dumps({'crop': '00:00:10.000-00:10:00.000'}), encoding='utf-8')
+
+        self.config.SegmentDetection.segments_min_duration = 900.
+        resegment_command(Path(self.temp_dir.name), 'match_template', self.config)
+
+        # the noise moves some edges by a frame, the last segment is kept as during the detection
+        self.assertEqual(
+            {'crop': '00:00:10.000-00:10:00.000', 'match_template': '00:01:00.000-00:20:49.600,00:33:20.200-00:50:00.000,00:59:40.000-00:59:50.000'},
+            json.loads(segments_path.read_text(encoding='utf-8'))
+        )
+
+    def tearDown(self) -> None:
+        self.temp_dir.cleanup()
@@ -0,0 +1,139 @@
+import tempfile
+import unittest
+from pathlib import Path
+from typing import Optional
+from unittest.mock import patch
+
+from movie_pipeline.lib.ffmpeg.ffmpeg_detect_filter import CropDetect
+from movie_pipeline.lib.opencv.score_timeline import save_score_timeline, score_timeline_path
+from movie_pipeline.models.detected_segments import DetectedSegment
+from movie_pipeline.services.segments_detector.core import BaseDetect
+from movie_pipeline.services.segments_detector.sharded_detect import ShardedDetect, stitch_shards_segments
+from movie_pipeline.settings import SegmentDetectionSettings, Settings
+
+
+PRESENCE_INTERVALS = [(62.4, 1260.8), (1267.2, 1500.), (1801.6, 3000.2), (3250., 3253.)]
+DURATION = 3600.
+
+
+class FakeSeekableDetect(BaseDetect):
+    seekable = True
+
+    def detect_with_progress(
+        self,
+        target_fps=1.0,
+        seek_ss: Optional[float] = None,
+        seek_t: Optional[float] = None,
+        no_post_processing=False
+    ):
+        seek_ss = seek_ss or 0.
+        seek_t = seek_t or DURATION - seek_ss
+        segments: list[DetectedSegment] = []
+
+        for frame_pos in range(1, round(seek_t * target_fps) + 1):
+            position = frame_pos / target_fps
+
+            if any(start <= seek_ss + position <= end for start, end in PRESENCE_INTERVALS):
+                if len(segments) == 0 or position - segments[-1]['end'] > self._config.SegmentDetection.segments_min_gap:
+                    # like the OpenCV detectors, the short segments are dropped once the next one starts
+                    if not no_post_processing:
+                        segments = [segment for segment in segments if segment['duration'] > self._config.SegmentDetection.segments_min_duration]
+                    segments.append({'start': position, 'end': position, 'duration': 0})
+                else:
+                    segments[-1]['end'] = position
+                    segments[-1]['duration'] = round(position - segments[-1]['start'], 2)
+
+            yield position / DURATION
+
+        return segments
+
+    def post_process_segments(self, raw_segments: list[DetectedSegment]) -> list[DetectedSegment]:
+        min_duration = self._config.SegmentDetection.segments_min_duration
+        return [segment for segment in raw_segments[:-1] if segment['duration'] > min_duration] + raw_segments[-1:]
+
+
+class FakeMediaProbe:
+    duration = DURATION
+
+
+class TestShardedDetect(unittest.TestCase):
+    def setUp(self) -> None:
+        self.config = Settings.model_construct(SegmentDetection=SegmentDetectionSettings())  # type: ignore
+
+    def test_stitch_shards_segments(self):
+        shards_segments: list[list[DetectedSegment]] = [
+            [{'start': 10., 'end': 890., 'duration': 880.}, {'start': 895., 'end': 900., 'duration': 5.}],
+            [{'start': 900.5, 'end': 1000., 'duration': 99.5}, {'start': 1003., 'end': 1005., 'duration': 2.}]
+        ]
+
+        # only the segments around the shard boundary are merged, the raw segments are not cleaned
+        self.assertEqual(
+            [{'start': 10., 'end': 890., 'duration': 880.}, {'start': 895., 'end': 1000., 'duration': 105.}, {'start': 1003., 'end': 1005., 'duration': 2.}],
+            stitch_shards_segments(shards_segments, min_gap=6.4)
+        )
+
+    def test_sharded_detect_give_same_segments_as_single_detect(self):
+        detector = FakeSeekableDetect(Path('movie.ts'), self.config)
+        detect_progress = detector.detect_with_progress()
+
+        try:
+            while True:
+                next(detect_progress)
+        except StopIteration as e:
+            expected_segments = e.value
+
+        with patch('movie_pipeline.services.segments_detector.sharded_detect.probe_media', return_value=FakeMediaProbe()):
+            sharded_detector = ShardedDetect(detector, Path('movie.ts'), self.config, nb_shards=4)
+            detect_progress = sharded_detector.detect_with_progress()
+            progress_values = []
+
+            try:
+                while True:
+                    progress_values.append(next(detect_progress))
+            except StopIteration as e:
+                actual_segments = e.value
+
+        # the last segment is short, the single detection keeps it
+        self.assertEqual(3, len(expected_segments))
+        self.assertEqual(expected_segments, actual_segments)
+        self.assertEqual(sorted(progress_values), progress_values)
+        self.assertAlmostEqual(1., progress_values[-1])
+
+    def test_sharded_detect_remove_stale_score_timeline(self):
+        with tempfile.TemporaryDirectory() as temp_dir:
+            movie_path = Path(temp_dir) / 'movie.ts'
+            save_score_timeline(movie_path, [1., 2.], [0.9, 0.9])
+
+            with patch('movie_pipeline.services.segments_detector.sharded_detect.probe_media', return_value=FakeMediaProbe()):
+                detect_progress = ShardedDetect(FakeSeekableDetect(movie_path, self.config), movie_path, self.config, nb_shards=2).detect_with_progress()
+
+                try:
+                    while True:
+                        next(detect_progress)
+                except StopIteration:
+                    pass
+
+            self.assertFalse(score_timeline_path(movie_path).exists())
+
+    def test_stitched_crop_segments_give_same_segments_as_map_out(self):
+        with patch('movie_pipeline.lib.ffmpeg.ffmpeg_detect_filter.probe_media'):
+            detector = CropDetect(Path('movie.ts'), self.config)
+
+        raw_segments: list[DetectedSegment] = [
+            {'start': 10., 'end': 890., 'duration': 880.},
+            {'start': 1000., 'end': 1100., 'duration': 100.},
+            {'start': 1200., 'end': 2500., 'duration': 1300.},
+            {'start': 3500., 'end': 3503., 'duration': 3.}
+        ]
+        detector.metadata_container._segments = raw_segments
+        expected_segments = detector._map_out([])
+
+        # the third segment is cut by the boundary of two shards at 1800s
+        shards_segments: list[list[DetectedSegment]] = [
+            [*raw_segments[:2], {'start': 1200., 'end': 1799.8, 'duration': 599.8}],
+            [{'start': 1800., 'end': 2500., 'duration': 700.}, raw_segments[3]]
+        ]
+        stitched_segments = stitch_shards_segments(shards_segments, min_gap=self.config.SegmentDetection.segments_min_gap)
+
+        self.assertEqual(2, len(expected_segments))
+        self.assertEqual(expected_segments, detector.post_process_segments(stitched_segments))
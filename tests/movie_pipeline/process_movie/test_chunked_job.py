@@ -0,0 +1,151 @@
+import multiprocessing
+import os
+import socket
+import stat
+import sys
+import tempfile
+import time
+import unittest
+from collections import deque
+from pathlib import Path
+from types import SimpleNamespace
+from typing import cast
+
+import ffmpeg
+
+from movie_pipeline.services.movie_file_processor.chunked_job import ChunkedJob, MergeChunksStep, claim, encode_unit_with_progress
+from movie_pipeline.services.movie_file_processor.movie_file_processor_step import MovieFileProcessorContext
+from movie_pipeline.settings import EncodingSettings, Settings
+
+# stands for ffmpeg: write the output file and log the encoded unit
+FAKE_FFMPEG = f'''#!{sys.executable}
+import os
+import sys
+import time
+
+output_path = sys.argv[-1]
+time.sleep(.05)
+
+if os.environ.get('FAKE_FFMPEG_FAIL'):
+    sys.exit(1)
+
+with open(os.path.join(os.path.dirname(output_path), 'encoded.log'), 'a') as log_file:
+    log_file.write(os.path.basename(output_path) + '\\n')
+
+with open(output_path, 'w') as output_file:
+    output_file.write('encoded')
+
+sys.stdout.write('out_time=00:00:10.000000\\nprogress=end\\n')
+'''
+
+
+def run_satellite(chunks_path: Path, config: Settings):
+    for unit in ChunkedJob.load(chunks_path).units:
+        deque(encode_unit_with_progress(chunks_path, unit, config), maxlen=0)
+
+
+class TestChunkedJob(unittest.TestCase):
+    def setUp(self) -> None:
+        self.temp_dir = tempfile.TemporaryDirectory()
+        self.chunks_path = Path(self.temp_dir.name) / 'movie.ts.chunks'
+        self.chunks_path.mkdir()
+
+        bin_path = Path(self.temp_dir.name) / 'bin'
+        bin_path.mkdir()
+        ffmpeg_path = bin_path / 'ffmpeg'
+        ffmpeg_path.write_text(FAKE_FFMPEG, encoding='utf-8')
+        ffmpeg_path.chmod(ffmpeg_path.stat().st_mode | stat.S_IEXEC)
+
+        self.path_env = os.environ['PATH']
+        os.environ['PATH'] = f'{bin_path}{os.pathsep}{self.path_env}'
+
+        self.job = ChunkedJob(
+            in_file_path=Path(self.temp_dir.name) / 'movie.ts',
+            raw_segments='00:00:03.370-00:00:30.000,00:01:00.000-00:02:00.000,',
+            chunks=[(3.37, 20.), (20., 30.), (60., 90.), (90., 120.)],
+            audio_streams=[{'index': 1}]
+        )
+        self.job.save(self.chunks_path)
+
+        self.config = Settings.model_construct(ffmpeg_hwaccel='none', ffmpeg_vcodec='h264')  # type: ignore
+
+    def test_claim_once(self):
+        owner_path = self.chunks_path / '0000.owner'
+
+        self.assertTrue(claim(owner_path))
+        self.assertFalse(claim(owner_path))
+
+    def test_take_over_expired_lease(self):
+        owner_path = self.chunks_path / '0000.owner'
+        self.assertTrue(claim(owner_path))
+
+        self.assertFalse(claim(owner_path, lease_timeout=60.))
+
+        expired_time = time.time() - 120.
+        os.utime(owner_path, (expired_time, expired_time))
+
+        self.assertTrue(claim(owner_path, lease_timeout=60.))
+        self.assertFalse(claim(owner_path, lease_timeout=60.))
+
+    def test_take_over_lease_of_dead_process(self):
+        owner_path = self.chunks_path / '0000.owner'
+        dead_process = multiprocessing.get_context('spawn').Process(target=time.sleep, args=(0,))
+        dead_process.start()
+        dead_process.join()
+
+        owner_path.write_text(f'{socket.gethostname()} {dead_process.pid}\n', encoding='utf-8')
+
+        self.assertTrue(claim(owner_path, lease_timeout=60.))
+        self.assertEqual(f'{socket.gethostname()} {os.getpid()}', owner_path.read_text(encoding='utf-8').strip())
+
+    def test_skip_unit_owned_by_another_satellite(self):
+        self.assertTrue(claim(self.chunks_path / '0000.owner'))
+
+        self.assertEqual([], list(encode_unit_with_progress(self.chunks_path, '0000', self.config)))
+        self.assertFalse(self.job.output_path(self.chunks_path, '0000').exists())
+
+    def test_merge_fails_when_no_unit_is_encoded(self):
+        config = Settings.model_construct(ffmpeg_hwaccel='none', ffmpeg_vcodec='h264', Encoding=EncodingSettings(merge_timeout=.05))  # type: ignore
+        context = cast(MovieFileProcessorContext, SimpleNamespace(in_file_path=self.job.in_file_path, config=config))
+        merge_step = MergeChunksStep(context=context, description='merge', cost=1, next_step=None)
+        merge_step.poll_interval = .01
+
+        with self.assertRaises(TimeoutError):
+            deque(merge_step._perform(), maxlen=0)
+
+        # another merge job can be started
+        self.assertFalse((self.chunks_path / 'merge.owner').exists())
+
+    def test_two_satellites_encode_each_unit_once(self):
+        context = multiprocessing.get_context('spawn')
+        satellites = [context.Process(target=run_satellite, args=(self.chunks_path, self.config)) for _ in range(2)]
+
+        for satellite in satellites:
+            satellite.start()
+
+        for satellite in satellites:
+            satellite.join(timeout=60)
+            self.assertEqual(0, satellite.exitcode)
+
+        encoded_units = (self.chunks_path / 'encoded.log').read_text().split()
+
+        self.assertEqual(['0000', '0001', '0002', '0003', 'audio'], self.job.units)
+        self.assertEqual(self.job.units, sorted(encoded_unit.split('.')[0] for encoded_unit in encoded_units))
+        self.assertTrue(all(self.job.output_path(self.chunks_path, unit).exists() for unit in self.job.units))
+
+    def test_release_unit_on_failure(self):
+        os.environ['FAKE_FFMPEG_FAIL'] = '1'
+
+        try:
+            with self.assertRaises(ffmpeg.Error):
+                deque(encode_unit_with_progress(self.chunks_path, '0000', self.config), maxlen=0)
+        finally:
+            del os.environ['FAKE_FFMPEG_FAIL']
+
+        # another satellite can encode it again
+        self.assertFalse((self.chunks_path / '0000.owner').exists())
+        self.assertFalse(self.job.output_path(self.chunks_path, '0000').exists())
+
+    def tearDown(self) -> None:
+        os.environ['PATH'] = self.path_env
+        self.temp_dir.cleanup()
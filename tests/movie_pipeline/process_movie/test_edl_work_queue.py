@@ -0,0 +1,47 @@
+import tempfile
+import unittest
+from pathlib import Path
+
+from movie_pipeline.services.movie_file_processor.runner.folder.edl_work_queue import EdlWorkQueue, edl_cost
+
+
+class TestEdlWorkQueue(unittest.TestCase):
+    def setUp(self) -> None:
+        self.temp_dir = tempfile.TemporaryDirectory()
+        self.folder_path = Path(self.temp_dir.name)
+
+        # no movie next to the EDLs, their cost is the kept duration at the default resolution
+        for name, segments in [('short', '00:00:00.000-00:00:10.000,'), ('long', '00:00:00.000-00:01:00.000,'), ('medium', '00:00:00.000-00:00:30.000,')]:
+            self._write_edl(name, segments)
+
+        self.work_queue = EdlWorkQueue(self.folder_path, '.yml')
+
+    def _write_edl(self, name: str, segments: str):
+        (self.folder_path / f'{name}.mp4.yml').write_text(f'filename: {name}.mp4\nsegments: {segments}\n', encoding='utf-8')
+
+    def test_edl_cost(self):
+        self.assertEqual(60. * 1920 * 1080, edl_cost(self.folder_path / 'long.mp4.yml'))
+
+    def test_next_edl_most_expensive_first(self):
+        self.assertEqual('long.mp4.pending_yml_0', self.work_queue.next_edl(0).name)
+        self.assertEqual('medium.mp4.pending_yml_1', self.work_queue.next_edl(1).name)
+        self.assertEqual('short.mp4.pending_yml_0', self.work_queue.next_edl(0).name)
+        self.assertIsNone(self.work_queue.next_edl(1))
+        self.assertEqual(3, self.work_queue.known_count)
+
+    def test_next_edl_added_during_run(self):
+        self.work_queue.next_edl(0)
+        self._write_edl('longest', '00:00:00.000-00:10:00.000,')
+
+        self.assertEqual('longest.mp4.pending_yml_1', self.work_queue.next_edl(1).name)
+        self.assertEqual(4, self.work_queue.known_count)
+
+    def test_next_edl_taken_by_another_runner(self):
+        self.work_queue.next_edl(0)
+        (self.folder_path / 'medium.mp4.yml').unlink()
+
+        self.assertEqual('short.mp4.pending_yml_0', self.work_queue.next_edl(0).name)
+        self.assertIsNone(self.work_queue.next_edl(0))
+
+    def tearDown(self) -> None:
+        self.temp_dir.cleanup()
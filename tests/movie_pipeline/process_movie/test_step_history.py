@@ -0,0 +1,132 @@
+import tempfile
+import unittest
+from dataclasses import dataclass
+from pathlib import Path
+from typing import Iterator
+from unittest.mock import patch
+
+from movie_pipeline.lib.run_history import RunFeatures, RunHistory
+from movie_pipeline.lib.step_runner.step import BaseStep
+from movie_pipeline.lib.step_runner.step_graph import StepGraph
+from movie_pipeline.models.movie_segments import MovieSegments
+from movie_pipeline.services.movie_file_processor.step_history import StepRunsRecorder, record_step_runs
+from movie_pipeline.settings import HistorySettings, Settings
+
+FEATURES = RunFeatures(
+    input_duration=120.,
+    kept_duration=60.,
+    width=1920,
+    height=1080,
+    codec='mpeg2video',
+    vcodec='h264',
+    hwaccel='none',
+    segments_count=1
+)
+
+
+@dataclass
+class CopyStep(BaseStep[None]):
+    def _perform(self) -> Iterator[float]:
+        # like the backup step, the step reports its own completion before being validated
+        yield 0.5
+        yield 1
+
+
+@dataclass
+class EncodeStep(BaseStep[None]):
+    def _perform(self) -> Iterator[float]:
+        yield from (i / 4 for i in range(5))
+
+
+@dataclass
+class FailingStep(BaseStep[None]):
+    def _perform(self) -> Iterator[float]:
+        yield 1
+
+    def _after_perform(self) -> None:
+        raise ValueError('invalid output')
+
+
+class TestRecordStepRuns(unittest.TestCase):
+    def setUp(self) -> None:
+        self.temp_dir = tempfile.TemporaryDirectory()
+        self.history_config = HistorySettings(db_path=Path(self.temp_dir.name) / 'history.sqlite')
+        self.run_history = RunHistory(self.history_config.db_path)
+
+    def process_all(self, root_step: BaseStep):
+        with patch('movie_pipeline.services.movie_file_processor.step_history.movie_run_features', return_value=FEATURES):
+            return list(record_step_runs(
+                root_step.process_all(),
+                Path('movie.ts'),
+                MovieSegments(raw_segments='00:00:00.00-00:01:00.00'),
+                self.history_config,
+                Settings.model_construct()  # type: ignore
+            ))
+
+    def test_record_one_run_by_step(self):
+        step_progress_results = self.process_all(CopyStep(
+            context=None,
+            description='copy',
+            cost=1,
+            next_step=EncodeStep(context=None, description='encode', cost=1, next_step=None)
+        ))
+
+        copy_runs = self.run_history.step_runs('CopyStep', 'h264', 'none')
+        encode_runs = self.run_history.step_runs('EncodeStep', 'h264', 'none')
+
+        self.assertEqual(1, len(copy_runs))
+        self.assertEqual(1, len(encode_runs))
+        # recorded from the last progress of each step, after its validation
+        self.assertEqual(step_progress_results[2].current_step_elapsed_time, copy_runs[0].elapsed_time)
+        self.assertEqual(step_progress_results[-1].current_step_elapsed_time, encode_runs[0].elapsed_time)
+
+    def test_failed_step_is_not_recorded(self):
+        with self.assertRaises(ValueError):
+            self.process_all(CopyStep(
+                context=None,
+                description='copy',
+                cost=1,
+                next_step=FailingStep(context=None, description='failing', cost=1, next_step=None)
+            ))
+
+        self.assertEqual(1, len(self.run_history.step_runs('CopyStep', 'h264', 'none')))
+        self.assertEqual([], self.run_history.step_runs('FailingStep', 'h264', 'none'))
+
+    def test_record_one_run_by_step_of_step_graph(self):
+        step_graph = StepGraph()
+
+        with patch('movie_pipeline.services.movie_file_processor.step_history.movie_run_features', return_value=FEATURES):
+            step_runs_recorder = StepRunsRecorder.from_movie(
+                Path('movie.ts'),
+                MovieSegments(raw_segments='00:00:00.00-00:01:00.00'),
+                self.history_config,
+                Settings.model_construct()  # type: ignore
+            )
+
+        assert step_runs_recorder is not None
+        step_graph.add_chain(CopyStep(
+            context=None,
+            description='copy',
+            cost=1,
+            next_step=EncodeStep(context=None, description='encode', cost=1, next_step=None)
+        ), on_done=step_runs_recorder.record)
+        step_graph.add_chain(FailingStep(context=None, description='failing', cost=1, next_step=None), on_done=step_runs_recorder.record)
+
+        step_progress_results = []
+
+        with self.assertRaises(ValueError):
+            for step_progress_result in step_graph.process_all():
+                step_progress_results.append(step_progress_result)
+
+        copy_runs = self.run_history.step_runs('CopyStep', 'h264', 'none')
+        encode_runs = self.run_history.step_runs('EncodeStep', 'h264', 'none')
+        last_encode_result = [result for result in step_progress_results if result.current_step_name == 'EncodeStep'][-1]
+
+        # the concurrent steps are recorded once completed, a failed step is not recorded
+        self.assertEqual(1, len(copy_runs))
+        self.assertEqual(1, len(encode_runs))
+        self.assertEqual(last_encode_result.current_step_elapsed_time, encode_runs[0].elapsed_time)
+        self.assertEqual([], self.run_history.step_runs('FailingStep', 'h264', 'none'))
+
+    def tearDown(self) -> None:
+        self.temp_dir.cleanup()
@@ -0,0 +1,37 @@
+import unittest
+from pathlib import Path
+
+import ffmpeg
+
+from movie_pipeline.models.movie_segments import MovieSegments
+
+
+class MovieSegmentsTest(unittest.TestCase):
+    def setUp(self) -> None:
+        self.movie_segments = MovieSegments('00:00:03.370-00:00:05.960,00:00:10.520-00:00:18.200,')
+
+    def test_seeked_segments_open_one_input_per_segment(self):
+        command = ffmpeg.concat(
+            *self.movie_segments.to_ffmpeg_seeked_segments(Path('movie.ts'), [{'index': 1}], hwaccel='cuda'),
+            v=1, a=1
+        ).output('movie.mp4')
+
+        args = command.get_args()
+
+        self.assertEqual(
+            ['-hwaccel', 'cuda', '-ss', '3.37', '-t', '2.59', '-i', 'movie.ts', '-hwaccel', 'cuda', '-ss', '10.52', '-t', '7.68', '-i', 'movie.ts'],
+            args[:args.index('-filter_complex')]
+        )
+        self.assertIn('[1:v]trim=duration=7.68', args[args.index('-filter_complex') + 1])
+
+    def test_select_filtergraph_has_one_chain_per_stream(self):
+        filtergraph, output_labels = self.movie_segments.to_ffmpeg_select_filtergraph([{'index': 1}, {'index': 3}])
+
+        expression = 'gte(t,3.37)*lt(t,5.96)+gte(t,10.52)*lt(t,18.2)'
+        self.assertEqual(
+            f"[0:v]select='{expression}',setpts=N/FRAME_RATE/TB[v];\n"
+            f"[0:1]aselect='{expression}',asetpts=N/SR/TB[a0];\n"
+            f"[0:3]aselect='{expression}',asetpts=N/SR/TB[a1]",
+            filtergraph
+        )
+        self.assertEqual(['v', 'a0', 'a1'], output_labels)